@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+import os
+import sys
+
+import django
+
+if sys.argv[1:2] == ['ordering']:
+    # the ordering benchmarks use no database, so need none of the benchmark suite's setup
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+    django.setup()
+
+    from tests.benchmarks.ordering import main  # noqa: E402
+
+    main(sys.argv[2:])
+else:
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.benchmarks.settings'
+    django.setup()
+
+    from tests.benchmarks.suite import main  # noqa: E402
+
+    main(sys.argv[1:])
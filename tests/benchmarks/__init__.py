@@ -0,0 +1,5 @@
+"""
+Benchmarks measuring how the time, memory and database queries taken by export, import planning
+and import grow with the size of the site being transferred. Run with runbenchmarks.py; see
+docs/benchmarks.md.
+"""
@@ -0,0 +1,141 @@
+"""
+Generation of synthetic sites for benchmarking, built from the models of the tests app
+"""
+
+import json
+import random
+import uuid
+
+from django.core.files.base import ContentFile
+
+from tests.models import (
+    Advert, Author, Avatar, Category, PageWithRichText, PageWithStreamField, SectionedPage,
+    SectionedPageSection, SimplePage, SponsoredPage
+)
+
+# Number of children given to each page of the generated tree, until the page count is reached
+CHILDREN_PER_PAGE = 20
+
+# Relative frequencies of the page types in the generated site
+PAGE_TYPE_WEIGHTS = [
+    (SimplePage, 2),
+    (SponsoredPage, 3),
+    (SectionedPage, 1.5),
+    (PageWithRichText, 1.5),
+    (PageWithStreamField, 2),
+]
+
+CATEGORY_COUNT = 20
+
+# a 1x1 transparent GIF, used as the file for each avatar
+AVATAR_IMAGE = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+
+class SiteGenerator:
+    """
+    Generates a tree of page_count pages under the page parent, of a mix of page types, along with
+    the snippets they refer to. Pages refer to one another through rich text links and StreamField
+    page choosers (always to pages generated earlier, so that references form no cycles), and to
+    adverts, authors and categories. Avatars (which have files) are generated alongside the pages,
+    one for every 100 pages.
+
+    Generation is deterministic for a given seed.
+    """
+    def __init__(self, page_count, seed=0):
+        self.page_count = page_count
+        self.random = random.Random(seed)
+        self.page_ids = []
+
+    def generate(self, parent):
+        """
+        Generate the site under parent, and return the root page of the generated tree
+        """
+        self.adverts = [
+            Advert.objects.create(slogan=f"Advert {i}", run_until='2030-01-01T00:00:00Z')
+            for i in range(max(1, self.page_count // 10))
+        ]
+        self.authors = [
+            Author.objects.create(name=f"Author {i}", bio=f"The biography of author {i}")
+            for i in range(max(1, self.page_count // 50))
+        ]
+        self.categories = [
+            Category.objects.create(name=f"Category {i}", colour='red')
+            for i in range(CATEGORY_COUNT)
+        ]
+        for i in range(max(1, self.page_count // 100)):
+            Avatar.objects.create(image=ContentFile(AVATAR_IMAGE, name=f'avatar-{i}.gif'))
+
+        page_types, weights = zip(*PAGE_TYPE_WEIGHTS)
+        pages = []
+        for i in range(self.page_count):
+            page_type = SectionedPage if i == 0 else self.random.choices(page_types, weights)[0]
+            page = self.build_page(page_type, i)
+
+            parent_page = parent if i == 0 else pages[(i - 1) // CHILDREN_PER_PAGE]
+            parent_page.add_child(instance=page)
+
+            pages.append(page)
+            self.page_ids.append(page.pk)
+
+        return pages[0]
+
+    def build_page(self, page_type, index):
+        page = page_type(title=f"Page {index}", slug=f"page-{index}")
+
+        if page_type is SimplePage:
+            page.intro = f"The introduction to page {index}"
+        elif page_type is SponsoredPage:
+            page.intro = f"The introduction to page {index}"
+            page.advert = self.random.choice(self.adverts)
+            page.author = self.random.choice(self.authors)
+            page.categories = self.random.sample(self.categories, self.random.randint(0, 3))
+        elif page_type is SectionedPage:
+            page.intro = f"The introduction to page {index}"
+            page.sections = [
+                SectionedPageSection(title=f"Section {i}", body=f"The body of section {i}")
+                for i in range(self.random.randint(2, 4))
+            ]
+        elif page_type is PageWithRichText:
+            page.body = f'<p>See {self.page_link()} and {self.page_link()}.</p>'
+        elif page_type is PageWithStreamField:
+            page.body = json.dumps(self.build_stream())
+
+        return page
+
+    def random_page_id(self):
+        return self.random.choice(self.page_ids) if self.page_ids else None
+
+    def page_link(self):
+        page_id = self.random_page_id()
+        if page_id is None:
+            return 'nothing'
+        return f'<a id="{page_id}" linktype="page">page {page_id}</a>'
+
+    def build_stream(self):
+        blocks = [
+            {'type': 'rich_text', 'value': f'<p>A link to {self.page_link()}.</p>'},
+            {'type': 'integer', 'value': self.random.randint(0, 100)},
+        ]
+        if self.page_ids:
+            blocks += [
+                {'type': 'page', 'value': self.random_page_id()},
+                {'type': 'link_block', 'value': {'page': self.random_page_id(), 'text': "A captioned link"}},
+                {'type': 'list_of_pages', 'value': [self.random_page_id() for i in range(3)]},
+                {'type': 'stream', 'value': [
+                    {'type': 'page', 'value': self.random_page_id(), 'id': str(uuid.UUID(int=self.random.getrandbits(128)))},
+                ]},
+            ]
+
+        for block in blocks:
+            block['id'] = str(uuid.UUID(int=self.random.getrandbits(128)))
+        return blocks
+
+
+def generate_site(parent, page_count, seed=0):
+    """
+    Generate a synthetic site of page_count pages under parent, and return its root page
+    """
+    return SiteGenerator(page_count, seed=seed).generate(parent)
@@ -0,0 +1,165 @@
+"""
+Benchmarks of the dependency checking and ordering of import operations, showing how
+ImportPlanner._check_satisfiable and ImportPlanner._add_to_operation_order scale with the number of
+operations. The operations are synthetic, with no database access, so that only the work on the
+dependency graph is measured.
+
+Graph shapes:
+  chain: each operation has a hard dependency on the one before it (as in a deep page tree), and
+      every tenth operation a soft dependency on the one after it, closing a cycle that must be
+      broken at the soft dependency
+  fan_out: a single root operation that every other operation has a hard dependency on (as with
+      the children of one page), each also with a soft dependency on its next sibling
+  blocked_chain: a chain whose first operation depends on an object that cannot be created, so
+      that every operation in it is found to be unsatisfiable
+"""
+
+import argparse
+import gc
+import json
+import time
+from contextlib import contextmanager
+
+from wagtail.core.models import Page
+
+from wagtail_transfer.operations import ImportPlanner, Operation
+
+DEFAULT_OPERATION_COUNTS = [10000, 20000, 40000, 80000]
+
+SHAPES = ['chain', 'fan_out', 'blocked_chain']
+
+
+class BenchmarkOperation(Operation):
+    """
+    An operation with a fixed set of dependencies, which is never run
+    """
+    def __init__(self, source_id):
+        self.source_id = source_id
+        self._dependencies = set()
+
+    @property
+    def dependencies(self):
+        return self._dependencies
+
+
+def build_graph(shape, count):
+    """
+    Return an ImportPlanner whose operations, resolutions and failed_creations form a dependency
+    graph of the given shape with count operations
+    """
+    operations = [BenchmarkOperation(i) for i in range(count)]
+    resolutions = {(Page, i): operation for i, operation in enumerate(operations)}
+    failed_creations = set()
+
+    if shape in ('chain', 'blocked_chain'):
+        for i in range(1, count):
+            operations[i].dependencies.add((Page, i - 1, True))
+        for i in range(0, count - 1, 10):
+            operations[i].dependencies.add((Page, i + 1, False))
+        if shape == 'blocked_chain':
+            operations[0].dependencies.add((Page, -1, True))
+            failed_creations.add((Page, -1))
+    elif shape == 'fan_out':
+        for i in range(1, count):
+            operations[i].dependencies.add((Page, 0, True))
+            if i + 1 < count:
+                operations[i].dependencies.add((Page, i + 1, False))
+    else:
+        raise ValueError("Unknown graph shape: %r" % shape)
+
+    importer = ImportPlanner(model='tests.advert')
+    # order the operations from the far end of each graph, so that ordering has to follow every
+    # dependency back to the start
+    importer.operations = list(reversed(operations))
+    importer.resolutions = resolutions
+    importer.failed_creations = failed_creations
+    return importer
+
+
+@contextmanager
+def gc_disabled():
+    # as in timeit, so that collections triggered by the graph's allocations do not distort the
+    # timings
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def run_benchmark(shape, count):
+    """
+    Check and order a graph of the given shape and size, and return the time taken by each step
+    """
+    importer = build_graph(shape, count)
+
+    with gc_disabled():
+        start = time.perf_counter()
+        unsatisfiable_operations = importer._check_satisfiable()
+        check_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        operation_order = []
+        ordered_operations = set()
+        for operation in importer.operations:
+            if operation not in unsatisfiable_operations:
+                importer._add_to_operation_order(operation, operation_order, ordered_operations)
+        order_time = time.perf_counter() - start
+
+    if len(operation_order) + len(unsatisfiable_operations) != count:
+        raise AssertionError(
+            f"Expected {count} operations to be ordered or unsatisfiable, found "
+            f"{len(operation_order)} ordered and {len(unsatisfiable_operations)} unsatisfiable"
+        )
+
+    return {
+        'shape': shape,
+        'operations': count,
+        'unsatisfiable': len(unsatisfiable_operations),
+        'check_time': check_time,
+        'order_time': order_time,
+    }
+
+
+def format_results(results):
+    """
+    Format the results for one graph shape, with the time per 1000 operations, which stays roughly
+    constant as the number of operations grows if the work scales linearly
+    """
+    lines = [
+        f"{results[0]['shape']}",
+        f"  {'operations':>10}{'check (s)':>12}{'per 1000':>10}{'order (s)':>12}{'per 1000':>10}",
+    ]
+    for result in results:
+        per_thousand = 1000 / result['operations']
+        lines.append(
+            f"  {result['operations']:>10}{result['check_time']:>12.3f}{result['check_time'] * per_thousand:>10.4f}"
+            f"{result['order_time']:>12.3f}{result['order_time'] * per_thousand:>10.4f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the checking and ordering of import operations")
+    parser.add_argument(
+        '--operations', type=int, nargs='+', default=DEFAULT_OPERATION_COUNTS,
+        help="Numbers of operations in the graphs (default: %s)" % ' '.join(map(str, DEFAULT_OPERATION_COUNTS))
+    )
+    parser.add_argument(
+        '--shapes', nargs='+', choices=SHAPES, default=SHAPES,
+        help="Graph shapes to benchmark (default: all)"
+    )
+    parser.add_argument('--output', help="File to write the full results to, as JSON")
+    args = parser.parse_args(argv)
+
+    all_results = []
+    for shape in args.shapes:
+        results = [run_benchmark(shape, count) for count in args.operations]
+        print(format_results(results), flush=True)
+        all_results.extend(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
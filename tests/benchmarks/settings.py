@@ -0,0 +1,34 @@
+"""
+Settings for running the benchmarks: the tests app settings, with separate databases for the
+source and destination sites (routed by tests.benchmarks.transport.SiteRouter), held in a
+working directory along with the media files
+"""
+
+import os
+import tempfile
+
+from tests.settings import *  # noqa
+
+BENCHMARK_DIR = os.environ.get('WAGTAILTRANSFER_BENCHMARK_DIR') or tempfile.mkdtemp(prefix='wagtail-transfer-benchmark-')
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCHMARK_DIR, 'destination.sqlite3'),
+    },
+    'source': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCHMARK_DIR, 'source.sqlite3'),
+    },
+}
+
+DATABASE_ROUTERS = ['tests.benchmarks.transport.SiteRouter']
+
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, 'media')
+
+ALLOWED_HOSTS = ['source.benchmark']
+
+WAGTAILTRANSFER_SOURCES = dict(WAGTAILTRANSFER_SOURCES, benchmark={  # noqa
+    'BASE_URL': 'http://source.benchmark/wagtail-transfer/',
+    'SECRET_KEY': WAGTAILTRANSFER_SECRET_KEY,  # noqa
+})
@@ -0,0 +1,184 @@
+"""
+End-to-end benchmarks of a page tree transfer: for each site size, a synthetic site is generated
+in the source database, exported, planned and imported into the (otherwise empty) destination
+database, with the wall time, peak memory allocated and database queries of each stage recorded.
+
+Stages:
+  export: the request to the pages API for the root of the generated site
+  plan: adding the export to the import plan, and fetching the objects it refers to
+  import: running the import
+  import_files: a model import of the site's avatars, downloading their files
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from wagtail.core.models import Page
+
+from wagtail_transfer.auth import digest_for_source
+from wagtail_transfer.client import get_client_for_source
+from wagtail_transfer.jobs import add_response_to_importer, fetch_missing_object_data, get_export_request_kwargs
+from wagtail_transfer.operations import ImportPlanner
+
+from .generator import generate_site
+from .transport import LocalTransportAdapter, site_database
+
+SOURCE_DB = 'source'
+SOURCE_NAME = 'benchmark'
+
+DEFAULT_PAGE_COUNTS = [1000]
+
+
+class Benchmark:
+    """
+    A run of the benchmark stages for one site size, recording the results of each stage in
+    self.results
+    """
+    def __init__(self, page_count, seed=0, measure_memory=True):
+        self.page_count = page_count
+        self.seed = seed
+        self.measure_memory = measure_memory
+        self.results = {'pages': page_count, 'stages': {}}
+
+    @contextmanager
+    def stage(self, name):
+        destination_queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal destination_queries
+            destination_queries += 1
+            return execute(sql, params, many, context)
+
+        source_queries_before = self.transport.query_count
+        if self.measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(count_query):
+            yield
+
+        result = {
+            'time': time.perf_counter() - start,
+            'queries': destination_queries,
+            'source_queries': self.transport.query_count - source_queries_before,
+        }
+        if self.measure_memory:
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results['stages'][name] = result
+
+    def reset_databases(self):
+        for alias in connections:
+            connections[alias].close()
+            name = settings.DATABASES[alias]['NAME']
+            if os.path.exists(name):
+                os.remove(name)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+        # the source starts as a copy of the freshly migrated destination database (as some data
+        # migrations only populate the default database)
+        with redirect_stdout(io.StringIO()):
+            call_command('migrate', database=DEFAULT_DB_ALIAS, verbosity=0)
+        connections[DEFAULT_DB_ALIAS].close()
+        shutil.copyfile(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'], settings.DATABASES[SOURCE_DB]['NAME'])
+
+    def run(self):
+        self.reset_databases()
+
+        with site_database(SOURCE_DB):
+            start = time.perf_counter()
+            root_page = generate_site(Page.objects.get(depth=2), self.page_count, seed=self.seed)
+            self.results['generate_time'] = time.perf_counter() - start
+
+        self.transport = LocalTransportAdapter(SOURCE_DB)
+        client = get_client_for_source(SOURCE_NAME)
+        client.session.mount(client.base_url, self.transport)
+        client.session.mount(settings.MEDIA_URL, self.transport)
+
+        with self.stage('export'):
+            digest = digest_for_source(SOURCE_NAME, str(root_page.pk))
+            response = client.get(
+                f"{client.base_url}api/pages/{root_page.pk}/", **get_export_request_kwargs(SOURCE_NAME, digest)
+            )
+
+        importer = ImportPlanner.for_page(source=root_page.pk, destination=Page.objects.get(depth=2).pk)
+        with self.stage('plan'):
+            add_response_to_importer(importer, response)
+            fetch_missing_object_data(SOURCE_NAME, importer)
+
+        self.results['objects'] = len(importer.object_data_by_source)
+        self.results['operations'] = len(importer.operations)
+
+        with self.stage('import'):
+            importer.run(http_client=client)
+        self.results['report'] = importer.report.as_dict()
+
+        with self.stage('import_files'):
+            digest = digest_for_source(SOURCE_NAME, 'tests.avatar')
+            response = client.get(
+                f"{client.base_url}api/models/tests.avatar/", **get_export_request_kwargs(SOURCE_NAME, digest)
+            )
+            importer = ImportPlanner.for_model('tests.avatar')
+            add_response_to_importer(importer, response)
+            fetch_missing_object_data(SOURCE_NAME, importer)
+            importer.run(http_client=client)
+
+        imported_page_count = Page.objects.filter(depth__gt=2).count()
+        if imported_page_count != self.page_count:
+            raise AssertionError(f"Expected {self.page_count} pages to be imported, found {imported_page_count}")
+
+        return self.results
+
+
+def format_results(results):
+    lines = [
+        f"{results['pages']} pages ({results['objects']} objects, {results['operations']} operations; "
+        f"generated in {results['generate_time']:.1f}s)",
+        f"  {'stage':<14}{'time (s)':>10}{'peak memory (MB)':>18}{'queries':>10}{'source queries':>16}",
+    ]
+    for name, stage in results['stages'].items():
+        peak_memory = f"{stage['peak_memory'] / 2 ** 20:.1f}" if 'peak_memory' in stage else '-'
+        lines.append(
+            f"  {name:<14}{stage['time']:>10.2f}{peak_memory:>18}{stage['queries']:>10}{stage['source_queries']:>16}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark export, planning and import of synthetic sites")
+    parser.add_argument(
+        '--pages', type=int, nargs='+', default=DEFAULT_PAGE_COUNTS,
+        help="Numbers of pages in the generated sites (default: %s)" % ' '.join(map(str, DEFAULT_PAGE_COUNTS))
+    )
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the site generator (default 0)")
+    parser.add_argument(
+        '--no-memory', action='store_true',
+        help="Do not measure peak memory, which slows the benchmarks down considerably"
+    )
+    parser.add_argument('--output', help="File to write the full results to, as JSON")
+    args = parser.parse_args(argv)
+
+    all_results = []
+    try:
+        for page_count in args.pages:
+            results = Benchmark(page_count, seed=args.seed, measure_memory=not args.no_memory).run()
+            print(format_results(results), flush=True)
+            all_results.append(results)
+    finally:
+        for alias in connections:
+            connections[alias].close()
+        if not os.environ.get('WAGTAILTRANSFER_BENCHMARK_DIR'):
+            shutil.rmtree(settings.BENCHMARK_DIR, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
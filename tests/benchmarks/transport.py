@@ -0,0 +1,116 @@
+"""
+An in-process stand-in for the HTTP transport between a destination site and its source site,
+so that a full export and import can be run within one process.
+
+The two sites are held in separate databases. Database access is routed (by SiteRouter) to the
+database of the site currently being acted on, as selected by the site_database context manager;
+LocalTransportAdapter serves each request made to the source site by calling its views directly
+within site_database(source_alias).
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+_current_site_db = contextvars.ContextVar('current_site_db', default=DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def site_database(alias):
+    """
+    Route all database access within this context (in the current thread) to the given database
+    """
+    token = _current_site_db.set(alias)
+    try:
+        yield
+    finally:
+        _current_site_db.reset(token)
+
+
+class SiteRouter:
+    """
+    Database router sending all reads and writes to the database selected by site_database
+    """
+    def db_for_read(self, model, **hints):
+        return _current_site_db.get()
+
+    def db_for_write(self, model, **hints):
+        return _current_site_db.get()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return True
+
+
+class LocalTransportAdapter(BaseAdapter):
+    """
+    A requests transport adapter that serves requests to the source site's wagtail-transfer API
+    by calling its views in-process, against the database source_alias. Requests for media files
+    are served from default_storage. Counts the queries made to the source database, across all
+    threads, in query_count.
+
+    Responses are never compressed, so Accept-Encoding is not passed on to the views.
+    """
+    def __init__(self, source_alias):
+        super().__init__()
+        self.source_alias = source_alias
+        self.query_count = 0
+        self._lock = threading.Lock()
+
+    def _count_query(self, execute, sql, params, many, context):
+        with self._lock:
+            self.query_count += 1
+        return execute(sql, params, many, context)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if request.url.startswith(settings.MEDIA_URL):
+            with default_storage.open(request.url[len(settings.MEDIA_URL):]) as f:
+                return self.build_response(request, 200, {}, f.read())
+
+        url = urlsplit(request.url)
+        path = url.path + ('?' + url.query if url.query else '')
+        extra = {'HTTP_HOST': url.netloc}
+        if 'Content-Encoding' in request.headers:
+            extra['HTTP_CONTENT_ENCODING'] = request.headers['Content-Encoding']
+
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        with site_database(self.source_alias), \
+                connections[self.source_alias].execute_wrapper(self._count_query):
+            response = Client().generic(
+                request.method, path, data=body,
+                content_type=request.headers.get('Content-Type', 'application/octet-stream'), **extra
+            )
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+
+        return self.build_response(request, response.status_code, dict(response.items()), content)
+
+    def build_response(self, request, status_code, headers, content):
+        response = Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:51
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0017_correctmodeltypes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelWithUUIDPrimaryKey',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+            ],
+        ),
+    ]
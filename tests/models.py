@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from modelcluster.fields import ParentalKey, ParentalManyToManyField
 from taggit.managers import TaggableManager
@@ -80,3 +82,8 @@ class RedirectPage(Page):
 
 class PageWithRelatedPages(Page):
     related_pages = models.ManyToManyField(Page, related_name='+')
+
+
+class ModelWithUUIDPrimaryKey(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255)
@@ -144,6 +144,9 @@ WAGTAILTRANSFER_LOOKUP_FIELDS = {
     'tests.category': ['name']
 }
 
+# Run imports within the request, so that the import view tests can check their results
+WAGTAILTRANSFER_IMPORT_JOB_EXECUTOR = 'wagtail_transfer.jobs.ImmediateExecutor'
+
 # The default name for the Page -> Comment relation from Wagtail 2.15 onward. Setting this ensures that
 # 2.13.x (from 2.13.5 onward) and 2.14.x (from 2.14.2 onward) adopt the 2.15 behaviour, allowing us to
 # use the same test fixtures across all versions.
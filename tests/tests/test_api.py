@@ -1,24 +1,37 @@
+import gzip
 import json
 import os.path
 import shutil
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 from datetime import datetime, timezone
 
+import requests
 from django.conf import settings
 from django.core.files import File
 from django.core.files.images import ImageFile
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models.fields.files import FieldFile
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from wagtail.core.models import Page, Collection
 from wagtail.images.models import Image
 from wagtail.documents.models import Document
 
+from wagtail_transfer import files
 from wagtail_transfer.auth import digest_for_source
-from wagtail_transfer.models import IDMapping
+from wagtail_transfer.client import get_client_for_source
+from wagtail_transfer.files import get_file_hash, get_file_size
+from wagtail_transfer.instrumentation import report_finished
+from wagtail_transfer.models import FileMetadata, IDMapping
+from wagtail_transfer.serializers import PageSerializer, serialize_many
 from tests.models import (
-    Advert, Avatar, Category, LongAdvert, ModelWithManyToMany, PageWithRichText, SectionedPage, SponsoredPage,
-    PageWithStreamField, PageWithParentalManyToMany
+    Advert, Avatar, Category, LongAdvert, ModelWithManyToMany, PageWithRichText, SectionedPage, SimplePage,
+    SponsoredPage, PageWithStreamField, PageWithParentalManyToMany
 )
 
 
@@ -173,6 +186,97 @@ class TestPagesApi(TestCase):
         self.assertIn(['wagtailcore.page', 2, "22222222-2222-2222-2222-222222222222"], mappings)
         self.assertIn(['tests.advert', 1, "adadadad-1111-1111-1111-111111111111"], mappings)
 
+    def test_pages_api_ndjson(self):
+        digest = digest_for_source('local', '2')
+        response = self.client.get('/wagtail-transfer/api/pages/2/?digest=%s&format=ndjson' % digest)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        records = [
+            json.loads(line) for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+        # ids_for_import is sent first, and mappings last
+        self.assertIn(['wagtailcore.page', 2], records[0]['ids_for_import'])
+        self.assertIn(['wagtailcore.page', 2, "22222222-2222-2222-2222-222222222222"], records[-1]['mappings'])
+        self.assertIn(['tests.advert', 1, "adadadad-1111-1111-1111-111111111111"], records[-1]['mappings'])
+
+        objects = [record['object'] for record in records[1:-1]]
+        homepage = [obj for obj in objects if obj['model'] == 'tests.simplepage' and obj['pk'] == 2][0]
+        self.assertEqual(homepage['parent_id'], 1)
+        self.assertEqual(homepage['fields']['intro'], "This is the homepage")
+
+    @mock.patch('wagtail_transfer.views.SERIALIZE_CHUNK_SIZE', 1)
+    def test_pages_api_ndjson_streams_objects_as_serialized(self):
+        parent_page = Page.objects.get(url_path='/home/existing-child-page/')
+        for i in range(3):
+            parent_page.add_child(instance=SimplePage(title='Cake %d' % i, intro="Here is a cake."))
+
+        digest = digest_for_source('local', '2')
+        response = self.client.get('/wagtail-transfer/api/pages/2/?digest=%s&format=ndjson' % digest)
+        lines = iter(response.streaming_content)
+
+        with mock.patch(
+            'wagtail_transfer.serializers.PageSerializer.serialize', autospec=True,
+            side_effect=PageSerializer.serialize
+        ) as serialize:
+            self.assertIn('ids_for_import', json.loads(next(lines)))
+            self.assertIn('object', json.loads(next(lines)))
+            self.assertEqual(serialize.call_count, 1)
+
+            remaining_lines = list(lines)
+
+        self.assertGreater(serialize.call_count, 4)
+        self.assertIn('mappings', json.loads(remaining_lines[-1]))
+
+    def test_pages_api_compact(self):
+        digest = digest_for_source('local', '2')
+        response = self.client.get('/wagtail-transfer/api/pages/2/?digest=%s&compact=true' % digest)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'\n', response.content)
+        self.assertNotIn(b'": ', response.content)
+
+        data = json.loads(response.content)
+        self.assertIn(['wagtailcore.page', 2], data['ids_for_import'])
+        self.assertIn(['wagtailcore.page', 2, "22222222-2222-2222-2222-222222222222"], data['mappings'])
+
+    def test_pages_api_gzip(self):
+        digest = digest_for_source('local', '2')
+        response = self.client.get(
+            '/wagtail-transfer/api/pages/2/?digest=%s' % digest, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        data = json.loads(gzip.decompress(response.content))
+        self.assertIn(['wagtailcore.page', 2], data['ids_for_import'])
+        self.assertIn(['wagtailcore.page', 2, "22222222-2222-2222-2222-222222222222"], data['mappings'])
+
+    def test_pages_api_instrumentation(self):
+        reports = []
+
+        def receiver(sender, report, **kwargs):
+            reports.append(report)
+
+        report_finished.connect(receiver)
+        try:
+            response = self.get(2)
+        finally:
+            report_finished.disconnect(receiver)
+
+        self.assertEqual(len(reports), 1)
+        report = reports[0].as_dict()
+        self.assertEqual(report['name'], 'export')
+        self.assertIn('tests.simplepage', report['phases']['serialize']['models'])
+        self.assertGreater(report['phases']['serialize']['queries'], 0)
+        self.assertEqual(report['phases']['encode']['count'], 1)
+
+        self.assertIn('serialize;desc=', response['Server-Timing'])
+        self.assertIn(
+            ('wagtail_transfer.export.serialize.count', 1, {'model': 'tests.simplepage'}),
+            list(reports[0].get_metrics())
+        )
+
     def test_export_root(self):
         response = self.get(1)
         self.assertEqual(response.status_code, 200)
@@ -233,6 +337,40 @@ class TestPagesApi(TestCase):
         ]
         self.assertEqual(len(matching_uids), 1)
 
+    def test_serialize_many_fetches_related_objects_in_bulk(self):
+        parent_page = Page.objects.get(url_path='/home/existing-child-page/')
+        for i in range(5):
+            page = SectionedPage(title='Cake %d' % i, intro="Here is how to make a cake.")
+            page.sections.create(title="Create the universe", body="First, create the universe")
+            page.sections.create(title="Find some eggs", body="Next, find some eggs")
+            parent_page.add_child(instance=page)
+
+        def count_queries(pages):
+            with CaptureQueriesContext(connection) as captured:
+                objects, references, further_objects = serialize_many(pages)
+            self.assertEqual(len(objects), len(pages))
+            self.assertEqual(len(further_objects), len(pages) * 2)
+            return len(captured)
+
+        pages = list(SectionedPage.objects.all())
+        self.assertEqual(count_queries(pages[:2]), count_queries(pages))
+
+    def test_content_hash(self):
+        def get_homepage_data():
+            data = json.loads(self.get(2).content)
+            return [
+                obj for obj in data['objects'] if obj['model'] == 'tests.simplepage' and obj['pk'] == 2
+            ][0]
+
+        content_hash = get_homepage_data()['content_hash']
+        self.assertEqual(len(content_hash), 40)
+
+        # the hash is stable across exports, and changes when the object does
+        self.assertEqual(get_homepage_data()['content_hash'], content_hash)
+
+        SimplePage.objects.filter(pk=2).update(intro="This is the updated homepage")
+        self.assertNotEqual(get_homepage_data()['content_hash'], content_hash)
+
     def test_rich_text_with_page_link(self):
         page = PageWithRichText(title="You won't believe how rich this cake was!", body='<p>But I have a <a id="1" linktype="page">link</a></p>')
 
@@ -472,6 +610,51 @@ class TestObjectsApi(TestCase):
 
         self.assertEqual(data['mappings'], [['tests.advert', 1, 'adadadad-1111-1111-1111-111111111111']])
 
+    def test_objects_api_with_compressed_request(self):
+        request_json = json.dumps({'tests.advert': [1]})
+        # the digest is of the uncompressed request body
+        digest = digest_for_source('local', request_json)
+        response = self.client.post(
+            '/wagtail-transfer/api/objects/?digest=%s' % digest, gzip.compress(request_json.encode('utf-8')),
+            content_type='application/json', HTTP_CONTENT_ENCODING='gzip', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['objects'][0]['fields']['slogan'], "put a tiger in your tank")
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_objects_api_with_oversized_compressed_request(self):
+        request_json = json.dumps({'tests.advert': [1] * 100})
+        digest = digest_for_source('local', request_json)
+        response = self.client.post(
+            '/wagtail-transfer/api/objects/?digest=%s' % digest, gzip.compress(request_json.encode('utf-8')),
+            content_type='application/json', HTTP_CONTENT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_objects_api_with_truncated_compressed_request(self):
+        request_json = json.dumps({'tests.advert': [1]})
+        digest = digest_for_source('local', request_json)
+        compressed = gzip.compress(request_json.encode('utf-8'))
+
+        # without its trailer, the body still decompresses to the full payload
+        for body in [compressed[:-8], compressed + b'junk']:
+            response = self.client.post(
+                '/wagtail-transfer/api/objects/?digest=%s' % digest, body,
+                content_type='application/json', HTTP_CONTENT_ENCODING='gzip'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_objects_api_with_unsupported_encoding(self):
+        request_json = json.dumps({'tests.advert': [1]})
+        digest = digest_for_source('local', request_json)
+        response = self.client.post(
+            '/wagtail-transfer/api/objects/?digest=%s' % digest, request_json,
+            content_type='application/json', HTTP_CONTENT_ENCODING='br'
+        )
+        self.assertEqual(response.status_code, 415)
+
     def test_objects_api_with_tree_model(self):
         root_collection = Collection.objects.get()
         collection = root_collection.add_child(instance=Collection(name="Test collection"))
@@ -644,8 +827,100 @@ class TestObjectsApi(TestCase):
         self.assertEqual(obj['fields']['image']['size'], 1160)
         self.assertEqual(obj['fields']['image']['hash'], '45c5db99aea04378498883b008ee07528f5ae416')
 
+    def test_file_hash_is_cached(self):
+        with open(os.path.join(FIXTURES_DIR, 'wagtail.jpg'), 'rb') as f:
+            avatar = Avatar.objects.create(
+                image=ImageFile(f, name='wagtail.jpg')
+            )
+        field = Avatar._meta.get_field('image')
+
+        with mock.patch('wagtail_transfer.files._calculate_file_hash', wraps=files._calculate_file_hash) as calculate:
+            self.assertEqual(files._get_file_hash(field, avatar.image), '45c5db99aea04378498883b008ee07528f5ae416')
+            self.assertEqual(files._get_file_hash(field, avatar.image), '45c5db99aea04378498883b008ee07528f5ae416')
+        self.assertEqual(calculate.call_count, 1)
+
+    def test_file_hash_cache_is_thread_safe(self):
+        # many threads hashing more files than fit in the cache, so that entries are evicted while
+        # other threads are looking them up
+        storage = mock.Mock()
+        storage.get_modified_time.return_value = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        file_objects = []
+        for i in range(10):
+            file = mock.Mock(storage=storage)
+            file.name = f'file{i}.txt'
+            file_objects.append(file)
+
+        class YieldingOrderedDict(OrderedDict):
+            def move_to_end(self, *args, **kwargs):
+                # give other threads the chance to evict the entry in the meantime
+                time.sleep(0.0001)
+                super().move_to_end(*args, **kwargs)
+
+        def get_hashes():
+            return [files._get_file_hash(None, file) for _ in range(50) for file in file_objects]
+
+        with mock.patch('wagtail_transfer.files._file_hash_cache', YieldingOrderedDict()) as cache, \
+                mock.patch('wagtail_transfer.files.FILE_HASH_CACHE_SIZE', 3), \
+                mock.patch('wagtail_transfer.files._calculate_file_hash', side_effect=lambda field, file: file.name):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = [executor.submit(get_hashes) for _ in range(8)]
+            for result in results:
+                self.assertEqual(result.result(), [file.name for _ in range(50) for file in file_objects])
+            self.assertLessEqual(len(cache), 3)
+
+    def test_file_metadata_is_recorded_on_save(self):
+        with open(os.path.join(FIXTURES_DIR, 'wagtail.jpg'), 'rb') as f:
+            avatar = Avatar.objects.create(
+                image=ImageFile(f, name='wagtail.jpg')
+            )
 
-@mock.patch('requests.get')
+        metadata = FileMetadata.objects.get(name=avatar.image.name)
+        self.assertEqual(metadata.size, 1160)
+        self.assertEqual(metadata.hash, '45c5db99aea04378498883b008ee07528f5ae416')
+
+        # exporting the file uses the recorded metadata, rather than reading the file from storage
+        avatar = Avatar.objects.get(pk=avatar.pk)
+        field = Avatar._meta.get_field('image')
+        with mock.patch('wagtail_transfer.files._get_file_hash') as get_hash:
+            with mock.patch.object(FieldFile, 'size', new_callable=mock.PropertyMock) as size:
+                self.assertEqual(get_file_hash(field, avatar), '45c5db99aea04378498883b008ee07528f5ae416')
+                self.assertEqual(get_file_size(field, avatar), 1160)
+        get_hash.assert_not_called()
+        size.assert_not_called()
+
+    def test_file_metadata_is_recorded_for_existing_files(self):
+        with open(os.path.join(FIXTURES_DIR, 'wagtail.jpg'), 'rb') as f:
+            avatar = Avatar.objects.create(
+                image=ImageFile(f, name='wagtail.jpg')
+            )
+        # simulate a file saved before its metadata was tracked
+        FileMetadata.objects.all().delete()
+
+        avatar = Avatar.objects.get(pk=avatar.pk)
+        field = Avatar._meta.get_field('image')
+        self.assertEqual(get_file_hash(field, avatar), '45c5db99aea04378498883b008ee07528f5ae416')
+        self.assertEqual(get_file_size(field, avatar), 1160)
+
+        metadata = FileMetadata.objects.get(name=avatar.image.name)
+        self.assertEqual(metadata.size, 1160)
+        self.assertEqual(metadata.hash, '45c5db99aea04378498883b008ee07528f5ae416')
+
+    def test_file_hash_without_local_path(self):
+        # storage backends without a local path are read in chunks instead of memory-mapped
+        with open(os.path.join(FIXTURES_DIR, 'wagtail.jpg'), 'rb') as f:
+            avatar = Avatar.objects.create(
+                image=ImageFile(f, name='wagtail.jpg')
+            )
+        avatar = Avatar.objects.get(pk=avatar.pk)
+        field = Avatar._meta.get_field('image')
+
+        with mock.patch.object(FieldFile, 'path', new_callable=mock.PropertyMock, side_effect=NotImplementedError):
+            self.assertEqual(
+                files._calculate_file_hash(field, avatar.image), '45c5db99aea04378498883b008ee07528f5ae416'
+            )
+
+
+@mock.patch('requests.Session.get')
 class TestChooserProxyApi(TestCase):
     fixtures = ['test.json']
 
@@ -665,6 +940,22 @@ class TestChooserProxyApi(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, b'test content')
 
+    def test_with_connection_error(self, get):
+        get.side_effect = requests.ConnectionError("Connection refused")
+
+        response = self.client.get('/admin/wagtail-transfer/api/chooser-proxy/staging/foo?bar=baz', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, 502)
+
+    def test_requests_are_not_retried(self, get):
+        get.return_value.status_code = 200
+        get.return_value.content = b'test content'
+
+        with mock.patch('wagtail_transfer.views.get_client_for_source', wraps=get_client_for_source) as get_client:
+            self.client.get('/admin/wagtail-transfer/api/chooser-proxy/staging/foo?bar=baz', HTTP_ACCEPT='application/json')
+
+        get_client.assert_called_once_with('staging', retries=0)
+
     def test_with_unknown_source(self, get):
         get.return_value.status_code = 200
         get.return_value.content = b'test content'
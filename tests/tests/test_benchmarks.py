@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+from wagtail.core.models import Page
+
+from tests.benchmarks.generator import generate_site
+from tests.benchmarks.ordering import SHAPES, run_benchmark
+from tests.benchmarks.transport import LocalTransportAdapter
+from tests.models import PageWithRichText, PageWithStreamField, SectionedPage, SponsoredPage
+from wagtail_transfer.auth import digest_for_source
+from wagtail_transfer.client import SourceClient
+
+
+class TestBenchmarkSuite(TestCase):
+    fixtures = ['test.json']
+
+    def test_generate_site(self):
+        root = generate_site(Page.objects.get(id=2), 60)
+
+        self.assertEqual(root.get_descendants(inclusive=True).count(), 60)
+        self.assertEqual(root.get_children().count(), 20)
+        self.assertTrue(SectionedPage.objects.filter(sections__isnull=False).exists())
+        self.assertTrue(SponsoredPage.objects.filter(advert__isnull=False, author__isnull=False).exists())
+
+        # pages refer to one another through rich text and StreamField
+        self.assertTrue(PageWithRichText.objects.filter(body__contains='linktype="page"').exists())
+        self.assertTrue(PageWithStreamField.objects.filter(body__contains='"list_of_pages"').exists())
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_local_transport(self):
+        transport = LocalTransportAdapter('default')
+        client = SourceClient(settings.WAGTAILTRANSFER_SOURCES['local'])
+        client.session.mount(client.base_url, transport)
+
+        digest = digest_for_source('local', '2')
+        response = client.get(f'{client.base_url}api/pages/2/', params={'digest': digest})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(['wagtailcore.page', 2], response.json()['ids_for_import'])
+        self.assertGreater(transport.query_count, 0)
+
+    def test_ordering_benchmark(self):
+        for shape in SHAPES:
+            with self.subTest(shape=shape):
+                result = run_benchmark(shape, 200)
+                self.assertEqual(result['operations'], 200)
+                # only the blocked chain has operations that cannot be satisfied, and all of them are
+                self.assertEqual(result['unsatisfiable'], 200 if shape == 'blocked_chain' else 0)
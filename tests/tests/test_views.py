@@ -1,16 +1,22 @@
+import gzip
 import json
-from datetime import date, datetime, timezone
+import time
+from datetime import date, datetime, timedelta, timezone
 from unittest import mock
 
+import requests
 from django.contrib.auth.models import AnonymousUser, Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
 from django.shortcuts import redirect
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
-from tests.models import SponsoredPage
+from tests.models import SimplePage, SponsoredPage
 from wagtail_transfer.auth import digest_for_source
-from wagtail_transfer.models import IDMapping
+from wagtail_transfer.client import SourceClient, get_client_for_source
+from wagtail_transfer.jobs import JobHeartbeat, ThreadExecutor
+from wagtail_transfer.models import IDMapping, ImportJob
 
 
 class TestChooseView(TestCase):
@@ -25,8 +31,8 @@ class TestChooseView(TestCase):
         self.assertContains(response, 'data-wagtail-component="content-import-form"')
 
 
-@mock.patch('requests.post')
-@mock.patch('requests.get')
+@mock.patch('requests.Session.post')
+@mock.patch('requests.Session.get')
 class TestImportView(TestCase):
     fixtures = ['test.json']
 
@@ -280,6 +286,202 @@ class TestImportView(TestCase):
         self.assertEqual(created_page.intro, "you can make cakes with them")
         self.assertEqual(created_page.advert, None)
 
+    @override_settings(WAGTAILTRANSFER_SOURCES={
+        'staging': {
+            'BASE_URL': 'https://www.example.com/wagtail-transfer/',
+            'SECRET_KEY': 'i-am-the-staging-example-secret-key',
+            'EXPORT_FORMAT': 'ndjson',
+        },
+    })
+    def test_run_with_ndjson_format(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.headers = {'Content-Type': 'application/x-ndjson'}
+        get.return_value.iter_lines.return_value = [
+            b'{"ids_for_import": [["wagtailcore.page", 12]]}',
+            b'{"object": {"model": "tests.simplepage", "pk": 12, "parent_id": 1, "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the streamed homepage", "wagtail_admin_comments": []}}}',
+            b'{"mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]]}',
+        ]
+
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'source': 'staging',
+            'source_page_id': '12',
+            'dest_page_id': '',
+        })
+        self.assertRedirects(response, '/admin/pages/')
+
+        get.assert_called_once()
+        args, kwargs = get.call_args
+        self.assertEqual(kwargs['params']['format'], 'ndjson')
+        self.assertTrue(kwargs['stream'])
+        post.assert_not_called()
+
+        updated_page = SimplePage.objects.get(url_path='/home/')
+        self.assertEqual(updated_page.intro, "This is the streamed homepage")
+
+    @mock.patch('wagtail_transfer.jobs.OBJECT_REQUEST_BATCH_SIZE', 1)
+    def test_run_with_batched_object_requests(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [
+                ["wagtailcore.page", 15],
+                ["wagtailcore.page", 16]
+            ],
+            "mappings": [
+                ["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"],
+                ["wagtailcore.page", 15, "00017017-5555-5555-5555-555555555555"],
+                ["wagtailcore.page", 16, "00e99e99-6666-6666-6666-666666666666"],
+                ["tests.advert", 11, "adadadad-1111-1111-1111-111111111111"],
+                ["tests.advert", 8, "adadadad-8888-8888-8888-888888888888"]
+            ],
+            "objects": [
+                {
+                    "model": "tests.sponsoredpage",
+                    "pk": 15,
+                    "parent_id": 12,
+                    "fields": {
+                        "title": "Oil is still great",
+                        "show_in_menus": false,
+                        "live": true,
+                        "slug": "oil-is-still-great",
+                        "advert": 11,
+                        "intro": "yay fossil fuels and climate change",
+                        "categories": [],
+                        "wagtail_admin_comments": []
+                    }
+                },
+                {
+                    "model": "tests.sponsoredpage",
+                    "pk": 16,
+                    "parent_id": 12,
+                    "fields": {
+                        "title": "Eggs are great too",
+                        "show_in_menus": false,
+                        "live": true,
+                        "slug": "eggs-are-great-too",
+                        "advert": 8,
+                        "intro": "you can make cakes with them",
+                        "categories": [],
+                        "wagtail_admin_comments": []
+                    }
+                }
+            ]
+        }"""
+
+        adverts = {
+            11: {"slogan": "put a leopard in your tank", "run_until": "2020-12-23T01:23:45Z", "run_from": None},
+            8: {"slogan": "go to work on an egg", "run_until": "2020-01-23T01:23:45Z", "run_from": None},
+        }
+
+        def get_objects(url, data, **kwargs):
+            # respond with only the objects requested
+            ids = json.loads(data)['tests.advert']
+            response = mock.MagicMock()
+            response.status_code = 200
+            response.content = json.dumps({
+                'ids_for_import': [],
+                'mappings': [],
+                'objects': [
+                    {'model': 'tests.advert', 'pk': advert_id, 'fields': adverts[advert_id]}
+                    for advert_id in ids
+                ],
+            })
+            return response
+
+        post.side_effect = get_objects
+
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'source': 'staging',
+            'source_page_id': '15',
+            'dest_page_id': '2',
+        })
+        self.assertRedirects(response, '/admin/pages/2/')
+
+        # the two missing adverts are requested separately
+        self.assertEqual(post.call_count, 2)
+        requested_ids = [json.loads(kwargs['data']) for args, kwargs in post.call_args_list]
+        self.assertCountEqual(requested_ids, [{'tests.advert': [11]}, {'tests.advert': [8]}])
+
+        self.assertEqual(
+            SponsoredPage.objects.get(url_path='/home/oil-is-still-great/').advert.slogan,
+            "put a leopard in your tank"
+        )
+        self.assertEqual(
+            SponsoredPage.objects.get(url_path='/home/eggs-are-great-too/').advert.slogan,
+            "go to work on an egg"
+        )
+
+    @override_settings(WAGTAILTRANSFER_SOURCES={
+        'staging': {
+            'BASE_URL': 'https://www.example.com/wagtail-transfer/',
+            'SECRET_KEY': 'i-am-the-staging-example-secret-key',
+            'COMPRESS_REQUESTS': True,
+        },
+    })
+    def test_run_with_compressed_requests(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 15]],
+            "mappings": [
+                ["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"],
+                ["wagtailcore.page", 15, "00017017-5555-5555-5555-555555555555"],
+                ["tests.advert", 11, "adadadad-1111-1111-1111-111111111111"]
+            ],
+            "objects": [
+                {
+                    "model": "tests.sponsoredpage",
+                    "pk": 15,
+                    "parent_id": 12,
+                    "fields": {
+                        "title": "Oil is still great",
+                        "show_in_menus": false,
+                        "live": true,
+                        "slug": "oil-is-still-great",
+                        "advert": 11,
+                        "intro": "yay fossil fuels and climate change",
+                        "categories": [],
+                        "wagtail_admin_comments": []
+                    }
+                }
+            ]
+        }"""
+
+        post.return_value.status_code = 200
+        post.return_value.content = b"""{
+            "ids_for_import": [],
+            "mappings": [["tests.advert", 11, "adadadad-1111-1111-1111-111111111111"]],
+            "objects": [
+                {
+                    "model": "tests.advert",
+                    "pk": 11,
+                    "fields": {"slogan": "put a leopard in your tank", "run_until": "2020-12-23T01:23:45Z", "run_from": null}
+                }
+            ]
+        }"""
+
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'source': 'staging',
+            'source_page_id': '15',
+            'dest_page_id': '2',
+        })
+        self.assertRedirects(response, '/admin/pages/2/')
+
+        # exports are requested as compact JSON
+        args, kwargs = get.call_args
+        self.assertEqual(kwargs['params']['compact'], 'true')
+
+        # the object request is sent gzipped, with the digest of the uncompressed body
+        post.assert_called_once()
+        args, kwargs = post.call_args
+        self.assertEqual(kwargs['headers'], {'Content-Encoding': 'gzip'})
+        request_body = gzip.decompress(kwargs['data']).decode('utf-8')
+        self.assertEqual(json.loads(request_body), {'tests.advert': [11]})
+        self.assertEqual(kwargs['params']['digest'], digest_for_source('staging', request_body))
+
+        self.assertEqual(
+            SponsoredPage.objects.get(url_path='/home/oil-is-still-great/').advert.slogan,
+            "put a leopard in your tank"
+        )
+
     def test_list_snippet_models(self, get, post):
         # Test the model chooser view.
         get_params = "models=True"
@@ -295,6 +497,344 @@ class TestImportView(TestCase):
         self.assertEqual(snippet['name'], 'Category')
 
 
+class TestSourceClient(TestCase):
+    def test_client_is_shared(self):
+        client = get_client_for_source('staging')
+        self.assertIs(get_client_for_source('staging'), client)
+        self.assertIsNot(get_client_for_source('local'), client)
+
+    def test_client_without_retries(self):
+        client = get_client_for_source('staging')
+        no_retry_client = get_client_for_source('staging', retries=0)
+        self.assertIsNot(no_retry_client, client)
+        self.assertIs(get_client_for_source('staging', retries=0), no_retry_client)
+        self.assertEqual(no_retry_client.session.get_adapter('https://www.example.com/').max_retries.total, 0)
+        self.assertEqual(client.session.get_adapter('https://www.example.com/').max_retries.total, 3)
+
+    def test_client_is_replaced_when_configuration_changes(self):
+        client = get_client_for_source('staging')
+
+        with override_settings(WAGTAILTRANSFER_SOURCES={
+            'staging': {
+                'BASE_URL': 'https://www.example.com/wagtail-transfer/',
+                'SECRET_KEY': 'i-am-the-staging-example-secret-key',
+                'TIMEOUT': 30,
+                'RETRIES': 5,
+            },
+        }):
+            configured_client = get_client_for_source('staging')
+            self.assertIsNot(configured_client, client)
+            self.assertEqual(configured_client.timeout, 30)
+            self.assertEqual(configured_client.session.get_adapter('https://www.example.com/').max_retries.total, 5)
+
+    @mock.patch('requests.Session.get')
+    def test_timeout(self, get):
+        client = SourceClient({'BASE_URL': 'https://www.example.com/wagtail-transfer/', 'TIMEOUT': 30})
+
+        client.get('https://www.example.com/wagtail-transfer/api/pages/1/')
+        get.assert_called_once_with('https://www.example.com/wagtail-transfer/api/pages/1/', timeout=30)
+
+        # an explicit timeout takes precedence
+        client.get('https://www.example.com/wagtail-transfer/api/pages/1/', timeout=5)
+        get.assert_called_with('https://www.example.com/wagtail-transfer/api/pages/1/', timeout=5)
+
+    @mock.patch('requests.Session.get')
+    def test_default_timeout(self, get):
+        client = SourceClient({'BASE_URL': 'https://www.example.com/wagtail-transfer/'})
+        client.get('https://www.example.com/wagtail-transfer/api/pages/1/')
+        get.assert_called_once_with('https://www.example.com/wagtail-transfer/api/pages/1/', timeout=60)
+
+        # a timeout of None waits indefinitely
+        client = SourceClient({'BASE_URL': 'https://www.example.com/wagtail-transfer/', 'TIMEOUT': None})
+        client.get('https://www.example.com/wagtail-transfer/api/pages/1/')
+        get.assert_called_with('https://www.example.com/wagtail-transfer/api/pages/1/', timeout=None)
+
+
+@mock.patch('requests.Session.post')
+@mock.patch('requests.Session.get')
+@mock.patch('wagtail_transfer.jobs.IMPORT_JOB_EXECUTOR', 'wagtail_transfer.jobs.QueueExecutor')
+class TestImportJobs(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.client.login(username='admin', password='password')
+
+    def test_queued_job(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 12]],
+            "mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]],
+            "objects": [
+                {
+                    "model": "tests.simplepage",
+                    "pk": 12,
+                    "parent_id": 1,
+                    "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the imported homepage", "wagtail_admin_comments": []}
+                }
+            ]
+        }"""
+
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'source': 'staging',
+            'source_page_id': '12',
+            'dest_page_id': '',
+        })
+
+        # the import is left to run in the background, and the user is shown its progress
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, '/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertEqual(job.status, ImportJob.STATUS_QUEUED)
+        self.assertEqual(job.source_page_id, 12)
+        get.assert_not_called()
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Queued')
+
+        call_command('run_import_jobs', stdout=mock.MagicMock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(job.objects_fetched, 1)
+        self.assertEqual(job.operations_total, 1)
+        self.assertEqual(job.operations_completed, 1)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/status/' % job.pk)
+        progress = json.loads(response.content)
+        self.assertEqual(progress['status'], 'done')
+        self.assertTrue(progress['finished'])
+
+        # once the job is done, the job page redirects to the imported content
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertRedirects(response, '/admin/pages/')
+
+        # a finished job is not run again
+        with self.assertRaises(CommandError):
+            call_command('run_import_jobs', str(job.pk))
+
+    def test_failed_job(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"not JSON"
+
+        job = ImportJob.objects.create(source='staging', import_type=ImportJob.TYPE_MODEL, model='tests.advert')
+        with self.assertLogs('wagtail_transfer.jobs', level='ERROR'):
+            call_command('run_import_jobs', str(job.pk), stderr=mock.MagicMock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertTrue(job.error.startswith('JSONDecodeError'))
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The import failed')
+
+    def test_job_fails_when_source_times_out(self, get, post):
+        get.side_effect = requests.Timeout("Read timed out")
+
+        job = ImportJob.objects.create(source='staging', import_type=ImportJob.TYPE_MODEL, model='tests.advert')
+        with self.assertLogs('wagtail_transfer.jobs', level='ERROR'):
+            call_command('run_import_jobs', str(job.pk), stderr=mock.MagicMock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertEqual(job.error, "Timeout: Read timed out")
+
+    @mock.patch('wagtail_transfer.jobs.COMMIT_BATCH_SIZE', 1)
+    def test_resume_failed_job(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"not JSON"
+
+        job = ImportJob.objects.create(source='staging', import_type=ImportJob.TYPE_PAGE, source_page_id=12)
+        with self.assertLogs('wagtail_transfer.jobs', level='ERROR'):
+            call_command('run_import_jobs', str(job.pk), stderr=mock.MagicMock())
+
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 12]],
+            "mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]],
+            "objects": [
+                {
+                    "model": "tests.simplepage",
+                    "pk": 12,
+                    "parent_id": 1,
+                    "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the imported homepage", "wagtail_admin_comments": []}
+                }
+            ]
+        }"""
+
+        response = self.client.post('/admin/wagtail-transfer/import/jobs/%d/resume/' % job.pk)
+        self.assertRedirects(response, '/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_QUEUED)
+        self.assertEqual(job.error, '')
+
+        call_command('run_import_jobs', stdout=mock.MagicMock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(job.checkpoint, '')
+        self.assertEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+        # a job that has not failed cannot be resumed
+        response = self.client.post('/admin/wagtail-transfer/import/jobs/%d/resume/' % job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+
+    def test_resume_interrupted_job(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 12]],
+            "mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]],
+            "objects": [
+                {
+                    "model": "tests.simplepage",
+                    "pk": 12,
+                    "parent_id": 1,
+                    "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the imported homepage", "wagtail_admin_comments": []}
+                }
+            ]
+        }"""
+
+        # a job left applying by a process that exited, and one that is still running
+        started_at = datetime.now(timezone.utc) - timedelta(minutes=10)
+        job = ImportJob.objects.create(
+            source='staging', import_type=ImportJob.TYPE_PAGE, source_page_id=12,
+            status=ImportJob.STATUS_APPLYING, started_at=started_at, heartbeat_at=started_at
+        )
+        running_job = ImportJob.objects.create(
+            source='staging', import_type=ImportJob.TYPE_PAGE, source_page_id=12,
+            status=ImportJob.STATUS_APPLYING, started_at=started_at, heartbeat_at=datetime.now(timezone.utc)
+        )
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/status/' % job.pk)
+        progress = json.loads(response.content)
+        self.assertEqual(progress['status'], 'failed')
+        self.assertTrue(progress['finished'])
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertContains(response, 'The import was interrupted')
+
+        call_command('run_import_jobs', str(job.pk), '--resume', stdout=mock.MagicMock())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+        # a job that is still recording heartbeats is left alone
+        with self.assertRaises(CommandError):
+            call_command('run_import_jobs', str(running_job.pk), '--resume', stdout=mock.MagicMock())
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, ImportJob.STATUS_APPLYING)
+
+    @mock.patch('wagtail_transfer.jobs.HEARTBEAT_INTERVAL', 0.01)
+    def test_job_heartbeat(self, get, post):
+        job = ImportJob.objects.create(
+            source='staging', import_type=ImportJob.TYPE_PAGE, source_page_id=12, status=ImportJob.STATUS_APPLYING
+        )
+        with mock.patch('wagtail_transfer.jobs.ImportJob.objects.filter') as filter:
+            with JobHeartbeat(job):
+                time.sleep(0.1)
+        filter.assert_called_with(pk=job.pk, status__in=ImportJob.RUNNING_STATUSES)
+        self.assertTrue(filter.return_value.update.called)
+
+    def test_dry_run_job(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 12]],
+            "mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]],
+            "objects": [
+                {
+                    "model": "tests.simplepage",
+                    "pk": 12,
+                    "parent_id": 1,
+                    "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the imported homepage", "wagtail_admin_comments": []}
+                }
+            ]
+        }"""
+
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'source': 'staging',
+            'source_page_id': '12',
+            'dest_page_id': '',
+            'dry_run': '1',
+        })
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, '/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        call_command('run_import_jobs', stdout=mock.MagicMock())
+
+        # the dry run is done, but nothing is imported; the user is shown the estimate rather
+        # than being redirected to the imported content
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertTrue(job.dry_run)
+        self.assertNotEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+        estimate = job.get_estimate()
+        self.assertEqual(estimate['creates'], {})
+        self.assertEqual(estimate['updates'], {'tests.simplepage': 1})
+        self.assertGreater(estimate['query_count'], 0)
+
+        response = self.client.get('/admin/wagtail-transfer/import/jobs/%d/' % job.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Dry run')
+        self.assertContains(response, 'tests.simplepage')
+
+        # the estimate page offers to run the import for real
+        self.assertContains(response, '<input type="hidden" name="source_page_id" value="12">', html=True)
+        response = self.client.post('/admin/wagtail-transfer/import/', {
+            'type': 'page',
+            'source': 'staging',
+            'source_page_id': '12',
+            'dest_page_id': '',
+        })
+        call_command('run_import_jobs', stdout=mock.MagicMock())
+        self.assertEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+    def test_dry_run_false(self, get, post):
+        get.return_value.status_code = 200
+        get.return_value.content = b"""{
+            "ids_for_import": [["wagtailcore.page", 12]],
+            "mappings": [["wagtailcore.page", 12, "22222222-2222-2222-2222-222222222222"]],
+            "objects": [
+                {
+                    "model": "tests.simplepage",
+                    "pk": 12,
+                    "parent_id": 1,
+                    "fields": {"title": "Home", "show_in_menus": false, "live": true, "slug": "home", "intro": "This is the imported homepage", "wagtail_admin_comments": []}
+                }
+            ]
+        }"""
+
+        # a false value runs the import for real, rather than being taken as a dry run
+        for value in ['false', '0', 'off', '']:
+            with self.subTest(dry_run=value):
+                self.client.post('/admin/wagtail-transfer/import/', {
+                    'source': 'staging',
+                    'source_page_id': '12',
+                    'dest_page_id': '',
+                    'dry_run': value,
+                })
+                job = ImportJob.objects.latest('pk')
+                self.assertFalse(job.dry_run)
+
+        call_command('run_import_jobs', stdout=mock.MagicMock())
+        self.assertEqual(SimplePage.objects.get(url_path='/home/').intro, "This is the imported homepage")
+
+    def test_thread_executor(self, get, post):
+        job = ImportJob.objects.create(source='staging', import_type=ImportJob.TYPE_MODEL, model='tests.advert')
+
+        with mock.patch('wagtail_transfer.jobs.transaction.on_commit') as on_commit, \
+                mock.patch('wagtail_transfer.jobs.threading.Thread') as thread:
+            ThreadExecutor().submit(job)
+
+            # the thread is only started once the job has been committed to the database
+            thread.assert_not_called()
+            on_commit.call_args[0][0]()
+
+        thread.return_value.start.assert_called_once()
+        self.assertEqual(thread.call_args[1]['args'], (job.pk,))
+
+
 class ImportPermissionsTests(TestCase):
     fixtures = ["test.json"]
 
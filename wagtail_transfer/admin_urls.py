@@ -11,6 +11,9 @@ app_name = 'wagtail_transfer_admin'
 urlpatterns = [
     re_path(r'^choose/$', views.choose_page, name='choose_page'),
     re_path(r'^import/$', views.do_import, name='import'),
+    re_path(r'^import/jobs/(\d+)/$', views.import_job, name='import_job'),
+    re_path(r'^import/jobs/(\d+)/status/$', views.import_job_status, name='import_job_status'),
+    re_path(r'^import/jobs/(\d+)/resume/$', views.resume_import_job, name='resume_import_job'),
     re_path(r'^api/chooser-local/', (chooser_api.urls[0], 'page_chooser_api', 'page_chooser_api')),
     re_path(r'^api/chooser-proxy/(\w+)/([\w\-/]*)$', views.chooser_api_proxy, name='chooser_api_proxy'),
     re_path(r'^api/check_uid/$', views.check_page_existence_for_uid, name='check_uid'),
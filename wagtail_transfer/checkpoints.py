@@ -0,0 +1,53 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import get_base_model_for_path
+
+
+class ImportCheckpoint:
+    """
+    Records the progress of an import that is committed in batches (see ImportPlanner.run), so
+    that if the import fails, it can be resumed from the last committed batch rather than
+    starting over.
+
+    completed: a mapping of (model_class, source_id) to destination ID, for each object created
+        or updated by an operation in a committed batch. model_class is the base model, as in
+        ImportContext.destination_ids_by_source, which is restored from this when resuming; the
+        save operations for these objects are skipped.
+    pending_revision_page_ids: IDs of pages saved by committed batches that have not yet had a
+        revision saved. Revisions are saved once all batches are committed, so that they capture
+        child objects saved in later batches.
+
+    save is called at the end of each batch, within the batch's transaction; subclasses may
+    override it to persist the checkpoint, so that the checkpoint is committed together with the
+    batch.
+    """
+    def __init__(self, completed=None, pending_revision_page_ids=None):
+        self.completed = completed or {}
+        self.pending_revision_page_ids = pending_revision_page_ids or set()
+
+    def save(self):
+        pass
+
+    def to_json(self):
+        return json.dumps({
+            'completed': [
+                [model._meta.label_lower, source_id, destination_id]
+                for (model, source_id), destination_id in self.completed.items()
+            ],
+            'pending_revision_page_ids': sorted(self.pending_revision_page_ids),
+        }, cls=DjangoJSONEncoder)
+
+    def load_json(self, json_data):
+        """
+        Restore the progress recorded in json_data, as returned by to_json
+        """
+        data = json.loads(json_data)
+        self.completed = {}
+        for model_path, source_id, destination_id in data['completed']:
+            model = get_base_model_for_path(model_path)
+            # restore destination IDs that are not native to JSON, such as UUIDs, to their
+            # original type
+            self.completed[(model, source_id)] = model._meta.pk.to_python(destination_id)
+        self.pending_revision_page_ids = set(data['pending_revision_page_ids'])
@@ -0,0 +1,104 @@
+"""
+HTTP client for making requests to the source sites defined in WAGTAILTRANSFER_SOURCES
+"""
+
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .files import FILE_TRANSFER_WORKERS
+
+# Timeout in seconds for connecting to the source site, and for each wait for data from it, so
+# that an import is not held up indefinitely by a source that has stopped responding
+DEFAULT_TIMEOUT = 60
+
+# Number of times to retry a request that fails to connect, or receives a 502, 503 or 504 response
+DEFAULT_RETRIES = 3
+
+# Factor controlling the delay between retries: the nth retry waits backoff_factor * 2 ** (n - 1)
+# seconds
+DEFAULT_RETRY_BACKOFF = 0.5
+
+# Maximum number of objects of a model to request from the source site in a single request for
+# missing object data
+OBJECT_REQUEST_BATCH_SIZE = getattr(settings, 'WAGTAILTRANSFER_OBJECT_REQUEST_BATCH_SIZE', 500)
+
+# Maximum number of requests for missing object data to make at once
+OBJECT_REQUEST_WORKERS = getattr(settings, 'WAGTAILTRANSFER_OBJECT_REQUEST_WORKERS', 4)
+
+
+class SourceClient:
+    """
+    Makes requests to a source site through a single requests.Session, so that connections are
+    kept alive and reused from one request to the next. Configured from the source's entry in
+    WAGTAILTRANSFER_SOURCES, which may specify:
+
+    'TIMEOUT': timeout in seconds for requests that do not specify one (default 60), or None for
+        no timeout
+    'RETRIES': number of times to retry failed requests (default 3)
+    'RETRY_BACKOFF': backoff factor for the delay between retries (default 0.5)
+    'COMPRESS_REQUESTS': whether to gzip-compress request bodies sent to the source (default False)
+    """
+    def __init__(self, source_config):
+        self.base_url = source_config['BASE_URL']
+        self.timeout = source_config.get('TIMEOUT', DEFAULT_TIMEOUT)
+        self.compress_requests = source_config.get('COMPRESS_REQUESTS', False)
+
+        retry = Retry(
+            total=source_config.get('RETRIES', DEFAULT_RETRIES),
+            backoff_factor=source_config.get('RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF),
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        )
+        # allow for one connection per file transfer or object request thread, plus one for the
+        # import itself
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_maxsize=max(FILE_TRANSFER_WORKERS, OBJECT_REQUEST_WORKERS) + 1
+        )
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client_for_source(source_name, retries=None):
+    """
+    Return the SourceClient for the given source name. Clients are shared across requests (and
+    threads), so that connections to each source are reused by successive imports.
+
+    If retries is given, it overrides the source's 'RETRIES' setting, with a separate client kept
+    for each number of retries - for example, retries=0 for interactive requests that should fail
+    within their timeout rather than wait for retries and their backoff.
+    """
+    source_config = settings.WAGTAILTRANSFER_SOURCES[source_name]
+    if retries is not None:
+        source_config = dict(source_config, RETRIES=retries)
+
+    with _clients_lock:
+        config, client = _clients.get((source_name, retries), (None, None))
+        if client is None or config != source_config:
+            # create a new client if the source's configuration has changed
+            if client is not None:
+                client.close()
+            client = SourceClient(source_config)
+            _clients[(source_name, retries)] = (dict(source_config), client)
+
+    return client
@@ -0,0 +1,126 @@
+from collections import Counter
+
+from django.db import models
+from wagtail.core.models import Page
+
+from .models import get_base_model
+
+# Approximate numbers of queries made by the steps of an import, used to predict the number of
+# queries an import will make. The true numbers vary with the models' fields and save methods.
+
+# validation, slug and URL path checks, and logging performed by Page.save
+PAGE_SAVE_QUERIES = 12
+# recording the UID of a created object
+ID_MAPPING_QUERIES = 2
+# setting the values of a many-to-many relation
+M2M_QUERIES = 2
+# collecting related objects for deletion, and deleting
+DELETE_QUERIES = 2
+# recording content hashes, per model
+CONTENT_HASH_QUERIES = 2
+# saving revisions, in addition to one query per page
+REVISION_QUERIES = 2
+
+
+def get_save_queries(model, object_data):
+    """
+    Return the approximate number of queries needed to save an instance of model from the given
+    object data
+    """
+    # one query per table in the model's inheritance chain
+    queries = len(model._meta.get_parent_list()) + 1
+
+    if issubclass(model, Page):
+        # pages are validated before saving, which checks each foreign key
+        foreign_keys = [
+            field for field in model._meta.concrete_fields
+            if isinstance(field, models.ForeignKey) and object_data['fields'].get(field.name) is not None
+        ]
+        queries += PAGE_SAVE_QUERIES + len(foreign_keys)
+
+    m2m_fields = [
+        field for field in model._meta.get_fields()
+        if isinstance(field, models.ManyToManyField) and field.name in object_data['fields']
+    ]
+    if m2m_fields:
+        # the instance is saved again after its many-to-many relations are set
+        queries = queries * 2 + len(m2m_fields) * M2M_QUERIES
+
+    return queries
+
+
+class ImportEstimate:
+    """
+    The effects and cost of an import, as found by ImportPlanner.run with dry_run=True:
+
+    creates, updates, deletes: Counters of the number of objects that will be created, updated
+        and deleted, keyed by model label
+    unsatisfiable: the number of operations that cannot be performed because their dependencies
+        cannot be satisfied
+    file_count, file_bytes: the number and total size of the files that will be downloaded
+    query_count: the approximate number of database queries needed to perform the operations
+    """
+    def __init__(self):
+        self.creates = Counter()
+        self.updates = Counter()
+        self.deletes = Counter()
+        self.unsatisfiable = 0
+        self.file_count = 0
+        self.file_bytes = 0
+        self.query_count = 0
+
+    @classmethod
+    def for_operations(cls, operations, unsatisfiable_operations, files):
+        """
+        Return an estimate for running the given (ordered) operations, given the operations that
+        were found to be unsatisfiable and the set of File objects to be downloaded
+        """
+        # imported here to avoid a circular import
+        from .operations import CreateModel, DeleteModel, UpdateModel
+
+        estimate = cls()
+        estimate.unsatisfiable = len(unsatisfiable_operations)
+
+        saved_models = set()
+        saved_page_count = 0
+        for operation in operations:
+            if isinstance(operation, DeleteModel):
+                estimate.deletes[type(operation.instance)._meta.label_lower] += 1
+                estimate.query_count += DELETE_QUERIES
+                continue
+
+            model_label = operation.model._meta.label_lower
+            estimate.query_count += get_save_queries(operation.model, operation.object_data)
+            if isinstance(operation, CreateModel):
+                estimate.creates[model_label] += 1
+                estimate.query_count += ID_MAPPING_QUERIES
+            elif isinstance(operation, UpdateModel):
+                estimate.updates[model_label] += 1
+
+            saved_models.add(get_base_model(operation.model))
+            if issubclass(operation.model, Page):
+                saved_page_count += 1
+
+        estimate.query_count += len(saved_models) * CONTENT_HASH_QUERIES
+        if saved_page_count:
+            estimate.query_count += saved_page_count + REVISION_QUERIES
+
+        files_by_source_url = {file.source_url: file for file in files}
+        estimate.file_count = len(files_by_source_url)
+        estimate.file_bytes = sum(file.size for file in files_by_source_url.values())
+        if files_by_source_url:
+            # ImportedFile records are created in bulk
+            estimate.query_count += 1
+
+        return estimate
+
+    def as_dict(self):
+        return {
+            'creates': dict(self.creates),
+            'updates': dict(self.updates),
+            'deletes': dict(self.deletes),
+            'unsatisfiable': self.unsatisfiable,
+            'file_count': self.file_count,
+            'file_bytes': self.file_bytes,
+            'query_count': self.query_count,
+        }
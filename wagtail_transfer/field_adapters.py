@@ -3,6 +3,7 @@ import pathlib
 from functools import lru_cache
 from urllib.parse import urlparse
 
+import requests
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -55,6 +56,15 @@ class FieldAdapter:
         """
         return set()
 
+    def parse_value(self, value):
+        """
+        Return the form of a serialized value that is passed to get_dependencies,
+        get_object_deletions, get_file_transfers and populate_field on import. Each value is parsed
+        once per import operation, so that values that need decoding (such as StreamField JSON)
+        are only decoded once.
+        """
+        return value
+
     def get_dependencies(self, value):
         """
         A set of (base_model_class, id, is_hard) tuples for objects that must exist at the
@@ -76,6 +86,14 @@ class FieldAdapter:
         """
         return set()
 
+    def get_file_transfers(self, instance, value):
+        """
+        Return a set of File objects for files that need to be downloaded in order to populate
+        this field on the given model instance with the given value. These are downloaded in bulk
+        before populate_field is called.
+        """
+        return set()
+
     def update_object_references(self, value, destination_ids_by_source):
         """
         Return a modified version of value with object references replaced by their corresponding
@@ -110,6 +128,13 @@ class FieldAdapter:
         """
         return set()
 
+    def get_prefetch_lookups(self):
+        """
+        Return a list of lookups to pass to prefetch_related_objects when serializing a batch of
+        instances, so that related objects accessed by this adapter are fetched in bulk rather
+        than with one query per instance
+        """
+        return []
 
 
 class ForeignKeyAdapter(FieldAdapter):
@@ -192,6 +217,9 @@ class GenericForeignKeyAdapter(FieldAdapter):
     def get_managed_fields(self):
         return [self.field.fk_field, self.field.ct_field]
 
+    def get_prefetch_lookups(self):
+        return [self.name]
+
 
 class ManyToOneRelAdapter(FieldAdapter):
     def __init__(self, field):
@@ -204,17 +232,30 @@ class ManyToOneRelAdapter(FieldAdapter):
     def _get_related_objects(self, instance):
         return getattr(instance, self.name).all()
 
+    def _get_related_pks(self, instance):
+        related_objects = self._get_related_objects(instance)
+        if getattr(related_objects, '_prefetch_done', False):
+            # related objects have already been fetched through prefetch_related_objects, so
+            # use those rather than making a new query
+            return [obj.pk for obj in related_objects]
+        return list(related_objects.values_list('pk', flat=True))
+
     def serialize(self, instance):
         if self.is_parental or self.is_followed:
-            return list(self._get_related_objects(instance).values_list('pk', flat=True))
+            return self._get_related_pks(instance)
 
     def get_object_references(self, instance):
         refs = set()
         if self.is_parental or self.is_followed:
-            for pk in self._get_related_objects(instance).values_list('pk', flat=True):
+            for pk in self._get_related_pks(instance):
                 refs.add((self.related_base_model, pk))
         return refs
 
+    def get_prefetch_lookups(self):
+        if self.is_parental or self.is_followed:
+            return [self.name]
+        return []
+
     def get_object_deletions(self, instance, value, context):
         if (self.is_parental or (get_base_model(self.field.model)._meta.label_lower, self.name) in DELETED_REVERSE_RELATIONS):
             value = value or []
@@ -222,11 +263,7 @@ class ManyToOneRelAdapter(FieldAdapter):
             # delete any related objects on the existing object if they can't be mapped back
             # to one of the uids in the new set
             locator = get_locator_for_model(self.related_base_model)
-            matched_destination_ids = set()
-            for uid in uids:
-                child = locator.find(uid)
-                if child is not None:
-                    matched_destination_ids.add(child.pk)
+            matched_destination_ids = {child.pk for child in locator.find_many(uids).values()}
 
             return {child for child in self._get_related_objects(instance) if child.pk not in matched_destination_ids}
         return set()
@@ -264,14 +301,45 @@ class StreamFieldAdapter(FieldAdapter):
         stream = self.stream_block.get_prep_value(self.field.value_from_object(instance))
         return get_object_references(self.stream_block, stream)
 
+    def parse_value(self, value):
+        # StreamField values are serialized as JSON strings. Values that are not a JSON list of
+        # blocks (None, or raw text left in a field migrated to StreamField) are left as they are,
+        # for the field's to_python to handle
+        if isinstance(value, str):
+            try:
+                stream = json.loads(value)
+            except ValueError:
+                return value
+            if isinstance(stream, list):
+                return stream
+        return value
+
     def get_dependencies(self, value):
+        stream = self.parse_value(value)
+        if not isinstance(stream, list):
+            return set()
         return {
             (model, id, False)  # references in streamfield are soft dependencies
-            for model, id in get_object_references(self.stream_block, json.loads(value))
+            for model, id in get_object_references(self.stream_block, stream)
         }
 
     def update_object_references(self, value, destination_ids_by_source):
-        return json.dumps(update_object_ids(self.stream_block, json.loads(value), destination_ids_by_source))
+        # a parsed value is updated in place; a JSON string is returned as a JSON string
+        stream = self.parse_value(value)
+        if not isinstance(stream, list):
+            return value
+        if isinstance(value, str):
+            return json.dumps(update_object_ids(self.stream_block, stream, destination_ids_by_source))
+        return update_object_ids(self.stream_block, stream, destination_ids_by_source, in_place=True)
+
+    def populate_field(self, instance, value, context):
+        value = self.parse_value(value)
+        if isinstance(value, list):
+            # the decoded stream is passed on as a StreamValue, rather than re-encoded as JSON
+            value = self.stream_block.to_python(
+                self.update_object_references(value, context.destination_ids_by_source)
+            )
+        setattr(instance, self.field.get_attname(), self.field.to_python(value))
 
 
 class FileAdapter(FieldAdapter):
@@ -290,28 +358,48 @@ class FileAdapter(FieldAdapter):
             'hash': get_file_hash(self.field, instance),
         }
 
+    def _get_file(self, instance, value):
+        # Return a File for the file to be imported, or None if the instance already has a file
+        # with the same contents
+        existing_file = self.field.value_from_object(instance)
+
+        if existing_file:
+            # the hash may be None within read_only_file_metadata, in which case the file is
+            # assumed to have changed
+            existing_file_hash = get_file_hash(self.field, instance)
+            if existing_file_hash == value['hash']:
+                # File not changed, so don't bother updating it
+                return None
+
+        # Get the local filename
+        name = pathlib.PurePosixPath(urlparse(value['download_url']).path).name
+        local_filename = self.field.generate_filename(instance, name)
+
+        return File(local_filename, value['size'], value['hash'], value['download_url'])
+
+    def get_file_transfers(self, instance, value):
+        if not value:
+            return set()
+
+        _file = self._get_file(instance, value)
+        return {_file} if _file else set()
+
     def populate_field(self, instance, value, context):
         if not value:
             return None
+        if value['download_url'] in context.failed_file_transfers:
+            return None
         imported_file = context.imported_files_by_source_url.get(value['download_url'])
         if imported_file is None:
+            # the file was not transferred in advance by ImportPlanner.run
+            _file = self._get_file(instance, value)
+            if _file is None:
+                return
 
-            existing_file = self.field.value_from_object(instance)
-
-            if existing_file:
-                existing_file_hash = get_file_hash(self.field, instance)
-                if existing_file_hash == value['hash']:
-                    # File not changed, so don't bother updating it
-                    return
-
-            # Get the local filename
-            name = pathlib.PurePosixPath(urlparse(value['download_url']).path).name
-            local_filename = self.field.generate_filename(instance, name)
-
-            _file = File(local_filename, value['size'], value['hash'], value['download_url'])
             try:
-                imported_file = _file.transfer()
-            except FileTransferError:
+                imported_file = _file.transfer(context.http_client)
+            except (FileTransferError, requests.RequestException):
+                context.failed_file_transfers.add(_file.source_url)
                 return None
             context.imported_files_by_source_url[_file.source_url] = imported_file
 
@@ -340,6 +428,9 @@ class ManyToManyFieldAdapter(FieldAdapter):
         pks = list(self._get_pks(instance))
         return pks
 
+    def get_prefetch_lookups(self):
+        return [self.name]
+
     def populate_field(self, instance, value, context):
         # setting forward ManyToMany directly is prohibited
         pass
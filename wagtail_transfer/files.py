@@ -1,10 +1,36 @@
 import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from contextvars import ContextVar
 
 import requests
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import File as DjangoFile
 
-from .models import ImportedFile
+from .models import FileMetadata, ImportedFile
+
+# Maximum number of files to download at once when transferring files in bulk
+FILE_TRANSFER_WORKERS = getattr(settings, 'WAGTAILTRANSFER_FILE_TRANSFER_WORKERS', 4)
+
+# Size of the chunks in which files are read when downloading or hashing them
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of file hashes to keep in the in-process cache of calculated hashes
+FILE_HASH_CACHE_SIZE = 1000
+
+# Cache of file hashes calculated when recording FileMetadata, keyed by (storage, name, modified time)
+_file_hash_cache = OrderedDict()
+# Guards _file_hash_cache, which is shared by the threads that record file metadata concurrently
+_file_hash_cache_lock = threading.Lock()
+
+# Whether file sizes and hashes that have not been recorded yet may be calculated and recorded
+# (see read_only_file_metadata)
+_record_file_metadata = ContextVar('record_file_metadata', default=True)
 
 
 @contextmanager
@@ -44,6 +70,34 @@ def open_file(field, file):
             f.close()
 
 
+@contextmanager
+def read_only_file_metadata():
+    """
+    Within this context, get_file_size and get_file_hash return None for files whose size or hash
+    has not been recorded yet, rather than retrieving the file from storage and recording them -
+    so that no database writes are made (for example, during a dry run of an import)
+    """
+    token = _record_file_metadata.set(False)
+    try:
+        yield
+    finally:
+        _record_file_metadata.reset(token)
+
+
+def has_own_file_metadata(model, field):
+    """
+    Return True if the model keeps track of the size and hash of the file in the given field
+    itself, rather than relying on FileMetadata
+    """
+    from wagtail.documents.models import AbstractDocument
+    from wagtail.images.models import AbstractImage, AbstractRendition
+    if issubclass(model, (AbstractDocument, AbstractImage)) and field.name == 'file':
+        return True
+
+    # Renditions are not exported, and ImportedFile records the size and hash of the file itself
+    return issubclass(model, (AbstractRendition, ImportedFile))
+
+
 def get_file_size(field, instance):
     """
     Gets the size of the file in the given field on the given instance.
@@ -52,17 +106,13 @@ def get_file_size(field, instance):
     from wagtail.documents.models import AbstractDocument
     from wagtail.images.models import AbstractImage
     if isinstance(instance, (AbstractDocument, AbstractImage)) and field.name == 'file':
+        if not _record_file_metadata.get():
+            return instance.file_size
         return instance.get_file_size()
 
-    # Allow developers to provide a file size getter for custom file fields
-    # TODO: complete, test and document this mechanism
-    # size_getter = getattr(instance, 'wagtailtransfer_get_{}_size', None)
-    # if size_getter:
-    #     return size_getter()
-
-    # Fall back to asking Django
-    # This is potentially very slow as it may result in a call to an external storage service
-    return field.value_from_object(instance).size
+    # Fall back to the size recorded when the file was saved
+    metadata = get_file_metadata(field, instance)
+    return metadata and metadata.size
 
 
 def get_file_hash(field, instance):
@@ -73,17 +123,113 @@ def get_file_hash(field, instance):
     from wagtail.documents.models import AbstractDocument
     from wagtail.images.models import AbstractImage
     if isinstance(instance, (AbstractDocument, AbstractImage)) and field.name == 'file':
+        if not _record_file_metadata.get():
+            return instance.file_hash or None
         return instance.get_file_hash()
 
-    # Allow developers to provide a file hash getter for custom file fields
-    # TODO: complete, test and document this mechanism
-    # hash_getter = getattr(instance, 'wagtailtransfer_get_{}_hash', None)
-    # if hash_getter:
-    #     return hash_getter()
+    # Fall back to the hash recorded when the file was saved
+    metadata = get_file_metadata(field, instance)
+    return metadata and metadata.hash
+
+
+def get_file_metadata(field, instance):
+    """
+    Return a FileMetadata record for the file in the given field on the given instance. If the
+    file has no record yet (for example, because it was saved before FileMetadata existed), its
+    size and hash are retrieved from storage and recorded - or, within read_only_file_metadata,
+    None is returned.
+    """
+    file = field.value_from_object(instance)
+    metadata = getattr(file, '_wagtailtransfer_metadata', None)
+    if metadata is not None and metadata.name == file.name:
+        return metadata
+
+    try:
+        metadata = FileMetadata.objects.get(name=file.name)
+    except FileMetadata.DoesNotExist:
+        if not _record_file_metadata.get():
+            return None
+
+        # This is potentially very slow as it may require fetching the file from an external
+        # storage service
+        metadata = FileMetadata(name=file.name, size=file.size, hash=_get_file_hash(field, file))
+        if len(file.name) <= FileMetadata._meta.get_field('name').max_length:
+            metadata, created = FileMetadata.objects.get_or_create(
+                name=file.name, defaults={'size': metadata.size, 'hash': metadata.hash}
+            )
+
+    file._wagtailtransfer_metadata = metadata
+    return metadata
+
+
+def record_file_metadata(name, size, hash):
+    """
+    Record the size and hash of the file stored under the given name
+    """
+    if len(name) <= FileMetadata._meta.get_field('name').max_length:
+        FileMetadata.objects.update_or_create(name=name, defaults={'size': size, 'hash': hash})
+
+
+def _get_file_hash(field, file):
+    # Calculate the hash of the given file, unless we have already done so for this version of
+    # the file
+    try:
+        cache_key = (file.storage, file.name, file.storage.get_modified_time(file.name))
+    except (NotImplementedError, OSError):
+        cache_key = None
+
+    if cache_key is not None:
+        with _file_hash_cache_lock:
+            file_hash = _file_hash_cache.get(cache_key)
+            if file_hash is not None:
+                _file_hash_cache.move_to_end(cache_key)
+                return file_hash
+
+    # the hash is calculated outside the lock, so that files can be hashed in parallel; two threads
+    # hashing the same file at once just store the same result twice
+    file_hash = _calculate_file_hash(field, file)
+
+    if cache_key is not None:
+        with _file_hash_cache_lock:
+            _file_hash_cache[cache_key] = file_hash
+            _file_hash_cache.move_to_end(cache_key)
+            if len(_file_hash_cache) > FILE_HASH_CACHE_SIZE:
+                _file_hash_cache.popitem(last=False)
+
+    return file_hash
+
+
+def _calculate_file_hash(field, file):
+    """
+    Calculate the SHA1 hash of the given file, without reading it into memory all at once
+    """
+    try:
+        path = file.path
+    except NotImplementedError:
+        path = None
 
-    # Fall back to calculating it on the fly
-    with open_file(field, field.value_from_object(instance)) as f:
-        return hashlib.sha1(f.read()).hexdigest()
+    if path is not None:
+        # The file is on the local filesystem, so it can be memory-mapped
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # empty files cannot be memory-mapped
+                return hashlib.sha1().hexdigest()
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                return hashlib.sha1(mapped_file).hexdigest()
+
+    with open_file(field, file) as f:
+        return hash_file_chunks(f)
+
+
+def hash_file_chunks(file):
+    """
+    Calculate the SHA1 hash of a Django File object, reading it in chunks
+    """
+    sha1 = hashlib.sha1()
+    for chunk in file.chunks(FILE_CHUNK_SIZE):
+        sha1.update(chunk)
+    return sha1.hexdigest()
 
 
 class FileTransferError(Exception):
@@ -102,14 +248,33 @@ class File:
         self.hash = hash
         self.source_url = source_url
 
-    def transfer(self):
-        response = requests.get(self.source_url)
+    def download(self, http_client=None):
+        """
+        Download the file and write it to the storage backend of ImportedFile, returning the name
+        it was stored under. The response is read in chunks, so that the file is never held in
+        memory in full. This does not touch the database, and so is safe to call from a thread.
+
+        If http_client (a SourceClient) is given, the request is made through it.
+        """
+        response = (http_client or requests).get(self.source_url, stream=True)
+        try:
+            if response.status_code != 200:
+                raise FileTransferError("Non-200 response from image URL")
+
+            field = ImportedFile._meta.get_field('file')
+            with tempfile.TemporaryFile() as f:
+                for chunk in response.iter_content(chunk_size=FILE_CHUNK_SIZE):
+                    f.write(chunk)
 
-        if response.status_code != 200:
-            raise FileTransferError("Non-200 response from image URL")
+                return field.storage.save(
+                    field.generate_filename(None, self.local_filename), DjangoFile(f), max_length=field.max_length
+                )
+        finally:
+            response.close()
 
+    def transfer(self, http_client=None):
         return ImportedFile.objects.create(
-            file=ContentFile(response.content, name=self.local_filename),
+            file=self.download(http_client),
             source_url=self.source_url,
             hash=self.hash,
             size=self.size,
@@ -117,3 +282,58 @@ class File:
 
     def __hash__(self):
         return hash((self.local_filename, self.size, self.hash, self.source_url))
+
+
+def download_files(files, http_client=None):
+    """
+    Download the given File objects, up to FILE_TRANSFER_WORKERS at a time (through http_client,
+    if given). Returns a tuple of:
+    * a dict mapping source URLs to ImportedFile records for the downloaded files, which are not
+      yet saved to the database
+    * a set of source URLs that could not be transferred
+
+    If a download fails with an unexpected error, the files already downloaded are deleted from
+    storage before the error is raised.
+    """
+    files_by_source_url = {file.source_url: file for file in files}
+    if not files_by_source_url:
+        return {}, set()
+
+    with ThreadPoolExecutor(max_workers=FILE_TRANSFER_WORKERS) as executor:
+        futures = {
+            source_url: executor.submit(file.download, http_client)
+            for source_url, file in files_by_source_url.items()
+        }
+
+    imported_files = {}
+    failed_source_urls = set()
+    error = None
+    for source_url, future in futures.items():
+        try:
+            stored_name = future.result()
+        except (FileTransferError, requests.RequestException):
+            failed_source_urls.add(source_url)
+            continue
+        except Exception as e:
+            error = error or e
+            continue
+
+        file = files_by_source_url[source_url]
+        imported_files[source_url] = ImportedFile(
+            file=stored_name, source_url=source_url, hash=file.hash, size=file.size
+        )
+
+    if error is not None:
+        delete_stored_files(imported_files.values())
+        raise error
+
+    return imported_files, failed_source_urls
+
+
+def delete_stored_files(imported_files):
+    """
+    Delete the files of the given ImportedFile records from storage, such as when the records
+    could not be saved
+    """
+    for imported_file in imported_files:
+        imported_file.file.storage.delete(imported_file.file.name)
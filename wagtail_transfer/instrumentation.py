@@ -0,0 +1,166 @@
+"""
+Instrumentation of imports and exports, recording the wall time taken and the number of database
+queries made by each phase of the work, broken down by model where relevant.
+
+A Report is kept for each import (as ImportPlanner.report) and for each request to the export
+API, and each phase is measured with its phase() context manager. Phases may be nested, in which
+case the outer phase's figures include those of the inner phase; phases that run concurrently
+(such as requests to the source site) are summed, and so may exceed the elapsed time.
+
+When an import or export completes, the report is logged to the 'wagtail_transfer.instrumentation'
+logger (at DEBUG level), and the report_finished signal is sent with the report as its 'report'
+argument. A receiver can forward the figures to a metrics collector such as statsd or Prometheus:
+
+    from django.dispatch import receiver
+    from wagtail_transfer.instrumentation import report_finished
+
+    @receiver(report_finished)
+    def send_transfer_metrics(sender, report, **kwargs):
+        for name, value, tags in report.get_metrics():
+            ...
+
+Import phases: 'fetch' (requests to the source site), 'parse' (adding the response data to the
+import plan), 'locate' (looking up objects at the destination), 'plan' (processing objectives),
+'handle_task' (converting a task into an operation), 'transfer_files', 'run_operation',
+'save_revisions' and 'run' (the whole of ImportPlanner.run).
+
+Export phases: 'serialize', 'mappings' and 'encode'.
+
+Measuring a phase installs a database execute wrapper, which is too costly to do for every object.
+The phases that are measured once per operation, task or object ('run_operation', 'handle_task',
+and 'locate' for objects looked up individually) are only recorded if
+WAGTAILTRANSFER_DETAILED_INSTRUMENTATION is True; otherwise their time is only included in that of
+the phases enclosing them.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Whether to measure the phases that run once per operation, task or object, as well as the phases
+# of the import or export as a whole
+DETAILED_INSTRUMENTATION = getattr(settings, 'WAGTAILTRANSFER_DETAILED_INSTRUMENTATION', False)
+
+# Sent when an import or export completes, with the Report as the 'report' argument
+report_finished = Signal()
+
+
+class PhaseStats:
+    """
+    The number of times a phase has run, and the total time taken and queries made by those runs
+    """
+    __slots__ = ('count', 'time', 'queries')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.queries = 0
+
+    def add(self, duration, queries):
+        self.count += 1
+        self.time += duration
+        self.queries += queries
+
+    def as_dict(self):
+        return {'count': self.count, 'time': self.time, 'queries': self.queries}
+
+
+class Report:
+    """
+    Timings and query counts for the phases of an import or export. name is 'import' or 'export'.
+    detailed determines whether phases marked as detailed are measured, and defaults to the
+    WAGTAILTRANSFER_DETAILED_INSTRUMENTATION setting.
+
+    phases: a mapping of phase name to PhaseStats, over all models
+    phases_by_model: a mapping of phase name to a mapping of model label to PhaseStats, for the
+        phases that are measured per model
+    """
+    def __init__(self, name, detailed=None):
+        self.name = name
+        self.detailed = DETAILED_INSTRUMENTATION if detailed is None else detailed
+        self.phases = defaultdict(PhaseStats)
+        self.phases_by_model = defaultdict(lambda: defaultdict(PhaseStats))
+        # phases may be recorded from the threads making requests to the source site
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, model=None, detailed=False):
+        """
+        Measure the code run within this context as a phase with the given name, and optionally
+        attribute it to the given model class. If detailed is True, the phase is only measured if
+        this report is detailed.
+        """
+        if detailed and not self.detailed:
+            yield
+            return
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            self.record(name, time.perf_counter() - start, queries, model=model)
+
+    def record(self, name, duration, queries, model=None):
+        with self._lock:
+            self.phases[name].add(duration, queries)
+            if model is not None:
+                self.phases_by_model[name][model._meta.label_lower].add(duration, queries)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'phases': {
+                name: dict(stats.as_dict(), models={
+                    model_label: model_stats.as_dict()
+                    for model_label, model_stats in self.phases_by_model.get(name, {}).items()
+                })
+                for name, stats in self.phases.items()
+            },
+        }
+
+    def get_metrics(self):
+        """
+        Yield the figures in the report as (metric_name, value, tags) tuples, such as
+        ('wagtail_transfer.import.run_operation.time', 0.25, {'model': 'tests.advert'}). Figures
+        for a phase as a whole have empty tags.
+        """
+        for name, stats in self.phases.items():
+            for stat, value in stats.as_dict().items():
+                yield (f'wagtail_transfer.{self.name}.{name}.{stat}', value, {})
+
+            for model_label, model_stats in self.phases_by_model.get(name, {}).items():
+                for stat, value in model_stats.as_dict().items():
+                    yield (f'wagtail_transfer.{self.name}.{name}.{stat}', value, {'model': model_label})
+
+    def get_server_timing(self):
+        """
+        Return the report as the value of a Server-Timing HTTP header, with one entry per phase
+        """
+        return ', '.join(
+            f'{name};desc="{stats.count} run(s), {stats.queries} queries";dur={stats.time * 1000:.1f}'
+            for name, stats in self.phases.items()
+        )
+
+    def finish(self):
+        """
+        Log the report and send the report_finished signal, once the import or export is complete
+        """
+        logger.debug("wagtail-transfer %s report: %s", self.name, json.dumps(self.as_dict()))
+        report_finished.send(sender=Report, report=self)
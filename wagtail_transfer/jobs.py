@@ -0,0 +1,363 @@
+"""
+Running imports as background jobs, recorded as ImportJob objects, so that a large import does
+not have to complete within the admin request that starts it.
+
+The executor that runs new jobs is set by WAGTAILTRANSFER_IMPORT_JOB_EXECUTOR:
+
+'wagtail_transfer.jobs.ThreadExecutor' (default): runs each job in a background thread of the
+    process that created it
+'wagtail_transfer.jobs.QueueExecutor': leaves jobs queued, to be run by the run_import_jobs
+    management command
+'wagtail_transfer.jobs.ImmediateExecutor': runs each job to completion within the request that
+    created it, as imports were run before jobs were introduced
+
+A job created with dry_run=True stops once the import is planned, and records an estimate of its
+effects and cost (see wagtail_transfer.estimates) instead of applying it.
+
+If WAGTAILTRANSFER_COMMIT_BATCH_SIZE is set, each job's import is committed in batches of that
+many operations, and a job that fails can be requeued to resume from its last committed batch.
+
+A running job records a heartbeat every HEARTBEAT_INTERVAL seconds. A job that is left unfinished
+because the process running it has exited stops doing so, and once it has gone without a
+heartbeat for STALE_JOB_TIMEOUT seconds, fail_interrupted_jobs marks it as failed, so that it can
+be requeued like any other failed job.
+
+A job's operations_completed count is only updated as each batch is committed, since progress
+recorded within the import's transaction would not be visible until it is committed. Without
+WAGTAILTRANSFER_COMMIT_BATCH_SIZE, the import runs in a single transaction, so the count stays at
+0 while the job is applying and is set once the import is complete.
+"""
+
+import gzip
+import json
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .auth import digest_for_source
+from .checkpoints import ImportCheckpoint
+from .client import OBJECT_REQUEST_BATCH_SIZE, OBJECT_REQUEST_WORKERS, get_client_for_source
+from .models import ImportJob
+from .operations import ImportPlanner
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+IMPORT_JOB_EXECUTOR = getattr(
+    settings, 'WAGTAILTRANSFER_IMPORT_JOB_EXECUTOR', 'wagtail_transfer.jobs.ThreadExecutor'
+)
+
+# Number of operations to commit in each transaction, or None to run each import in a single
+# transaction
+COMMIT_BATCH_SIZE = getattr(settings, 'WAGTAILTRANSFER_COMMIT_BATCH_SIZE', None)
+
+# Number of seconds between heartbeats recorded by a running job
+HEARTBEAT_INTERVAL = 30
+
+# Number of seconds after which an unfinished job that has not recorded a heartbeat is taken to
+# have been interrupted
+STALE_JOB_TIMEOUT = getattr(settings, 'WAGTAILTRANSFER_IMPORT_JOB_STALE_TIMEOUT', 300)
+
+
+def get_export_request_kwargs(source, digest):
+    """
+    Return the keyword arguments for a request to one of the source site's export endpoints,
+    requesting a streamed response if the source is configured with 'EXPORT_FORMAT': 'ndjson'.
+    Responses are always requested as compact JSON; sources that predate this ignore the
+    parameter and send indented JSON as before.
+    """
+    params = {'digest': digest, 'compact': 'true'}
+    if settings.WAGTAILTRANSFER_SOURCES[source].get('EXPORT_FORMAT') == 'ndjson':
+        params['format'] = 'ndjson'
+        return {'params': params, 'stream': True}
+    else:
+        return {'params': params}
+
+
+def add_response_to_importer(importer, response, process=True):
+    """
+    Add the data from an export API response to the import plan, reading it incrementally if
+    it is in the streamed (newline-delimited JSON) format
+    """
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+    if content_type == NDJSON_CONTENT_TYPE:
+        importer.add_ndjson(response.iter_lines(), process=process)
+    else:
+        importer.add_json(response.content, process=process)
+
+
+def get_object_request_bodies(missing_object_data):
+    """
+    Given a set of (model_class, id) tuples, return a list of JSON request bodies for the
+    objects endpoint, each requesting at most OBJECT_REQUEST_BATCH_SIZE objects of one model
+    """
+    # convert missing_object_data from a set of (model_class, id) tuples
+    # into a dict of {model_class_label: [list_of_ids]}
+    missing_object_data_by_type = defaultdict(list)
+    for model_class, source_id in missing_object_data:
+        missing_object_data_by_type[model_class._meta.label_lower].append(source_id)
+
+    return [
+        json.dumps({model_label: ids[i:i + OBJECT_REQUEST_BATCH_SIZE]})
+        for model_label, ids in missing_object_data_by_type.items()
+        for i in range(0, len(ids), OBJECT_REQUEST_BATCH_SIZE)
+    ]
+
+
+def fetch_missing_object_data(source, importer: ImportPlanner, on_round=None):
+    """
+    Request objects referenced by the import plan from the source site, in rounds, until the
+    plan has no missing object data left. on_round is an optional callable, called after each
+    round has been added to the plan.
+    """
+    client = get_client_for_source(source)
+    base_url = client.base_url
+
+    def request_objects(request_data):
+        # the digest is always of the uncompressed request body
+        digest = digest_for_source(source, request_data)
+        kwargs = get_export_request_kwargs(source, digest)
+        if client.compress_requests:
+            request_data = gzip.compress(request_data.encode('utf-8'))
+            kwargs['headers'] = {'Content-Encoding': 'gzip'}
+        with importer.report.phase('fetch'):
+            return client.post(f"{base_url}api/objects/", data=request_data, **kwargs)
+
+    while importer.missing_object_data:
+        # request the missing object data in batches, several at a time, and add each response to
+        # the import plan as it arrives. The plan is only processed once all responses are in,
+        # so that objects in batches yet to arrive are not taken to be missing
+        with ThreadPoolExecutor(max_workers=OBJECT_REQUEST_WORKERS) as executor:
+            futures = [
+                executor.submit(request_objects, request_data)
+                for request_data in get_object_request_bodies(importer.missing_object_data)
+            ]
+            for future in as_completed(futures):
+                add_response_to_importer(importer, future.result(), process=False)
+
+        importer.process_objectives()
+
+        if on_round:
+            on_round()
+
+
+class ImportJobCheckpoint(ImportCheckpoint):
+    """
+    An ImportCheckpoint stored on an ImportJob
+    """
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        if job.checkpoint:
+            self.load_json(job.checkpoint)
+
+    def save(self):
+        self.job.update(checkpoint=self.to_json(), operations_completed=len(self.completed))
+
+
+def fetch_export(job, client, checkpoint):
+    """
+    Request the export data for the given job from the source site, and return an ImportPlanner
+    for it, resuming from the given checkpoint
+    """
+    base_url = client.base_url
+
+    if job.import_type == ImportJob.TYPE_PAGE:
+        digest = digest_for_source(job.source, str(job.source_page_id))
+        url = f"{base_url}api/pages/{job.source_page_id}/"
+        importer = ImportPlanner.for_page(source=job.source_page_id, destination=job.dest_page_id)
+    else:
+        digest = digest_for_source(job.source, job.model)
+        url = f"{base_url}api/models/{job.model}/"
+        if job.source_object_id:
+            url = f"{url}{job.source_object_id}/"
+        importer = ImportPlanner.for_model(model=job.model)
+
+    with importer.report.phase('fetch'):
+        response = client.get(url, **get_export_request_kwargs(job.source, digest))
+
+    importer.resume_from(checkpoint)
+    add_response_to_importer(importer, response)
+    return importer
+
+
+class JobHeartbeat:
+    """
+    Context manager recording a heartbeat for the given job every HEARTBEAT_INTERVAL seconds
+    while it is running. Heartbeats are recorded from a background thread, with its own database
+    connection, so that they are committed even while the job's import transaction is open.
+    """
+    def __init__(self, job):
+        self.job = job
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"wagtail-transfer-import-heartbeat-{job.pk}", daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(HEARTBEAT_INTERVAL):
+                try:
+                    ImportJob.objects.filter(
+                        pk=self.job.pk, status__in=ImportJob.RUNNING_STATUSES
+                    ).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    # for example, if the database is locked by the import's transaction; try
+                    # again at the next interval
+                    logger.warning("Could not record heartbeat for import job %d", self.job.pk, exc_info=True)
+        finally:
+            connection.close()
+
+
+def fail_interrupted_jobs(jobs=None):
+    """
+    Mark as failed any running jobs (optionally from the queryset jobs) that have not recorded a
+    heartbeat within STALE_JOB_TIMEOUT seconds, because the process running them has exited.
+    Returns the number of jobs marked as failed.
+    """
+    if jobs is None:
+        jobs = ImportJob.objects.all()
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=STALE_JOB_TIMEOUT)
+    return jobs.filter(status__in=ImportJob.RUNNING_STATUSES).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(
+        status=ImportJob.STATUS_FAILED, error="The import was interrupted before it finished", finished_at=now
+    )
+
+
+def run_import_job(job):
+    """
+    Run a queued ImportJob to completion, recording its status and progress as it goes.
+    Returns False, without running the job, if the job is no longer queued (for example,
+    because another runner has already claimed it); otherwise returns True.
+    """
+    # claim the job, so that no other runner picks it up
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_QUEUED).update(
+        status=ImportJob.STATUS_FETCHING, started_at=now, heartbeat_at=now
+    )
+    if not claimed:
+        return False
+    job.refresh_from_db()
+
+    with JobHeartbeat(job):
+        _run_claimed_import_job(job)
+    return True
+
+
+def _run_claimed_import_job(job):
+    try:
+        client = get_client_for_source(job.source)
+        checkpoint = ImportJobCheckpoint(job)
+        importer = fetch_export(job, client, checkpoint)
+
+        def update_objects_fetched():
+            job.update(objects_fetched=len(importer.object_data_by_source))
+
+        job.update(status=ImportJob.STATUS_PLANNING)
+        update_objects_fetched()
+        fetch_missing_object_data(job.source, importer, on_round=update_objects_fetched)
+
+        if job.dry_run:
+            estimate = importer.run(batch_size=COMMIT_BATCH_SIZE, checkpoint=checkpoint, dry_run=True)
+            job.update(
+                status=ImportJob.STATUS_DONE,
+                operations_total=len(importer.operations),
+                estimate=json.dumps(estimate.as_dict()),
+                finished_at=timezone.now(),
+            )
+            return
+
+        # operations_completed is updated by the checkpoint as each batch is committed; when the
+        # import is not batched, it is only set once the import is complete
+        job.update(status=ImportJob.STATUS_APPLYING, operations_total=len(importer.operations))
+        importer.run(http_client=client, batch_size=COMMIT_BATCH_SIZE, checkpoint=checkpoint)
+    except Exception as e:
+        logger.exception("Import job %d failed", job.pk)
+        job.update(
+            status=ImportJob.STATUS_FAILED, error=f"{type(e).__name__}: {e}", finished_at=timezone.now()
+        )
+    else:
+        job.update(
+            status=ImportJob.STATUS_DONE,
+            operations_completed=len(importer.operations) - len(importer.unsatisfiable_operations),
+            checkpoint='',
+            finished_at=timezone.now(),
+        )
+
+
+def run_queued_import_jobs():
+    """
+    Run all queued import jobs, oldest first, and return the number of jobs run. Jobs that have
+    been interrupted are marked as failed first.
+    """
+    fail_interrupted_jobs()
+
+    count = 0
+    while True:
+        job = ImportJob.objects.filter(status=ImportJob.STATUS_QUEUED).order_by('created_at', 'pk').first()
+        if job is None:
+            return count
+        if run_import_job(job):
+            count += 1
+
+
+class ImmediateExecutor:
+    """
+    Runs each job to completion as soon as it is submitted
+    """
+    def submit(self, job):
+        run_import_job(job)
+
+
+class ThreadExecutor:
+    """
+    Runs each job in a new background thread, once the transaction that created the job (if any)
+    has been committed. Jobs that are running when the process exits are left unfinished.
+    """
+    def submit(self, job):
+        transaction.on_commit(lambda: self._start_thread(job.pk))
+
+    def _start_thread(self, job_id):
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f"wagtail-transfer-import-{job_id}")
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, job_id):
+        try:
+            run_import_job(ImportJob.objects.get(pk=job_id))
+        finally:
+            # each thread has its own database connection, which will not be closed by the
+            # request cycle
+            connection.close()
+
+
+class QueueExecutor:
+    """
+    Leaves jobs queued, to be run by the run_import_jobs management command
+    """
+    def submit(self, job):
+        pass
+
+
+def get_import_job_executor():
+    return import_string(IMPORT_JOB_EXECUTOR)()
@@ -5,11 +5,13 @@ model-specific such as a slug field.
 """
 
 import uuid
-from functools import lru_cache
+from functools import lru_cache, reduce
+from operator import or_
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db import IntegrityError
+from django.db.models import Q
 
 from .models import IDMapping, get_base_model
 
@@ -17,6 +19,12 @@ from django.contrib.contenttypes.models import ContentType
 
 UUID_SEQUENCE = 0
 
+# maximum number of UIDs to match in a single query when looking up objects in bulk by field values
+FIELD_LOOKUP_BATCH_SIZE = 100
+
+# maximum number of IDs to pass in a single `__in` lookup, to stay within database parameter limits
+ID_LOOKUP_BATCH_SIZE = 900
+
 # dict of models that should be located by field values using FieldLocator,
 # rather than by UUID mapping
 LOOKUP_FIELDS = {
@@ -27,6 +35,12 @@ for model_label, fields in getattr(settings, 'WAGTAILTRANSFER_LOOKUP_FIELDS', {}
     LOOKUP_FIELDS[model_label.lower()] = fields
 
 
+def batched(items, batch_size):
+    """Split a list into consecutive lists of at most batch_size items"""
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
 class IDMappingLocator:
     def __init__(self, model):
         if model._meta.parents:
@@ -51,6 +65,35 @@ class IDMappingLocator:
 
         return mapping.content_object
 
+    def find_many(self, uids):
+        """
+        Find objects for a collection of UIDs; return a dict mapping each UID that was found to its
+        object. UIDs with no corresponding object are omitted from the result.
+        """
+        # normalise to UUID instances, so that we can match them against the IDMapping primary keys
+        uid_field = IDMapping._meta.pk
+        uids_by_value = {uid_field.to_python(uid): uid for uid in uids}
+
+        mappings = IDMapping.objects.in_bulk(list(uids_by_value))
+        if not mappings:
+            return {}
+
+        local_ids_by_uid = {}
+        for uid_value, mapping in mappings.items():
+            if mapping.content_type_id != self.content_type.pk:
+                raise IntegrityError(
+                    "Content type mismatch! Expected %r, got %r" % (self.content_type, mapping.content_type)
+                )
+            local_ids_by_uid[uids_by_value[uid_value]] = self.model._meta.pk.to_python(mapping.local_id)
+
+        # use _base_manager, to match the object retrieval done by GenericForeignKey
+        objects_by_id = self.model._base_manager.in_bulk(set(local_ids_by_uid.values()))
+        return {
+            uid: objects_by_id[local_id]
+            for uid, local_id in local_ids_by_uid.items()
+            if local_id in objects_by_id
+        }
+
     def get_uid_for_local_id(self, id, create=True):
         global UUID_SEQUENCE
 
@@ -75,6 +118,50 @@ class IDMappingLocator:
             except IDMapping.DoesNotExist:
                 return None
 
+    def get_uids_for_local_ids(self, ids):
+        """
+        Get UIDs for the instances with the given IDs, assigning new ones where they don't exist
+        already; return a dict mapping each ID to its UID
+        """
+        global UUID_SEQUENCE
+
+        # IDMapping.local_id is a string field, so keep track of the original ID values
+        ids_by_local_id = {str(id): id for id in ids}
+        if not ids_by_local_id:
+            return {}
+
+        def _get_existing_uids(local_ids):
+            uids = {}
+            for batch in batched(local_ids, ID_LOOKUP_BATCH_SIZE):
+                uids.update(
+                    (ids_by_local_id[local_id], uid)
+                    for local_id, uid in IDMapping.objects.filter(
+                        content_type=self.content_type, local_id__in=batch
+                    ).values_list('local_id', 'uid')
+                )
+            return uids
+
+        uids_by_id = _get_existing_uids(list(ids_by_local_id))
+
+        unmapped_local_ids = [
+            local_id for local_id, id in ids_by_local_id.items() if id not in uids_by_id
+        ]
+        if unmapped_local_ids:
+            new_mappings = []
+            for local_id in unmapped_local_ids:
+                new_mappings.append(IDMapping(
+                    content_type=self.content_type, local_id=local_id,
+                    uid=uuid.uuid1(clock_seq=UUID_SEQUENCE)
+                ))
+                UUID_SEQUENCE += 1
+
+            # ignore_conflicts leaves alone any mappings created concurrently by another process;
+            # re-read the newly created mappings so that we return the UIDs that actually persisted
+            IDMapping.objects.bulk_create(new_mappings, batch_size=ID_LOOKUP_BATCH_SIZE, ignore_conflicts=True)
+            uids_by_id.update(_get_existing_uids(unmapped_local_ids))
+
+        return uids_by_id
+
     def attach_uid(self, instance, uid):
         """
         Do whatever needs to be done to ensure that the given instance can be located under the
@@ -91,6 +178,37 @@ class IDMappingLocator:
             uid=uid, defaults={'content_type': self.content_type, 'local_id': instance.pk}
         )
 
+    def get_content_hashes(self, uids):
+        """
+        Return a dict mapping UIDs to the content hash recorded when the object was last imported,
+        for those of the given UIDs that have one
+        """
+        uid_field = IDMapping._meta.pk
+        uids_by_value = {uid_field.to_python(uid): uid for uid in uids}
+
+        hashes = {}
+        for batch in batched(list(uids_by_value), ID_LOOKUP_BATCH_SIZE):
+            hashes.update(
+                (uids_by_value[uid_value], content_hash)
+                for uid_value, content_hash in IDMapping.objects.filter(
+                    uid__in=batch, content_type=self.content_type
+                ).exclude(content_hash='').values_list('uid', 'content_hash')
+            )
+        return hashes
+
+    def set_content_hashes(self, hashes_by_uid):
+        """
+        Record the content hashes of imported objects, given as a dict mapping UIDs to hashes
+        """
+        uid_field = IDMapping._meta.pk
+        hashes_by_value = {uid_field.to_python(uid): content_hash for uid, content_hash in hashes_by_uid.items()}
+
+        for batch in batched(list(hashes_by_value), ID_LOOKUP_BATCH_SIZE):
+            mappings = IDMapping.objects.in_bulk(batch).values()
+            for mapping in mappings:
+                mapping.content_hash = hashes_by_value[mapping.uid]
+            IDMapping.objects.bulk_update(mappings, ['content_hash'])
+
     def uid_from_json(self, json_uid):
         """
         Convert the UID representation originating from JSON data into the native type used by
@@ -113,11 +231,39 @@ class FieldLocator:
         # For field-based lookups, the UID is a tuple of field values
         return self.model.objects.values_list(*self.fields).get(pk=id)
 
+    def get_uids_for_local_ids(self, ids):
+        """
+        Get UIDs for the instances with the given IDs; return a dict mapping each ID to its UID.
+        As with get_uid_for_local_id, raises DoesNotExist if any of the instances do not exist.
+        """
+        ids = set(ids)
+        uids_by_id = {}
+        for batch in batched(list(ids), ID_LOOKUP_BATCH_SIZE):
+            uids_by_id.update(
+                (values[0], values[1:])
+                for values in self.model.objects.filter(pk__in=batch).values_list('pk', *self.fields)
+            )
+
+        if len(uids_by_id) < len(ids):
+            missing_ids = sorted(ids.difference(uids_by_id), key=str)
+            raise self.model.DoesNotExist(
+                "%s matching query does not exist (ids: %r)" % (self.model._meta.object_name, missing_ids)
+            )
+        return uids_by_id
+
     def attach_uid(self, instance, uid):
         # UID is derived directly from the object data, so nothing needs to be done to associate
         # the UID with the object
         pass
 
+    def get_content_hashes(self, uids):
+        # Objects located by field values have no IDMapping record in which to keep a content
+        # hash, so they are always treated as changed
+        return {}
+
+    def set_content_hashes(self, hashes_by_uid):
+        pass
+
     def uid_from_json(self, json_uid):
         # A UID coming from JSON data will arrive as a list (because JSON has no tuple type),
         # but we need a tuple because the importer logic expects a hashable type that we can use
@@ -134,6 +280,36 @@ class FieldLocator:
         except self.model.DoesNotExist:
             return None
 
+    def _normalise_uid(self, uid):
+        return tuple(
+            self.model._meta.get_field(field_name).to_python(value)
+            for field_name, value in zip(self.fields, uid)
+        )
+
+    def find_many(self, uids):
+        """
+        Find objects for a collection of UIDs; return a dict mapping each UID that was found to its
+        object. UIDs with no corresponding object are omitted from the result.
+        """
+        uids_by_value = {self._normalise_uid(uid): uid for uid in uids}
+        results = {}
+        for batch in batched(list(uids_by_value), FIELD_LOOKUP_BATCH_SIZE):
+            query = reduce(or_, (Q(**dict(zip(self.fields, value))) for value in batch))
+            for obj in self.model.objects.filter(query):
+                # read the raw column values, so that foreign keys give the related object's ID
+                # rather than the object itself
+                value = self._normalise_uid(
+                    self.model._meta.get_field(field_name).value_from_object(obj) for field_name in self.fields
+                )
+                try:
+                    results[uids_by_value[value]] = obj
+                except KeyError:
+                    # the database matched on a looser comparison than ours (e.g. a
+                    # case-insensitive collation); this is not one of the UIDs we're looking for
+                    pass
+
+        return results
+
 
 @lru_cache(maxsize=None)
 def get_locator_for_model(model):
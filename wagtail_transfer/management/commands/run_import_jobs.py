@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail_transfer.jobs import fail_interrupted_jobs, run_import_job, run_queued_import_jobs
+from wagtail_transfer.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Run queued import jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', metavar='job_id', nargs='*', type=int, help="IDs of the jobs to run (default: all queued jobs)")
+        parser.add_argument('--resume', action='store_true', help="Run the given jobs again if they have failed or been interrupted, resuming from their last committed batch")
+        parser.add_argument('--wait', action='store_true', help="Keep running, and run new jobs as they are queued")
+        parser.add_argument('--interval', type=float, default=5, help="Number of seconds between checks for new jobs when using --wait (default 5)")
+
+    def handle(self, *args, **options):
+        if options['job_ids']:
+            for job_id in options['job_ids']:
+                try:
+                    job = ImportJob.objects.get(pk=job_id)
+                except ImportJob.DoesNotExist:
+                    raise CommandError("Import job %d does not exist." % job_id)
+
+                if options['resume']:
+                    if fail_interrupted_jobs(ImportJob.objects.filter(pk=job.pk)):
+                        job.refresh_from_db()
+                    if job.status == ImportJob.STATUS_FAILED:
+                        job.requeue()
+
+                if not run_import_job(job):
+                    raise CommandError("Import job %d is not queued (status: %s)." % (job_id, job.status))
+                self.report(job)
+            return
+
+        while True:
+            count = run_queued_import_jobs()
+            if count:
+                self.stdout.write("Ran %d import job(s)." % count)
+            if not options['wait']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, job):
+        if job.status == ImportJob.STATUS_FAILED:
+            self.stderr.write("Import job %d failed: %s" % (job.pk, job.error))
+        else:
+            self.stdout.write("Import job %d done." % job.pk)
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_transfer', '0003_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idmapping',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
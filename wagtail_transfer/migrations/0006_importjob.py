@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wagtail_transfer', '0005_filemetadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('import_type', models.CharField(choices=[('page', 'Page'), ('model', 'Model')], max_length=10)),
+                ('source_page_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('dest_page_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('model', models.CharField(blank=True, max_length=255)),
+                ('source_object_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('fetching', 'Fetching'), ('planning', 'Planning'), ('applying', 'Applying'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('objects_fetched', models.PositiveIntegerField(default=0)),
+                ('operations_total', models.PositiveIntegerField(default=0)),
+                ('operations_completed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
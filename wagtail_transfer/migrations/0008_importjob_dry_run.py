@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_transfer', '0007_importjob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='dry_run',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='estimate',
+            field=models.TextField(blank=True),
+        ),
+    ]
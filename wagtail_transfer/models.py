@@ -1,3 +1,6 @@
+import json
+
+from django.conf import settings
 from django.db import models
 
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -8,6 +11,8 @@ class IDMapping(models.Model):
     uid = models.UUIDField(primary_key=True)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     local_id = models.CharField(max_length=255)
+    # hash of the source data that this object was last imported from, if any
+    content_hash = models.CharField(max_length=40, blank=True, default='')
     content_object = GenericForeignKey('content_type', 'local_id')
 
     class Meta:
@@ -22,6 +27,131 @@ class ImportedFile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class FileMetadata(models.Model):
+    """
+    The size and hash of a file in storage, recorded so that they do not have to be retrieved
+    from the storage backend whenever the file is exported. Used for file fields other than
+    those of Wagtail images and documents, which keep track of these themselves.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    hash = models.CharField(max_length=40)
+
+
+class ImportJob(models.Model):
+    """
+    An import of a page tree or of model objects from a source site, run in the background by
+    wagtail_transfer.jobs.run_import_job. The job's status moves from 'queued' through
+    'fetching', 'planning' and 'applying' to either 'done' or 'failed', and the progress
+    counters are updated as it goes.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_FETCHING = 'fetching'
+    STATUS_PLANNING = 'planning'
+    STATUS_APPLYING = 'applying'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_FETCHING, "Fetching"),
+        (STATUS_PLANNING, "Planning"),
+        (STATUS_APPLYING, "Applying"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    FINISHED_STATUSES = [STATUS_DONE, STATUS_FAILED]
+    RUNNING_STATUSES = [STATUS_FETCHING, STATUS_PLANNING, STATUS_APPLYING]
+
+    TYPE_PAGE = 'page'
+    TYPE_MODEL = 'model'
+    TYPE_CHOICES = [
+        (TYPE_PAGE, "Page"),
+        (TYPE_MODEL, "Model"),
+    ]
+
+    source = models.CharField(max_length=255)
+    import_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    # for page imports: the ID of the root page on the source site, and the ID of the page at the
+    # destination to import it under (or null to import at the root of the tree)
+    source_page_id = models.PositiveIntegerField(null=True, blank=True)
+    dest_page_id = models.PositiveIntegerField(null=True, blank=True)
+    # for model imports: the model as 'app_label.model_name', and the ID of the object on the
+    # source site (or blank to import all objects of the model)
+    model = models.CharField(max_length=255, blank=True)
+    source_object_id = models.CharField(max_length=255, blank=True)
+
+    # a dry run only plans the import, and records an estimate of its effects and cost without
+    # writing anything
+    dry_run = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error = models.TextField(blank=True)
+    # JSON record of the estimate made by a dry run; see wagtail_transfer.estimates.ImportEstimate
+    estimate = models.TextField(blank=True)
+    # JSON record of the batches committed so far, when the import is committed in batches; see
+    # wagtail_transfer.checkpoints.ImportCheckpoint
+    checkpoint = models.TextField(blank=True)
+
+    # progress counters. operations_completed is only updated as each batch is committed (see
+    # WAGTAILTRANSFER_COMMIT_BATCH_SIZE), or once the import is complete if it is not batched
+    objects_fetched = models.PositiveIntegerField(default=0)
+    operations_total = models.PositiveIntegerField(default=0)
+    operations_completed = models.PositiveIntegerField(default=0)
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # recorded periodically while the job is running, so that a job left unfinished by a process
+    # that has exited can be told apart from one that is still running
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def update(self, **kwargs):
+        """
+        Set the given fields on this job and save only those fields, so that progress updates do
+        not overwrite each other
+        """
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        ImportJob.objects.filter(pk=self.pk).update(**kwargs)
+
+    def requeue(self):
+        """
+        Queue a failed job to be run again, resuming from its checkpoint. Returns False if the job
+        has not failed.
+        """
+        requeued = ImportJob.objects.filter(pk=self.pk, status=self.STATUS_FAILED).update(
+            status=self.STATUS_QUEUED, error='', finished_at=None
+        )
+        if requeued:
+            self.refresh_from_db()
+        return bool(requeued)
+
+    def get_estimate(self):
+        """
+        Return the estimate recorded by a dry run, as a dict, or None if there is none
+        """
+        if self.estimate:
+            return json.loads(self.estimate)
+
+    def get_progress(self):
+        return {
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'finished': self.is_finished,
+            'objects_fetched': self.objects_fetched,
+            'operations_total': self.operations_total,
+            'operations_completed': self.operations_completed,
+            'error': self.error,
+        }
+
+
 def get_base_model(model):
     """
     For the given model, return the highest concrete model in the inheritance tree -
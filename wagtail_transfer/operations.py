@@ -1,16 +1,27 @@
 import json
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 from copy import copy
+from functools import lru_cache
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models, transaction
+from django.db.models import F
+from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel, get_all_child_relations
+from treebeard.exceptions import PathOverflow
 from treebeard.mp_tree import MP_Node
 from wagtail.core.models import Page
 
-from .field_adapters import adapter_registry
+from .checkpoints import ImportCheckpoint
+from .estimates import ImportEstimate
+from .field_adapters import FieldAdapter, adapter_registry
+from .files import delete_stored_files, download_files, read_only_file_metadata
+from .instrumentation import Report
 from .locators import get_locator_for_model
-from .models import get_base_model, get_base_model_for_path, get_model_for_path
+from .models import ImportedFile, get_base_model, get_base_model_for_path, get_model_for_path
+from .revisions import save_revisions
 
 from django.utils.functional import cached_property
 
@@ -36,6 +47,12 @@ class CircularDependencyException(Exception):
     pass
 
 
+# Reasons reported by ImportPlanner._check_satisfiable for an operation being unsatisfiable
+UNSATISFIABLE_MISSING = 'missing'
+UNSATISFIABLE_CIRCULAR = 'circular'
+UNSATISFIABLE_BLOCKED = 'blocked'
+
+
 class Objective:
     """
     An objective identifies an individual database object that we want to exist on the destination
@@ -66,12 +83,19 @@ class Objective:
         except KeyError:
             pass
 
+        # see if we've already established (via ImportPlanner._prefetch_destination_ids) that
+        # the object does not exist
+        if (self.model, self.source_id) in self.context.missing_at_destination:
+            self._exists_at_destination = False
+            return
+
         # look up uid for this item;
         # the export API is expected to supply the id->uid mapping for all referenced objects,
         # so this lookup should always succeed (and if it doesn't, we leave the KeyError uncaught)
         uid = self.context.uids_by_source[(self.model, self.source_id)]
 
-        destination_object = get_locator_for_model(self.model).find(uid)
+        with self.context.report.phase('locate', self.model, detailed=True):
+            destination_object = get_locator_for_model(self.model).find(uid)
         if destination_object is None:
             self._exists_at_destination = False
         else:
@@ -96,6 +120,129 @@ class Objective:
         return hash((self.model, self.source_id, self.must_update))
 
 
+class TreeBuilder:
+    """
+    Allocates positions in the tree for nodes created by CreateTreeModel operations during an
+    import. Treebeard's add_child re-reads the parent node and its last child, and updates the
+    parent's numchild, for every node added; here, the parent and its last child position are
+    read once per parent, the numchild of each newly created node is set up front from the
+    number of children the import will create under it, and numchild for pre-existing parents is
+    updated with one query per parent once all nodes are created (in update_numchild).
+    """
+    def __init__(self):
+        # Mapping of (base_model, destination_id) to a dict of state for each node that children
+        # have been (or may be) added to:
+        #   'instance': the node instance, or None if it needs to be re-fetched
+        #   'last_step': the numeric path step of the node's last child
+        #   'created': whether the node was created in this import with its numchild set up front
+        #   'added_children': the number of children added that are not yet reflected in numchild
+        #       in the database
+        self.parents = {}
+
+        # Number of children that CreateTreeModel operations will add to each node created in the
+        # import, keyed by (base_model, source_id)
+        self.planned_child_counts = Counter()
+
+    @staticmethod
+    def can_bulk_insert(model):
+        """
+        Return True if nodes of this model can be positioned by TreeBuilder; models with their own
+        ordering rules or insertion logic must use add_child instead
+        """
+        return not model.node_order_by and model.add_child is MP_Node.add_child
+
+    def plan(self, operations):
+        """
+        Record the number of children that will be created under each node, given the ordered list
+        of operations that will be run
+        """
+        for operation in operations:
+            if isinstance(operation, CreateTreeModel) and operation.destination_parent_id is None:
+                base_model = operation.base_model
+                if self.can_bulk_insert(base_model):
+                    self.planned_child_counts[(base_model, operation.object_data['parent_id'])] += 1
+
+    def _get_parent(self, base_model, parent_id):
+        try:
+            parent = self.parents[(base_model, parent_id)]
+        except KeyError:
+            instance = base_model.objects.get(pk=parent_id)
+            last_step = 0
+            if not instance.is_leaf():
+                last_step = base_model._str2int(instance.get_last_child().path[-base_model.steplen:])
+
+            parent = self.parents[(base_model, parent_id)] = {
+                'instance': instance, 'last_step': last_step, 'created': False, 'added_children': 0,
+            }
+        else:
+            if parent['instance'] is None:
+                instance = base_model.objects.get(pk=parent_id)
+                instance.numchild += parent['added_children']
+                parent['instance'] = instance
+
+        return parent
+
+    def add_child(self, base_model, parent_id, instance, source_id):
+        """
+        Save the unsaved instance as the last child of the node with ID parent_id. source_id is the
+        ID of the node on the source site, used to look up its planned number of children
+        """
+        parent = self._get_parent(base_model, parent_id)
+        parent_instance = parent['instance']
+
+        step = parent['last_step'] + 1
+        if len(base_model._int2str(step)) > base_model.steplen:
+            raise PathOverflow("Path overflow adding child to %r" % parent_instance)
+
+        instance.depth = parent_instance.depth + 1
+        instance.path = base_model._get_path(parent_instance.path, instance.depth, step)
+        if len(instance.path) > base_model._meta.get_field('path').max_length:
+            raise PathOverflow(
+                "The new node is too deep in the tree, try increasing the path.max_length property "
+                "and UPDATE your database"
+            )
+        planned_child_count = self.planned_child_counts[(base_model, source_id)]
+        instance.numchild = planned_child_count
+
+        # populate treebeard's cache of the parent object, so that get_parent (as used by Page.save)
+        # does not query for it
+        instance._cached_parent_obj = parent_instance
+        instance.save()
+
+        parent['last_step'] = step
+        if not parent['created']:
+            # keep numchild on the in-memory parent up to date, as treebeard relies on it to check
+            # for children
+            parent_instance.numchild += 1
+            parent['added_children'] += 1
+
+        # if no children were planned for the node (as when the import is committed in batches,
+        # and plan is not used), any children added are counted in the same way as for a
+        # pre-existing node
+        self.parents[(base_model, instance.pk)] = {
+            'instance': instance, 'last_step': 0, 'created': planned_child_count > 0, 'added_children': 0,
+        }
+
+    def invalidate(self, base_model, pk):
+        """
+        Indicate that the node with the given ID has been modified, so that it must be re-fetched
+        if used as a parent again (e.g. to pick up a changed url_path)
+        """
+        try:
+            self.parents[(base_model, pk)]['instance'] = None
+        except KeyError:
+            pass
+
+    def update_numchild(self):
+        """
+        Update numchild in the database for pre-existing nodes that have had children added
+        """
+        for (base_model, pk), parent in self.parents.items():
+            if parent['added_children']:
+                base_model.objects.filter(pk=pk).update(numchild=F('numchild') + parent['added_children'])
+                parent['added_children'] = 0
+
+
 class ImportContext:
     """
     Persistent state required when running the import; this includes mappings from the source
@@ -114,9 +261,34 @@ class ImportContext:
         # Keys are tuples of (model_class, source_id); values are UIDs.
         self.uids_by_source = {}
 
+        # Set of (model_class, source_id) tuples for objects that we have looked up and found not
+        # to exist on the destination site
+        self.missing_at_destination = set()
+
+        # Mapping of (model_class, source_id) tuples to the content hash that was recorded when the
+        # object was last imported, for objects that exist on the destination site
+        self.content_hashes_by_source = {}
+
+        # Mapping of (model_class, source_id) tuples to the content hashes of objects that have
+        # been created or updated by this import, to be recorded once the import completes
+        self.imported_content_hashes = {}
+
         # Mapping of source_urls to instances of ImportedFile
         self.imported_files_by_source_url = {}
 
+        # Set of source_urls of files that could not be downloaded
+        self.failed_file_transfers = set()
+
+        # SourceClient used to download files from the source site, if available; otherwise
+        # files are downloaded with plain `requests` calls
+        self.http_client = None
+
+        # Allocates tree positions for nodes created by CreateTreeModel operations
+        self.tree_builder = TreeBuilder()
+
+        # Timings and query counts for the phases of the import
+        self.report = Report('import')
+
 
 class ImportPlanner:
     def __init__(self, root_page_source_pk=None, destination_parent_id=None, model=None):
@@ -184,6 +356,23 @@ class ImportPlanner:
         # NO_FOLLOW_MODELS told us not to, or because they did not exist on the source site.
         self.failed_creations = set()
 
+        # Mapping of (model, source_id) tuples to destination IDs, for objects that exist at the
+        # destination and have not changed since they were last imported, and so do not need
+        # an update operation
+        self.unchanged_objects = {}
+
+        # Mapping of operations that cannot be performed, due to hard dependencies that cannot be
+        # satisfied, to a (reason, (model, source_id)) tuple describing the failed dependency.
+        # Populated by `run`.
+        self.unsatisfiable_operations = {}
+
+    @property
+    def report(self):
+        """
+        The instrumentation Report for this import
+        """
+        return self.context.report
+
     @classmethod
     def for_page(cls, source, destination):
         return cls(root_page_source_pk=source, destination_parent_id=destination)
@@ -192,7 +381,7 @@ class ImportPlanner:
     def for_model(cls, model):
         return cls(model=model)
 
-    def add_json(self, json_data):
+    def add_json(self, json_data, process=True):
         """
         Add JSON data to the import plan. The data is a dict consisting of:
         'ids_for_import': a list of [source_id, model_classname] pairs for the set of objects
@@ -208,22 +397,77 @@ class ImportPlanner:
         'objects': a list of dicts containing full object data used for creating or updating object
             records. This may include additional objects beyond the ones listed in ids_for_import,
             to assist in resolving related objects.
+
+        If process is False, the data is recorded but not acted on until process_objectives is
+        called. This allows data requested in several parts to be added before it is processed;
+        process_objectives must then be called once all of the parts have been added, as any
+        requested objects still missing at that point are assumed not to exist on the source site.
+        """
+        with self.report.phase('parse'):
+            data = json.loads(json_data)
+
+            self._add_ids_for_import(data['ids_for_import'])
+            self._add_mappings(data['mappings'])
+
+            # add object data to the object_data_by_source dict
+            for obj_data in data['objects']:
+                self._add_object_data_to_lookup(obj_data)
+
+        if process:
+            self.process_objectives()
+
+    def add_ndjson(self, lines, process=True):
+        """
+        Add data in the streamed export format to the import plan. lines is an iterable of
+        newline-delimited JSON records (as str or bytes), each being a dict with a single key:
+        'ids_for_import', 'mappings' or 'object'. These have the same meaning as in add_json,
+        except that each 'object' record contains a single object, and 'mappings' may be split
+        across several records. Any 'ids_for_import' records must precede the 'mappings' records.
+
+        Records are processed as they are read, so the full response never needs to be held in
+        memory at once. process has the same meaning as in add_json.
         """
-        data = json.loads(json_data)
+        # as the records are read from a stream, this phase includes the time spent reading it
+        with self.report.phase('parse'):
+            for line in lines:
+                if not line.strip():
+                    continue
 
+                record = json.loads(line)
+                if 'object' in record:
+                    self._add_object_data_to_lookup(record['object'])
+                elif 'mappings' in record:
+                    self._add_mappings(record['mappings'])
+                elif 'ids_for_import' in record:
+                    self._add_ids_for_import(record['ids_for_import'])
+
+        if process:
+            self.process_objectives()
+
+    def _add_ids_for_import(self, ids_for_import):
         # for each ID in the import list, add to base_import_ids as an object explicitly selected
         # for import
-        for model_path, source_id in data['ids_for_import']:
+        for model_path, source_id in ids_for_import:
             model = get_base_model_for_path(model_path)
             self.base_import_ids.add((model, source_id))
 
-        # add source id -> uid mappings to the uids_by_source dict, and add objectives 
-        # for importing referenced models
-        for model_path, source_id, jsonish_uid in data['mappings']:
+    def _add_mappings(self, mappings):
+        # add source id -> uid mappings to the uids_by_source dict
+        for model_path, source_id, jsonish_uid in mappings:
             model = get_base_model_for_path(model_path)
             uid = get_locator_for_model(model).uid_from_json(jsonish_uid)
             self.context.uids_by_source[(model, source_id)] = uid
 
+        # look up the destination IDs for all of these mappings in bulk, rather than one at a time
+        # as objectives are handled
+        self._prefetch_destination_ids(
+            (get_base_model_for_path(model_path), source_id)
+            for model_path, source_id, jsonish_uid in mappings
+        )
+
+        # add objectives for importing referenced models
+        for model_path, source_id, jsonish_uid in mappings:
+            model = get_base_model_for_path(model_path)
             base_import = (model, source_id) in self.base_import_ids
 
             if base_import or model_path not in NO_FOLLOW_MODELS:
@@ -235,19 +479,54 @@ class ImportPlanner:
                 # add to the set of objectives that need handling
                 self._add_objective(objective)
 
-        # add object data to the object_data_by_source dict
-        for obj_data in data['objects']:
-            self._add_object_data_to_lookup(obj_data)
-
-        # retry tasks that were previously postponed due to missing object data
-        self._retry_tasks()
+    def process_objectives(self):
+        """
+        Act on the data added to the import plan so far, creating operations for any objectives
+        that can now be handled
+        """
+        with self.report.phase('plan'):
+            # retry tasks that were previously postponed due to missing object data
+            self._retry_tasks()
 
+            # Process all unhandled objectives - which may trigger new objectives as dependencies of
+            # the resulting operations - until no unhandled objectives remain
+            while self.unhandled_objectives:
+                objective = self.unhandled_objectives.pop()
+                self._handle_objective(objective)
 
-        # Process all unhandled objectives - which may trigger new objectives as dependencies of
-        # the resulting operations - until no unhandled objectives remain
-        while self.unhandled_objectives:
-            objective = self.unhandled_objectives.pop()
-            self._handle_objective(objective)
+    def _prefetch_destination_ids(self, keys):
+        """
+        Given an iterable of (model_class, source_id) tuples with known UIDs, find the
+        corresponding objects at the destination in bulk, and record the results in
+        destination_ids_by_source / missing_at_destination so that objectives do not need to
+        look them up individually. The content hashes recorded for any objects found are also
+        retrieved, to identify objects that are unchanged since they were last imported.
+        """
+        keys_by_model = defaultdict(set)
+        for key in keys:
+            if key in self.context.destination_ids_by_source or key in self.context.missing_at_destination:
+                continue
+            keys_by_model[key[0]].add(key)
+
+        for model, model_keys in keys_by_model.items():
+            source_ids_by_uid = defaultdict(list)
+            for key in model_keys:
+                source_ids_by_uid[self.context.uids_by_source[key]].append(key[1])
+
+            locator = get_locator_for_model(model)
+            with self.report.phase('locate', model):
+                found = locator.find_many(source_ids_by_uid.keys())
+                content_hashes = locator.get_content_hashes(found.keys()) if found else {}
+
+            for uid, source_ids in source_ids_by_uid.items():
+                destination_object = found.get(uid)
+                for source_id in source_ids:
+                    if destination_object is None:
+                        self.context.missing_at_destination.add((model, source_id))
+                    else:
+                        self.context.destination_ids_by_source[(model, source_id)] = destination_object.pk
+                        if uid in content_hashes:
+                            self.context.content_hashes_by_source[(model, source_id)] = content_hashes[uid]
 
     def _add_object_data_to_lookup(self, obj_data):
         model = get_base_model_for_path(obj_data['model'])
@@ -294,7 +573,8 @@ class ImportPlanner:
                 self.failed_creations.add((objective.model, objective.source_id))
             else:
                 task = ('create', objective.model, objective.source_id)
-                self._handle_task(task)
+                with self.report.phase('handle_task', objective.model, detailed=True):
+                    self._handle_task(task)
 
         else:
             # object already exists at the destination, so any objects referencing it can go ahead
@@ -303,7 +583,8 @@ class ImportPlanner:
 
             if objective.must_update:
                 task = ('update', objective.model, objective.source_id)
-                self._handle_task(task)
+                with self.report.phase('handle_task', objective.model, detailed=True):
+                    self._handle_task(task)
 
     def _handle_task(self, task):
         """
@@ -367,6 +648,8 @@ class ImportPlanner:
                     operation = CreateTreeModel(specific_model, object_data, self.destination_parent_id)
                 else:
                     operation = CreateTreeModel(specific_model, object_data)
+            elif self._is_unchanged(model, source_id, object_data):
+                operation = None
             else:  # action == 'update'
                 destination_id = self.context.destination_ids_by_source[(model, source_id)]
                 obj = specific_model.objects.get(pk=destination_id)
@@ -375,6 +658,8 @@ class ImportPlanner:
             # non-tree model
             if action == 'create':
                 operation = CreateModel(specific_model, object_data)
+            elif self._is_unchanged(model, source_id, object_data):
+                operation = None
             else:  # action == 'update'
                 destination_id = self.context.destination_ids_by_source[(model, source_id)]
                 obj = specific_model.objects.get(pk=destination_id)
@@ -426,6 +711,19 @@ class ImportPlanner:
             for instance in operation.deletions(self.context):
                 self.operations.add(DeleteModel(instance))
 
+    def _is_unchanged(self, model, source_id, object_data):
+        """
+        Return True if the object data is identical to that of the last import of this object,
+        according to its content hash - in which case there is no need to update the object. Such
+        objects are recorded in unchanged_objects.
+        """
+        content_hash = object_data.get('content_hash')
+        if not content_hash or self.context.content_hashes_by_source.get((model, source_id)) != content_hash:
+            return False
+
+        self.unchanged_objects[(model, source_id)] = self.context.destination_ids_by_source[(model, source_id)]
+        return True
+
     def _retry_tasks(self):
         """
         Retry tasks that were previously postponed due to missing object data
@@ -443,143 +741,417 @@ class ImportPlanner:
         self.missing_object_data.clear()
 
         for task in previous_postponed_tasks:
-            self._handle_task(task)
+            with self.report.phase('handle_task', task[1], detailed=True):
+                self._handle_task(task)
+
+    def resume_from(self, checkpoint):
+        """
+        Restore the destination IDs of objects saved by the committed batches of a previous,
+        failed run of this import, recorded in the given ImportCheckpoint. Must be called before
+        any data is added to the import plan.
+        """
+        self.context.destination_ids_by_source.update(checkpoint.completed)
+
+    def run(self, http_client=None, batch_size=None, checkpoint=None, dry_run=False):
+        """
+        Perform the import. http_client is an optional SourceClient to be used for downloading
+        files from the source site.
 
-    def run(self):
+        By default, all operations are run in a single transaction. If batch_size is given, the
+        operations are instead committed in batches of that size, with the progress recorded in
+        checkpoint (an ImportCheckpoint) as each batch is committed. If checkpoint records
+        progress from a previous run, the objects saved by that run are skipped.
+
+        If dry_run is True, the operations are checked and ordered as for a real import, but
+        nothing is downloaded or written to the database; instead, an ImportEstimate of the
+        import's effects and cost is returned.
+
+        The time taken and queries made by each phase of the import are recorded in self.report,
+        which is finished (logged, and sent with the report_finished signal) once the run is
+        complete.
+        """
+        with self.report.phase('run'):
+            result = self._run(http_client, batch_size, checkpoint, dry_run)
+
+        self.report.finish()
+        return result
+
+    def _run(self, http_client, batch_size, checkpoint, dry_run):
         if self.unhandled_objectives or self.postponed_tasks:
             raise ImproperlyConfigured("Cannot run import until all dependencies are resoved")
 
         # filter out unsatisfiable operations
-        statuses = {}
+        self.unsatisfiable_operations = self._check_satisfiable()
         satisfiable_operations = [
             op for op in self.operations
-            if self._check_satisfiable(op, statuses)
+            if op not in self.unsatisfiable_operations
         ]
 
         # arrange operations into an order that satisfies dependencies
         operation_order = []
+        ordered_operations = set()
         for operation in satisfiable_operations:
-            self._add_to_operation_order(operation, operation_order, [operation])
+            self._add_to_operation_order(operation, operation_order, ordered_operations)
+
+        if batch_size:
+            checkpoint = checkpoint or ImportCheckpoint()
+            operation_order = [
+                operation for operation in operation_order
+                if self._get_saved_object(operation) not in checkpoint.completed
+            ]
+
+        if dry_run:
+            # files whose hashes have not been recorded at the destination are counted as changed,
+            # rather than retrieved from storage to be hashed
+            with read_only_file_metadata():
+                file_transfers = self._get_file_transfers(operation_order)
+            return ImportEstimate.for_operations(operation_order, self.unsatisfiable_operations, file_transfers)
+
+        if not batch_size:
+            # numchild of created tree nodes can only be set up front when all of their children
+            # are created in the same transaction
+            self.context.tree_builder.plan(operation_order)
+
+        self.context.http_client = http_client
+
+        # download all files needed by the operations up front, so that they do not have to be
+        # fetched one at a time while the database transaction is open
+        imported_files = self._transfer_files(operation_order)
+
+        if batch_size:
+            self._run_in_batches(operation_order, batch_size, checkpoint, imported_files)
+            return
 
         # run operations in order
-        with transaction.atomic():
+        with self._atomic_with_imported_files(imported_files):
             for operation in operation_order:
-                operation.run(self.context)
+                self._run_operation(operation)
+
+            self.context.tree_builder.update_numchild()
+            self._save_content_hashes()
             
             # pages must only have revisions saved after all child objects have been updated, imported, or deleted, otherwise
             # they will capture outdated versions of child objects in the revision
-            for operation in operation_order:
-                if isinstance(operation.instance, Page):
-                    operation.instance.save_revision()
+            with self.report.phase('save_revisions'):
+                # pages saved by the import have been validated by Page.save
+                save_revisions([
+                    operation.instance for operation in operation_order
+                    if isinstance(operation.instance, Page)
+                ], clean=False)
+                save_revisions(self._get_unchanged_pages_with_changed_children(operation_order))
+
+    def _run_operation(self, operation):
+        with self.report.phase('run_operation', type(operation.instance), detailed=True):
+            operation.run(self.context)
+
+    def _run_in_batches(self, operation_order, batch_size, checkpoint, imported_files):
+        for start in range(0, len(operation_order), batch_size):
+            batch = operation_order[start:start + batch_size]
+
+            # the records for the downloaded files are committed with the first batch
+            with self._atomic_with_imported_files(imported_files if start == 0 else []):
+                for operation in batch:
+                    self._run_operation(operation)
+
+                self.context.tree_builder.update_numchild()
+                self._save_content_hashes()
+                self.context.imported_content_hashes.clear()
+
+                for operation in batch:
+                    saved_object = self._get_saved_object(operation)
+                    if saved_object is not None:
+                        checkpoint.completed[saved_object] = operation.instance.pk
+                        if isinstance(operation.instance, Page):
+                            checkpoint.pending_revision_page_ids.add(operation.instance.pk)
+
+                checkpoint.pending_revision_page_ids.update(
+                    page.pk for page in self._get_unchanged_pages_with_changed_children(batch)
+                )
+                checkpoint.save()
+
+        # revisions are saved once all batches are committed, so that they capture child objects
+        # saved in later batches than their page
+        with transaction.atomic(), self.report.phase('save_revisions'):
+            save_revisions(list(
+                Page.objects.filter(pk__in=checkpoint.pending_revision_page_ids).specific()
+            ))
+            checkpoint.pending_revision_page_ids.clear()
+            checkpoint.save()
+
+    def _get_saved_object(self, operation):
+        """
+        Return the (model, source_id) pair of the object created or updated by the given
+        operation, or None if it does not save an object from the source site
+        """
+        if isinstance(operation, SaveOperationMixin):
+            return (operation.base_model, operation.object_data['pk'])
+
+    def _get_file_transfers(self, operation_order):
+        """
+        Return a set of File objects for the files that need to be downloaded for the given
+        operations
+        """
+        files = set()
+        for operation in operation_order:
+            if isinstance(operation, SaveOperationMixin):
+                files.update(operation.get_file_transfers())
+        return files
 
+    def _transfer_files(self, operation_order):
+        """
+        Download the files needed by the given operations, and return the (unsaved) ImportedFile
+        records for them
+        """
+        with self.report.phase('transfer_files'):
+            imported_files, failed_source_urls = download_files(
+                self._get_file_transfers(operation_order), http_client=self.context.http_client
+            )
+        self.context.imported_files_by_source_url.update(imported_files)
+        self.context.failed_file_transfers.update(failed_source_urls)
+        return list(imported_files.values())
 
-    def _check_satisfiable(self, operation, statuses):
-        # Check whether the given operation's dependencies are satisfiable. statuses is a dict of
-        # previous results - keys are (model, id) pairs and the value is:
-        #  True - dependency is satisfiable
-        #  False - dependency is not satisfiable
-        #  None - the satisfiability check is currently in progress -
-        #         if we encounter this we have found a circular dependency.
-        for (model, id, is_hard_dep) in operation.dependencies:
-            if not is_hard_dep:
-                continue  # ignore soft dependencies here
+    @contextmanager
+    def _atomic_with_imported_files(self, imported_files):
+        """
+        A transaction in which the given ImportedFile records, for files downloaded ahead of the
+        import, are saved. If the transaction fails, the files are deleted from storage, as they
+        would otherwise be left without records.
+        """
+        try:
+            with transaction.atomic():
+                ImportedFile.objects.bulk_create(imported_files)
+                yield
+        except Exception:
+            delete_stored_files(imported_files)
+            raise
+
+    def _save_content_hashes(self):
+        hashes_by_model = defaultdict(dict)
+        for (model, source_id), content_hash in self.context.imported_content_hashes.items():
+            hashes_by_model[model][self.context.uids_by_source[(model, source_id)]] = content_hash
+
+        for model, hashes_by_uid in hashes_by_model.items():
+            get_locator_for_model(model).set_content_hashes(hashes_by_uid)
+
+    def _get_unchanged_pages_with_changed_children(self, operation_order):
+        """
+        Return the (specific) pages that were skipped as unchanged, but have had child objects
+        created, updated or deleted by the given operations, and so need a new revision to
+        capture those changes
+        """
+        unchanged_page_ids = {
+            destination_id for (model, source_id), destination_id in self.unchanged_objects.items()
+            if issubclass(model, Page)
+        }
+        if not unchanged_page_ids:
+            return []
+
+        page_ids = set()
+        for operation in operation_order:
+            for field in type(operation.instance)._meta.concrete_fields:
+                if isinstance(field, ParentalKey) and issubclass(field.related_model, Page):
+                    page_id = getattr(operation.instance, field.attname)
+                    if page_id in unchanged_page_ids:
+                        page_ids.add(page_id)
+
+        if not page_ids:
+            return []
+        return list(Page.objects.filter(pk__in=page_ids).specific())
+
+    def _check_satisfiable(self):
+        """
+        Determine which operations cannot be performed because their hard dependencies cannot be
+        satisfied. Returns a dict mapping each unsatisfiable operation to a (reason, dependency)
+        tuple, where dependency is the (model, source_id) pair that could not be satisfied and
+        reason is one of:
+          UNSATISFIABLE_MISSING - the dependency is not going to be created, for one of the reasons
+              logged in failed_creations
+          UNSATISFIABLE_CIRCULAR - the dependency is created by an operation that (directly or
+              indirectly) has a hard dependency on this one
+          UNSATISFIABLE_BLOCKED - the dependency is created by an operation which is itself
+              unsatisfiable
+
+        All operations are checked in a single depth-first pass over the graph of hard
+        dependencies, using an explicit stack rather than recursion, and each operation is visited
+        at most once.
+        """
+        unsatisfiable = {}
+        # operations whose dependencies have been fully checked
+        checked = set()
 
-            try:
-                # Look for a previous result for this dependency
-                result = statuses[(model, id)]
-                if result is False or result is None:
-                    # Dependency is known to be unsatisfiable, or we have just found a circular
-                    # dependency
-                    return False
-            except KeyError:
-                # No previous result - need to determine it now.
-                # Mark this as 'in progress', to spot circular dependencies
-                statuses[(model, id)] = None
+        for start_operation in self.operations:
+            if start_operation in checked:
+                continue
 
-                # Look for a resolution for this dependency (i.e. an Operation that creates it)
-                try:
-                    resolution = self.resolutions[(model, id)]
-                except KeyError:
-                    # If the resolution is missing, it *should* be for one of the reasons we've
-                    # accounted for and logged in failed_creations. Otherwise, that's a bug, and
-                    # we should fail loudly now
-                    if (model, id) not in self.failed_creations:
-                        raise
-
-                    # The dependency is not satisfiable (for a reason we know about in
-                    # failed_creations), and so the overall operation fails too
-                    statuses[(model, id)] = False
-                    return False
-
-                if resolution is None:
-                    # the dependency was already satisfied, with no further action required
-                    statuses[(model, id)] = True
+            # Each stack entry is [operation, iterator over its remaining hard dependencies, the
+            # dependency currently being followed from it]. The set `path` holds the operations
+            # currently on the stack; encountering one of these again means that we have found a
+            # circular dependency.
+            stack = [[start_operation, self._get_hard_dependencies(start_operation), None]]
+            path = {start_operation}
+
+            while stack:
+                frame = stack[-1]
+                operation, dependencies, _ = frame
+                next_operation = None
+
+                if operation not in unsatisfiable:
+                    for dependency in dependencies:
+                        # Look for a resolution for this dependency (i.e. an Operation that creates it)
+                        try:
+                            resolution = self.resolutions[dependency]
+                        except KeyError:
+                            # If the resolution is missing, it *should* be for one of the reasons we've
+                            # accounted for and logged in failed_creations. Otherwise, that's a bug, and
+                            # we should fail loudly now
+                            if dependency not in self.failed_creations:
+                                raise
+
+                            unsatisfiable[operation] = (UNSATISFIABLE_MISSING, dependency)
+                            break
+
+                        if resolution is None:
+                            # the dependency was already satisfied, with no further action required
+                            continue
+                        elif resolution in path:
+                            unsatisfiable[operation] = (UNSATISFIABLE_CIRCULAR, dependency)
+                            break
+                        elif resolution in checked:
+                            if resolution in unsatisfiable:
+                                unsatisfiable[operation] = (UNSATISFIABLE_BLOCKED, dependency)
+                                break
+                        else:
+                            # resolution is an Operation that we now need to check before continuing
+                            frame[2] = dependency
+                            next_operation = resolution
+                            break
+
+                if next_operation is not None:
+                    stack.append([next_operation, self._get_hard_dependencies(next_operation), None])
+                    path.add(next_operation)
                 else:
-                    # resolution is an Operation that we now need to check recursively
-                    result = self._check_satisfiable(resolution, statuses)
-                    statuses[(model, id)] = result
-                    if result is False:
-                        return False
+                    # this operation has been fully checked; its result feeds into the operation
+                    # that depends on it, if any
+                    stack.pop()
+                    path.discard(operation)
+                    checked.add(operation)
 
-        # We've got through all the dependencies without anything failing. Yay!
-        return True
+                    if stack and operation in unsatisfiable:
+                        parent_frame = stack[-1]
+                        if parent_frame[0] not in unsatisfiable:
+                            unsatisfiable[parent_frame[0]] = (UNSATISFIABLE_BLOCKED, parent_frame[2])
+
+        return unsatisfiable
 
-    def _add_to_operation_order(self, operation, operation_order, path):
-        # path is the sequence of dependencies we've followed so far, starting from the top-level
-        # operation picked from satisfiable_operations in `run`, to find one we can add
+    def _get_hard_dependencies(self, operation):
+        return (
+            (model, id)
+            for model, id, is_hard_dep in operation.dependencies
+            if is_hard_dep  # soft dependencies do not affect satisfiability
+        )
 
-        if operation in operation_order:
-            # already in list - no need to add
+    def _add_to_operation_order(self, operation, operation_order, ordered_operations):
+        """
+        Append operation to the list operation_order, preceded by any operations that it depends on
+        which are not already in the list. ordered_operations is the set of operations already in
+        operation_order, for fast membership tests.
+
+        This is a depth-first topological sort, performed iteratively with an explicit stack so that
+        long dependency chains (such as deep page trees) cannot exceed the recursion limit.
+        Circular dependencies are resolved by leaving a soft dependency unsatisfied - circular
+        dependencies consisting only of hard dependencies will have been filtered out by
+        _check_satisfiable.
+        """
+        if operation in ordered_operations:
             return
 
-        for dep_model, dep_source_id, dep_is_hard in operation.dependencies:
-            # look up the resolution for this dependency (= an Operation or None)
-            try:
-                resolution = self.resolutions[(dep_model, dep_source_id)]
-            except KeyError:
-                # There is no resolution for this dependency - for example, it's a rich text link
-                # to a page outside of the subtree being imported (and NO_FOLLOW_MODELS tells us
-                # not to recursively import it).
+        # Each stack entry is [operation, iterator over its remaining dependencies, is_hard flag of
+        # the dependency currently being followed from it]. The set `path` holds the operations
+        # currently on the stack.
+        stack = [[operation, iter(operation.dependencies), None]]
+        path = {operation}
 
-                # If everything is working properly, this should be a case we already encountered
-                # during task / objective solving and logged in failed_creations.
-                assert (dep_model, dep_source_id) in self.failed_creations
+        while stack:
+            frame = stack[-1]
+            current_operation, dependencies, _ = frame
+            next_operation = None
+            found_hard_cycle = False
 
-                # Also, it should be a soft dependency, since we've eliminated unsatisfiable hard
-                # hard dependencies during _check_satisfiable.
-                assert not dep_is_hard
+            for dep_model, dep_source_id, dep_is_hard in dependencies:
+                # look up the resolution for this dependency (= an Operation or None)
+                try:
+                    resolution = self.resolutions[(dep_model, dep_source_id)]
+                except KeyError:
+                    # There is no resolution for this dependency - for example, it's a rich text link
+                    # to a page outside of the subtree being imported (and NO_FOLLOW_MODELS tells us
+                    # not to recursively import it).
 
-                # Since this is a soft dependency, we can (and must!) leave it unsatisfied.
-                # Abandon this dependency and move on to the next in the list
-                continue
+                    # If everything is working properly, this should be a case we already encountered
+                    # during task / objective solving and logged in failed_creations.
+                    assert (dep_model, dep_source_id) in self.failed_creations
 
-            if resolution is None:
-                # dependency is already satisfied with no further action
-                continue
-            elif resolution in path:
-                # The resolution for this dependency is an operation that's currently under
-                # consideration, so we have a circular dependency. This will be one that we can
-                # resolve by breaking a soft dependency - a circular dependency consisting of
-                # only hard dependencies would have been caught by _check_satisfiable. So, raise
-                # an exception to be propagated back up the chain until we're back to a caller that
-                # can handle it gracefully - namely, a soft dependency that can be left
-                # unsatisfied.
-                raise CircularDependencyException()
-            else:
-                try:
-                    # recursively add the operation that we're depending on here
-                    self._add_to_operation_order(resolution, operation_order, path + [resolution])
-                except CircularDependencyException:
-                    if dep_is_hard:
-                        # we can't resolve the circular dependency by breaking the chain here,
-                        # so propagate it to the next level up
-                        raise
-                    else:
-                        # this is a soft dependency, and we can break the chain by leaving this
-                        # unsatisfied. Abandon this dependency and move on to the next in the list
+                    # Also, it should be a soft dependency, since we've eliminated unsatisfiable
+                    # hard dependencies during _check_satisfiable.
+                    assert not dep_is_hard
+
+                    # Since this is a soft dependency, we can (and must!) leave it unsatisfied.
+                    # Abandon this dependency and move on to the next in the list
+                    continue
+
+                if resolution is None or resolution in ordered_operations:
+                    # dependency is already satisfied with no further action
+                    continue
+                elif resolution in self.unsatisfiable_operations:
+                    # The operation that would create this dependency cannot be run. This must be a
+                    # soft dependency (otherwise this operation would be unsatisfiable too), so
+                    # leave it unsatisfied
+                    assert not dep_is_hard
+                    continue
+                elif resolution in path:
+                    # The resolution for this dependency is an operation that's currently under
+                    # consideration, so we have a circular dependency.
+                    if not dep_is_hard:
+                        # this is a soft dependency, and we can break the cycle by leaving it
+                        # unsatisfied. Move on to the next in the list
                         continue
 
-        operation_order.append(operation)
+                    # We can't break the cycle here; it must be broken at a soft dependency
+                    # further up the stack
+                    found_hard_cycle = True
+                    break
+                else:
+                    # add the operation that we're depending on here before continuing with the
+                    # remaining dependencies of current_operation
+                    frame[2] = dep_is_hard
+                    next_operation = resolution
+                    break
+
+            if next_operation is not None:
+                stack.append([next_operation, iter(next_operation.dependencies), None])
+                path.add(next_operation)
+
+            elif found_hard_cycle:
+                # Unwind the stack until we reach an operation that was following a soft dependency;
+                # that dependency will be left unsatisfied, and that operation continues with the
+                # rest of its dependencies. The operations unwound here are not added to the
+                # order yet - they will be revisited later, either as dependencies of other
+                # operations or from the top-level loop in `run`.
+                while True:
+                    abandoned_operation, _, _ = stack.pop()
+                    path.discard(abandoned_operation)
+                    if not stack:
+                        # this should not be possible for operations that have passed
+                        # _check_satisfiable
+                        raise CircularDependencyException()
+                    if not stack[-1][2]:
+                        break
+
+            else:
+                # all dependencies of current_operation have been dealt with, so it can be added
+                stack.pop()
+                path.discard(current_operation)
+                operation_order.append(current_operation)
+                ordered_operations.add(current_operation)
 
 
 class Operation:
@@ -610,6 +1182,48 @@ class Operation:
         return set()
 
 
+class ModelImportPlan:
+    """
+    The fields of a model that CreateModel and UpdateModel operations act on, worked out once per
+    model (see get_model_import_plan) rather than for every object imported:
+
+    field_adapters: (field, adapter) pairs for the model's fields that have an adapter
+    many_to_many_fields: (field, base model of the related model) pairs for the ManyToManyFields,
+        which are set after the instance is saved
+    dependency_adapters, deletion_adapters, file_transfer_adapters: (field, adapter) pairs for
+        the adapters that implement get_dependencies, get_object_deletions and
+        get_file_transfers respectively (the FieldAdapter implementations return nothing, so
+        need not be called)
+    """
+    def __init__(self, model):
+        self.model = model
+        self.field_adapters = []
+        self.many_to_many_fields = []
+
+        for field in model._meta.get_fields():
+            adapter = adapter_registry.get_field_adapter(field)
+            if adapter:
+                self.field_adapters.append((field, adapter))
+            if isinstance(field, models.ManyToManyField):
+                self.many_to_many_fields.append((field, get_base_model(field.related_model)))
+
+        self.dependency_adapters = self._get_adapters_implementing('get_dependencies')
+        self.deletion_adapters = self._get_adapters_implementing('get_object_deletions')
+        self.file_transfer_adapters = self._get_adapters_implementing('get_file_transfers')
+
+    def _get_adapters_implementing(self, method_name):
+        base_method = getattr(FieldAdapter, method_name)
+        return [
+            (field, adapter) for field, adapter in self.field_adapters
+            if getattr(type(adapter), method_name) is not base_method
+        ]
+
+
+@lru_cache(maxsize=None)
+def get_model_import_plan(model):
+    return ModelImportPlan(model)
+
+
 class SaveOperationMixin:
     """
     Mixin class to handle the common logic of CreateModel and UpdateModel operations, namely:
@@ -625,17 +1239,42 @@ class SaveOperationMixin:
     def base_model(self):
         return get_base_model(self.model)
 
+    @cached_property
+    def model_plan(self):
+        return get_model_import_plan(self.model)
+
+    @cached_property
+    def field_values(self):
+        """
+        A dict of the field values in `self.object_data`, keyed by field name, as parsed by the
+        fields' adapters - so that each value is parsed once, and shared by the dependency,
+        deletion, file transfer and population steps of the operation
+        """
+        field_values = {}
+        fields = self.object_data['fields']
+        for field, adapter in self.model_plan.field_adapters:
+            try:
+                value = fields[field.name]
+            except KeyError:
+                continue
+
+            field_values[field.name] = adapter.parse_value(value)
+
+        return field_values
+
     def _populate_fields(self, context):
-        for field in self.model._meta.get_fields():
+        field_values = self.field_values
+        for field, adapter in self.model_plan.field_adapters:
             try:
-                value = self.object_data['fields'][field.name]
+                value = field_values[field.name]
             except KeyError:
                 continue
 
-            adapter = adapter_registry.get_field_adapter(field)
+            adapter.populate_field(self.instance, value, context)
 
-            if adapter:
-                adapter.populate_field(self.instance, value, context)
+        # populate_field may update parsed values in place with destination ids, so they are
+        # discarded rather than kept for the rest of the import
+        del self.field_values
 
     def _populate_many_to_many_fields(self, context):
         save_needed = False
@@ -643,25 +1282,23 @@ class SaveOperationMixin:
         # for ManyToManyField, this must be done after saving so that the instance has an id.
         # for ParentalManyToManyField, this could be done before, but doing both together avoids additional
         # complexity as the method is identical
-        for field in self.model._meta.get_fields():
-            if isinstance(field, models.ManyToManyField):
+        for field, target_model in self.model_plan.many_to_many_fields:
+            try:
+                value = self.object_data['fields'][field.name]
+            except KeyError:
+                continue
+
+            # translate list of source site ids to destination site ids
+            new_value = []
+            for pk in value:
                 try:
-                    value = self.object_data['fields'][field.name]
+                    new_pk = context.destination_ids_by_source[(target_model, pk)]
                 except KeyError:
                     continue
-                target_model = get_base_model(field.related_model)
-
-                # translate list of source site ids to destination site ids
-                new_value = []
-                for pk in value:
-                    try:
-                        new_pk = context.destination_ids_by_source[(target_model, pk)]
-                    except KeyError:
-                        continue
-                    new_value.append(new_pk)
+                new_value.append(new_pk)
 
-                getattr(self.instance, field.get_attname()).set(new_value)
-                save_needed = True
+            getattr(self.instance, field.get_attname()).set(new_value)
+            save_needed = True
         if save_needed:
             # _save() for creating a page may attempt to re-add it as a child, so the instance (assumed to be already
             # in the tree) is saved directly
@@ -670,16 +1307,52 @@ class SaveOperationMixin:
     def _save(self, context):
         self.instance.save()
 
+    def get_file_transfers(self):
+        """
+        Return a set of File objects for the files that need to be downloaded for this operation
+        """
+        files = set()
+        for field, adapter in self.model_plan.file_transfer_adapters:
+            try:
+                value = self.field_values[field.name]
+            except KeyError:
+                continue
+
+            files.update(adapter.get_file_transfers(self.instance, value))
+
+        return files
+
+    def _record_content_hash(self, context):
+        """
+        Record the content hash of the imported data, so that a future import of identical data
+        can skip updating this object. If any referenced objects could not be found at the
+        destination, or any of the object's files could not be downloaded, the hash is recorded as
+        blank, so that the references and files are retried next time.
+        """
+        content_hash = self.object_data.get('content_hash')
+        if not content_hash:
+            return
+
+        if not all(
+            (model, source_id) in context.destination_ids_by_source
+            for model, source_id, is_hard_dep in self.dependencies
+        ):
+            content_hash = ''
+        elif context.failed_file_transfers and any(
+            file.source_url in context.failed_file_transfers for file in self.get_file_transfers()
+        ):
+            content_hash = ''
+
+        context.imported_content_hashes[(self.base_model, self.object_data['pk'])] = content_hash
+
     @cached_property
     def dependencies(self):
         # the set of objects that must be created before we can import this object
         deps = super().dependencies
 
-        for field in self.model._meta.get_fields():
-            val = self.object_data['fields'].get(field.name)
-            adapter = adapter_registry.get_field_adapter(field)
-            if adapter:
-                deps.update(adapter.get_dependencies(val))
+        for field, adapter in self.model_plan.dependency_adapters:
+            val = self.field_values.get(field.name)
+            deps.update(adapter.get_dependencies(val))
 
         return deps
 
@@ -687,11 +1360,9 @@ class SaveOperationMixin:
         # the set of objects that must be deleted when we import this object
 
         deletions = super().deletions(context)
-        for field in self.model._meta.get_fields():
-            val = self.object_data['fields'].get(field.name)
-            adapter = adapter_registry.get_field_adapter(field)
-            if adapter:
-                deletions.update(adapter.get_object_deletions(self.instance, val, context))
+        for field, adapter in self.model_plan.deletion_adapters:
+            val = self.field_values.get(field.name)
+            deletions.update(adapter.get_object_deletions(self.instance, val, context))
 
         return deletions
 
@@ -711,6 +1382,7 @@ class CreateModel(SaveOperationMixin, Operation):
         # record the UID for the newly created page
         uid = context.uids_by_source[(self.base_model, self.object_data['pk'])]
         get_locator_for_model(self.base_model).attach_uid(self.instance, uid)
+        self._record_content_hash(context)
 
         # Also add it to destination_ids_by_source mapping
         source_pk = self.object_data['pk']
@@ -745,10 +1417,15 @@ class CreateTreeModel(CreateModel):
             source_parent_id = self.object_data['parent_id']
             self.destination_parent_id = context.destination_ids_by_source[(get_base_model(self.model), source_parent_id)]
 
-        parent = get_base_model(self.model).objects.get(id=self.destination_parent_id)
+        if TreeBuilder.can_bulk_insert(self.base_model):
+            context.tree_builder.add_child(
+                self.base_model, self.destination_parent_id, self.instance, self.object_data['pk']
+            )
+        else:
+            parent = self.base_model.objects.get(id=self.destination_parent_id)
 
-        # Add the page to the database as a child of parent
-        parent.add_child(instance=self.instance)
+            # Add the page to the database as a child of parent
+            parent.add_child(instance=self.instance)
 
 
 class UpdateModel(SaveOperationMixin, Operation):
@@ -761,6 +1438,11 @@ class UpdateModel(SaveOperationMixin, Operation):
         self._populate_fields(context)
         self._save(context)
         self._populate_many_to_many_fields(context)
+        self._record_content_hash(context)
+
+        if isinstance(self.instance, MP_Node):
+            # the node may have changed in ways that affect its children (e.g. a new url_path)
+            context.tree_builder.invalidate(self.base_model, self.instance.pk)
 
 
 class DeleteModel(Operation):
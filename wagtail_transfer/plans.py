@@ -0,0 +1,208 @@
+"""
+Serialization of ImportPlanner state, so that an import can be planned once and the plan saved
+(for example, to disk or a cache) to be inspected or run later, without fetching the data from
+the source site again.
+
+The state is serialized as compact JSON, in which models are identified by their labels and
+operations by descriptors; see dump_plan for the format. A plan only remains valid for as long
+as the objects it refers to at the destination are unchanged - for example, objects to be
+updated or deleted are fetched again by ID when the plan is loaded, and any that no longer exist
+are dropped from the plan.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .locators import get_locator_for_model
+from .models import get_base_model, get_base_model_for_path, get_model_for_path
+from .operations import CreateModel, CreateTreeModel, DeleteModel, ImportPlanner, Objective, UpdateModel
+
+# Version of the serialization format; plans saved in any other version cannot be loaded
+PLAN_FORMAT_VERSION = 1
+
+
+class PlanFormatError(Exception):
+    pass
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _dump_keys(keys):
+    # (model, source_id) pairs, as [model_label, source_id]
+    return [[_label(model), source_id] for model, source_id in keys]
+
+
+def _load_keys(items):
+    return {(get_base_model_for_path(model_path), source_id) for model_path, source_id in items}
+
+
+def _dump_key_mapping(mapping):
+    # mappings from (model, source_id) pairs, as [model_label, source_id, value]
+    return [[_label(model), source_id, value] for (model, source_id), value in mapping.items()]
+
+
+def _load_key_mapping(items):
+    return {
+        (get_base_model_for_path(model_path), source_id): value
+        for model_path, source_id, value in items
+    }
+
+
+def _dump_operation(operation):
+    """
+    Return a descriptor for an operation: a list of [type, model_label, id, ...], where id is the
+    object's source ID for create and update operations, and its destination ID for deletions
+    """
+    if isinstance(operation, CreateTreeModel):
+        return ['create_tree', operation.object_data['model'], operation.object_data['pk'], operation.destination_parent_id]
+    elif isinstance(operation, CreateModel):
+        return ['create', operation.object_data['model'], operation.object_data['pk']]
+    elif isinstance(operation, UpdateModel):
+        return ['update', operation.object_data['model'], operation.object_data['pk'], operation.instance.pk]
+    elif isinstance(operation, DeleteModel):
+        return ['delete', _label(type(operation.instance)), operation.instance.pk]
+    else:
+        raise PlanFormatError("Cannot serialize operation %r" % operation)
+
+
+def _load_operation(descriptor, object_data_by_source):
+    """
+    Return the operation for a descriptor returned by _dump_operation, or None if it refers to an
+    object at the destination that no longer exists
+    """
+    operation_type, model_path, id = descriptor[:3]
+    model = get_model_for_path(model_path)
+
+    if operation_type in ('create', 'create_tree', 'update'):
+        object_data = object_data_by_source[(get_base_model(model), id)]
+        if operation_type == 'create':
+            return CreateModel(model, object_data)
+        elif operation_type == 'create_tree':
+            return CreateTreeModel(model, object_data, descriptor[3])
+
+        instance = model.objects.filter(pk=descriptor[3]).first()
+        return None if instance is None else UpdateModel(instance, object_data)
+
+    elif operation_type == 'delete':
+        instance = model.objects.filter(pk=id).first()
+        return None if instance is None else DeleteModel(instance)
+
+    raise PlanFormatError("Unrecognised operation type %r" % operation_type)
+
+
+def dump_plan(planner):
+    """
+    Serialize the state of an ImportPlanner as a JSON string
+    """
+    context = planner.context
+
+    operations = list(planner.operations)
+    operation_indexes = {operation: index for index, operation in enumerate(operations)}
+
+    def operation_index(operation):
+        # operations are referred to by their index in the 'operations' list, or None
+        return None if operation is None else operation_indexes[operation]
+
+    return json.dumps({
+        'version': PLAN_FORMAT_VERSION,
+        'import_type': planner.import_type,
+        'root_page_source_pk': getattr(planner, 'root_page_source_pk', None),
+        'destination_parent_id': getattr(planner, 'destination_parent_id', None),
+        'model': getattr(planner, 'model', None),
+        'objects': list(planner.object_data_by_source.values()),
+        'uids': [
+            [_label(model), source_id, uid]
+            for (model, source_id), uid in context.uids_by_source.items()
+        ],
+        'destination_ids': _dump_key_mapping(context.destination_ids_by_source),
+        'missing_at_destination': _dump_keys(context.missing_at_destination),
+        'content_hashes': _dump_key_mapping(context.content_hashes_by_source),
+        'objectives': [
+            [_label(objective.model), objective.source_id, objective.must_update, objective in planner.unhandled_objectives]
+            for objective in planner.objectives
+        ],
+        'tasks': [[action, _label(model), source_id] for action, model, source_id in planner.tasks],
+        'postponed_tasks': [[action, _label(model), source_id] for action, model, source_id in planner.postponed_tasks],
+        'missing_object_data': _dump_keys(planner.missing_object_data),
+        'really_missing_object_data': _dump_keys(planner.really_missing_object_data),
+        'base_import_ids': _dump_keys(planner.base_import_ids),
+        'failed_creations': _dump_keys(planner.failed_creations),
+        'unchanged_objects': _dump_key_mapping(planner.unchanged_objects),
+        'operations': [_dump_operation(operation) for operation in operations],
+        'resolutions': [
+            [_label(model), source_id, operation_index(operation)]
+            for (model, source_id), operation in planner.resolutions.items()
+        ],
+        'task_resolutions': [
+            [action, _label(model), source_id, operation_index(operation)]
+            for (action, model, source_id), operation in planner.task_resolutions.items()
+        ],
+    }, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def load_plan(json_data):
+    """
+    Return an ImportPlanner with the state serialized by dump_plan
+    """
+    data = json.loads(json_data)
+    if data.get('version') != PLAN_FORMAT_VERSION:
+        raise PlanFormatError("Unsupported import plan version: %r" % data.get('version'))
+
+    if data['import_type'] == 'page':
+        planner = ImportPlanner.for_page(data['root_page_source_pk'], data['destination_parent_id'])
+    else:
+        planner = ImportPlanner.for_model(data['model'])
+    context = planner.context
+
+    for object_data in data['objects']:
+        planner._add_object_data_to_lookup(object_data)
+
+    for model_path, source_id, uid in data['uids']:
+        model = get_base_model_for_path(model_path)
+        context.uids_by_source[(model, source_id)] = get_locator_for_model(model).uid_from_json(uid)
+
+    context.destination_ids_by_source = _load_key_mapping(data['destination_ids'])
+    context.missing_at_destination = _load_keys(data['missing_at_destination'])
+    context.content_hashes_by_source = _load_key_mapping(data['content_hashes'])
+
+    for model_path, source_id, must_update, unhandled in data['objectives']:
+        objective = Objective(get_base_model_for_path(model_path), source_id, context, must_update=must_update)
+        planner.objectives.add(objective)
+        if unhandled:
+            planner.unhandled_objectives.add(objective)
+
+    planner.tasks = {
+        (action, get_base_model_for_path(model_path), source_id)
+        for action, model_path, source_id in data['tasks']
+    }
+    planner.postponed_tasks = {
+        (action, get_base_model_for_path(model_path), source_id)
+        for action, model_path, source_id in data['postponed_tasks']
+    }
+    planner.missing_object_data = _load_keys(data['missing_object_data'])
+    planner.really_missing_object_data = _load_keys(data['really_missing_object_data'])
+    planner.base_import_ids = _load_keys(data['base_import_ids'])
+    planner.failed_creations = _load_keys(data['failed_creations'])
+    planner.unchanged_objects = _load_key_mapping(data['unchanged_objects'])
+
+    operations = [
+        _load_operation(descriptor, planner.object_data_by_source)
+        for descriptor in data['operations']
+    ]
+    planner.operations = {operation for operation in operations if operation is not None}
+
+    # operations that could not be loaded (because their object no longer exists at the
+    # destination) are only ever update and delete operations, which nothing depends on
+    planner.resolutions = {
+        (get_base_model_for_path(model_path), source_id): None if index is None else operations[index]
+        for model_path, source_id, index in data['resolutions']
+    }
+    planner.task_resolutions = {
+        (action, get_base_model_for_path(model_path), source_id): None if index is None else operations[index]
+        for action, model_path, source_id, index in data['task_resolutions']
+    }
+
+    return planner
@@ -0,0 +1,142 @@
+"""
+Creation of page revisions for imported pages, performed in bulk once all import operations have
+completed.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from modelcluster.queryset import FakeQuerySet
+from wagtail.core.models import COMMENTS_RELATION_NAME, Page, PageRevision
+from wagtail.search import index
+
+from .locators import ID_LOOKUP_BATCH_SIZE, batched
+
+# Page.save_revision logs each revision to this logger
+wagtail_logger = logging.getLogger('wagtail.core')
+
+# If True, pages whose content is identical to their latest revision do not get a new revision
+SKIP_UNCHANGED_REVISIONS = getattr(settings, 'WAGTAILTRANSFER_SKIP_UNCHANGED_REVISIONS', False)
+
+# Fields in revision content that reflect the page's position or revision / publishing state
+# rather than its content, and so are ignored when checking whether the content has changed
+REVISION_IGNORED_FIELDS = {
+    'path', 'depth', 'numchild', 'url_path', 'draft_title', 'has_unpublished_changes',
+    'latest_revision_created_at', 'live_revision', 'first_published_at', 'last_published_at',
+    'locked', 'locked_at', 'locked_by',
+}
+
+
+def _get_comparable_content(content_json):
+    content = json.loads(content_json)
+    for field_name in REVISION_IGNORED_FIELDS:
+        content.pop(field_name, None)
+    return content
+
+
+def _get_latest_revision_content(pages):
+    """
+    Return a dict mapping page IDs to the content_json of their latest revision, for the given
+    pages
+    """
+    page_ids = [page.pk for page in pages]
+    latest_revision_ids = []
+    for batch in batched(page_ids, ID_LOOKUP_BATCH_SIZE):
+        latest_revision_ids.extend(
+            PageRevision.objects.filter(page_id__in=batch)
+            .values('page_id').annotate(latest_id=Max('id'))
+            .values_list('latest_id', flat=True)
+        )
+
+    return {
+        revision.page_id: revision.content_json
+        for revision in PageRevision.objects.in_bulk(latest_revision_ids).values()
+    }
+
+
+def _has_unsaved_comments(page):
+    # comments are only held in memory (as a FakeQuerySet) once the relation has been assigned to;
+    # otherwise, the relation is a lazy queryset of saved comments, and checking it makes no query
+    comments = getattr(page, COMMENTS_RELATION_NAME).all()
+    return isinstance(comments, FakeQuerySet) and any(comment.pk is None for comment in comments)
+
+
+def _can_save_revision_in_bulk(page):
+    return (
+        type(page).save_revision is Page.save_revision
+        and not getattr(page, 'alias_of_id', None)
+        and not _has_unsaved_comments(page)
+    )
+
+
+def save_revisions(pages, skip_unchanged=None, clean=True):
+    """
+    Create a new revision for each of the given (saved) pages, equivalent to calling
+    save_revision() on each one, but writing the revision records with a single bulk insert
+    and updating the pages' revision metadata with a single bulk update.
+
+    If skip_unchanged is True (defaulting to the WAGTAILTRANSFER_SKIP_UNCHANGED_REVISIONS
+    setting), pages whose content matches their latest revision are left without a new revision.
+
+    If clean is True, each page is validated with full_clean() first, as save_revision() does.
+    Pass clean=False for pages that have just been saved with Page.save(), which validates them.
+
+    Pages with a custom save_revision method, and pages with comments that have not been saved
+    yet (which save_revision() saves and links to the new revision), have save_revision() called
+    individually instead. For the other pages, the differences from save_revision() are:
+    * the pages' revision metadata is updated without sending the pre_save and post_save signals,
+      although the pages are updated in the search index as the post_save signal would
+    * the pages' 'Page edited' log messages are written once the revisions are created, with the
+      revision ids only where the database backend reports the ids of bulk-inserted rows
+    """
+    if skip_unchanged is None:
+        skip_unchanged = SKIP_UNCHANGED_REVISIONS
+
+    bulk_pages = []
+    for page in pages:
+        if _can_save_revision_in_bulk(page):
+            bulk_pages.append(page)
+        else:
+            page.save_revision(clean=clean)
+
+    if not bulk_pages:
+        return
+
+    if clean:
+        for page in bulk_pages:
+            page.full_clean()
+
+    content_by_page = [(page, page.to_json()) for page in bulk_pages]
+
+    if skip_unchanged:
+        latest_content = _get_latest_revision_content(bulk_pages)
+        content_by_page = [
+            (page, content_json) for page, content_json in content_by_page
+            if page.pk not in latest_content
+            or _get_comparable_content(content_json) != _get_comparable_content(latest_content[page.pk])
+        ]
+
+    created_at = timezone.now()
+    revisions = PageRevision.objects.bulk_create([
+        PageRevision(page_id=page.pk, content_json=content_json, created_at=created_at)
+        for page, content_json in content_by_page
+    ], batch_size=ID_LOOKUP_BATCH_SIZE)
+
+    updated_pages = []
+    for page, content_json in content_by_page:
+        page.latest_revision_created_at = created_at
+        page.draft_title = page.title
+        page.has_unpublished_changes = True
+        updated_pages.append(page)
+
+    Page.objects.bulk_update(
+        updated_pages, ['latest_revision_created_at', 'draft_title', 'has_unpublished_changes'],
+        batch_size=ID_LOOKUP_BATCH_SIZE
+    )
+
+    for page, revision in zip(updated_pages, revisions):
+        index.insert_or_update_object(page)
+        wagtail_logger.info("Page edited: \"%s\" id=%d revision_id=%s", page.title, page.id, revision.id)
@@ -1,94 +1,138 @@
 import re
-from functools import partial
 
 from wagtail.core.rich_text import features
-from wagtail.core.rich_text.rewriters import extract_attrs
+from wagtail.core.rich_text.rewriters import FIND_ATTRS
 
 from .models import get_base_model
 
-FIND_A_TAG = re.compile(r'<a(\b[^>]*)>(.*?)</a>')
-FIND_EMBED_TAG = re.compile(r'<embed(\b[^>]*)/>')
-FIND_ID = re.compile(r'id="([^"]*)"')
+# Matches both kinds of reference tag in a single pass: <a linktype="..."> tags, with their inner
+# contents (groups 1 and 2), and <embed embedtype="..."/> tags (group 3). Nested <a> tags are
+# illegal, so the first </a> always closes the tag.
+FIND_REFERENCE_TAG = re.compile(r'<(?:a(\b[^>]*)>(.*?)</a>|embed(\b[^>]*)/>)')
+# Matches the value of an id attribute within a tag's attributes
+FIND_ID_VALUE = re.compile(r'(?<![\w-])id="([^"]*)"')
 
 
-class RichTextReferenceHandler:
+class RichTextReferenceScanner:
     """
-    Handles updating ids and retrieving object references for <tag type_attribute="foo" id="my_id" /> tags representing references within rich text. Tags are found using a regex tag_matcher, and their
-    specific handler (eg PageLinkHandler) is looked up using a dict, handlers, which maps the value of type_attribute (where type_attribute might be emebedtype)
-    to a specific handler.
+    Finds object references within rich text, and updates their ids from source to destination
+    Wagtail instance. References are <a linktype="foo" id="my_id"> and <embed embedtype="foo"
+    id="my_id"/> tags, where foo is a link or embed type registered with Wagtail whose handler
+    has a model (eg PageLinkHandler).
 
-    The tag matcher must be a compiled regular expression where the first matching group is the tag's body (ie its attributes) and the second the tag's inner contents (if any).
-    Note this only works for tags which cannot be nested inside the same tag, so this works fine for eg matching <a> tags since nested <a> tags are illegal.
+    Links and embeds are found in a single scan of the HTML. The models for each link and embed
+    type are resolved once, up front, from the handlers given as dicts mapping type to handler.
     """
-    def __init__(self, handlers, tag_matcher, type_attribute, destination_ids_by_source={}):
-        self.handlers = handlers
-        self.tag_matcher = tag_matcher
-        self.type_attribute = type_attribute
-        self.destination_ids_by_source = destination_ids_by_source
-
-    def update_tag_id(self, match, destination_ids_by_source):
-        # Updates a specific tag's id from source to destination Wagtail instance, or removes the tag if no id mapping exists
-        tag_body = match.group(1)
-        attrs = extract_attrs(tag_body)
-        try:
-            handler = self.handlers[attrs[self.type_attribute]]
-            target_model = get_base_model(handler.get_model())
-            new_id = destination_ids_by_source.get((target_model, int(attrs['id'])))
-            if new_id is None:
-                # Return the tag's inner contents, effectively removing the tag
+    def __init__(self, link_handlers, embed_handlers):
+        # mapping of (type_attribute, type) to the base model of the objects referenced
+        self.models_by_type = {}
+        for type_attribute, handlers in [('linktype', link_handlers), ('embedtype', embed_handlers)]:
+            for type_name, handler in handlers.items():
                 try:
-                    return match.group(2)
-                except IndexError:
-                    # The tag has no inner content, return a blank string instead
-                    return ''
-            # Otherwise update the id and construct the new tag string
-            new_tag_body = FIND_ID.sub('id="{0}"'.format(str(new_id)), tag_body)
-            tag_body_offset = match.start(0)
-            new_tag_string = match.group(0)[:(match.start(1)-tag_body_offset)] + new_tag_body + match.group(0)[(match.end(1)-tag_body_offset):]
-            return new_tag_string
-        except KeyError:
-            # If the relevant handler cannot be found, don't update the tag id
+                    model = handler.get_model()
+                except NotImplementedError:
+                    # handlers without a model (eg for external links) do not refer to objects
+                    continue
+                self.models_by_type[(type_attribute, type_name)] = get_base_model(model)
+
+    def _get_reference(self, match):
+        """
+        Return a (model, id) tuple for the object referenced by a tag matched by
+        FIND_REFERENCE_TAG, or None if it does not refer to an object
+        """
+        tag_body = match.group(1)
+        if tag_body is not None:
+            type_attribute = 'linktype'
+        else:
+            tag_body = match.group(3)
+            type_attribute = 'embedtype'
+
+        if type_attribute not in tag_body:
+            # eg a plain link to a URL
+            return None
+
+        # as in wagtail.core.rich_text.rewriters.extract_attrs, the last occurrence of an
+        # attribute takes precedence
+        attrs = dict(FIND_ATTRS.findall(tag_body))
+        model = self.models_by_type.get((type_attribute, attrs.get(type_attribute)))
+        if model is None or 'id' not in attrs:
+            return None
+        return (model, int(attrs['id']))
+
+    def _get_id_span(self, match):
+        # Return the start and end positions of the (last) id attribute value in a tag matched by
+        # FIND_REFERENCE_TAG
+        group = 1 if match.group(1) is not None else 3
+        for id_match in FIND_ID_VALUE.finditer(match.group(group)):
             pass
-        return match.group(0)
+        offset = match.start(group)
+        return offset + id_match.start(1), offset + id_match.end(1)
 
     def get_objects(self, html):
-        # Gets object references
+        # Gets object references, as a set of (model, id) tuples
         objects = set()
-        if html:
-            for match in self.tag_matcher.finditer(html):
-                attrs = extract_attrs(match.group(1))
-                try:
-                    handler = self.handlers[attrs[self.type_attribute]]
-                    objects.add((get_base_model(handler.get_model()), int(attrs['id'])))
-                except KeyError:
-                    # If no handler can be found, no object reference can be added.
-                    # This might occur when the link is a plain url
-                    pass
-        return objects
+        if not html:
+            return objects
 
-    def update_ids(self, html, destination_ids_by_source):
-        # Update source instance ids to destination instance ids when possible
-        if html is None:
-            return None
-        else:
-            return self.tag_matcher.sub(partial(self.update_tag_id, destination_ids_by_source=destination_ids_by_source), html)
+        for match in FIND_REFERENCE_TAG.finditer(html):
+            reference = self._get_reference(match)
+            if reference is not None:
+                objects.add(reference)
 
+            # embeds within a link's contents are not matched by the scan of the outer HTML
+            content = match.group(2)
+            if content and '<embed' in content:
+                objects.update(self.get_objects(content))
 
-class MultiTypeRichTextReferenceHandler:
-    """Handles retrieving object references and updating ids for several different kinds of tags in rich text"""
-    def __init__(self, handlers):
-        self.handlers = handlers
+        return objects
 
     def update_ids(self, html, destination_ids_by_source):
-        for handler in self.handlers:
-            html = handler.update_ids(html, destination_ids_by_source)
-        return html
+        """
+        Update source instance ids to destination instance ids when possible. Tags referring to
+        objects with no id mapping are removed, leaving their inner contents (if any).
+        """
+        if not html:
+            return html
+
+        # the HTML is rebuilt from the unchanged stretches between the id values and removed tags,
+        # with one splice per updated tag
+        pieces = []
+        position = 0
+
+        for match in FIND_REFERENCE_TAG.finditer(html):
+            reference = self._get_reference(match)
+            content = match.group(2)
+
+            if reference is None:
+                if content and '<embed' in content:
+                    pieces.append(html[position:match.start(2)])
+                    pieces.append(self.update_ids(content, destination_ids_by_source))
+                    position = match.end(2)
+                continue
+
+            new_id = destination_ids_by_source.get(reference)
+            if new_id is None:
+                # remove the tag, keeping its inner contents
+                pieces.append(html[position:match.start()])
+                if content:
+                    pieces.append(self.update_ids(content, destination_ids_by_source))
+                position = match.end()
+                continue
 
-    def get_objects(self, html):
-        objects = set()
-        for handler in self.handlers:
-            objects = objects.union(handler.get_objects(html))
-        return objects
+            id_start, id_end = self._get_id_span(match)
+            pieces.append(html[position:id_start])
+            pieces.append(str(new_id))
+            position = id_end
+
+            if content and '<embed' in content:
+                pieces.append(html[position:match.start(2)])
+                pieces.append(self.update_ids(content, destination_ids_by_source))
+                position = match.end(2)
+
+        if not pieces:
+            return html
+        pieces.append(html[position:])
+        return ''.join(pieces)
 
 
 REFERENCE_HANDLER = None
@@ -98,10 +142,5 @@ def get_reference_handler():
     global REFERENCE_HANDLER
 
     if not REFERENCE_HANDLER:
-        embed_handlers = features.get_embed_types()
-        link_handlers = features.get_link_types()
-        REFERENCE_HANDLER = MultiTypeRichTextReferenceHandler([
-            RichTextReferenceHandler(link_handlers, FIND_A_TAG, 'linktype'),
-            RichTextReferenceHandler(embed_handlers, FIND_EMBED_TAG, 'embedtype')
-        ])
+        REFERENCE_HANDLER = RichTextReferenceScanner(features.get_link_types(), features.get_embed_types())
     return REFERENCE_HANDLER
@@ -1,7 +1,12 @@
+import hashlib
+import json
+from collections import defaultdict
 from functools import lru_cache
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import prefetch_related_objects
 from django.db.models.constants import LOOKUP_SEP
 from treebeard.mp_tree import MP_Node
 from wagtail.core import hooks
@@ -105,6 +110,18 @@ class ModelSerializer:
         subclasses = _get_subclasses_recurse(self.model)
         return get_subclass_instances(base_queryset, subclasses)
 
+    def prefetch_related(self, instances):
+        """
+        Given a list of instances of this model, fetch the related objects that will be accessed
+        when serializing them, using one query per relation for the whole list
+        """
+        lookups = []
+        for field_adapter in self.field_adapters:
+            lookups.extend(field_adapter.get_prefetch_lookups())
+
+        if lookups:
+            prefetch_related_objects(instances, *lookups)
+
     def serialize_fields(self, instance):
         return {
             field_adapter.name: field_adapter.serialize(instance)
@@ -137,6 +154,27 @@ class ModelSerializer:
 class TreeModelSerializer(ModelSerializer):
     ignored_fields = ['path', 'depth', 'numchild']
 
+    def prefetch_related(self, instances):
+        super().prefetch_related(instances)
+
+        # Fetch the parents of all instances in a single query, and populate treebeard's cache of
+        # the parent object so that get_parent does not query for them individually
+        parent_paths = {
+            instance.path[:-instance.steplen]
+            for instance in instances
+            if not hasattr(instance, '_cached_parent_obj') and not instance.is_root()
+        }
+        if not parent_paths:
+            return
+
+        parents_by_path = self.base_model.objects.in_bulk(parent_paths, field_name='path')
+        for instance in instances:
+            if instance.is_root():
+                continue
+            parent = parents_by_path.get(instance.path[:-instance.steplen])
+            if parent is not None:
+                instance._cached_parent_obj = parent
+
     def serialize(self, instance):
         result = super().serialize(instance)
         if instance.is_root():
@@ -168,6 +206,45 @@ class PageSerializer(TreeModelSerializer):
         return self.model.objects.filter(pk__in=ids).specific()
 
 
+def get_content_hash(object_data):
+    """
+    Return a hash of an object's serialized data, which will be identical on subsequent exports
+    for as long as the object remains unchanged
+    """
+    content = json.dumps(object_data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def serialize_many(instances):
+    """
+    Serialize a collection of model instances, grouped by model so that the related objects
+    needed for each group can be fetched in bulk. Returns a tuple of:
+    * a list of serialized objects, each including a 'content_hash' of its data
+    * a set of (model_class, id) pairs for all objects referenced by them
+    * a set of further instances that should be serialized alongside them
+    """
+    instances_by_model = defaultdict(list)
+    for instance in instances:
+        instances_by_model[type(instance)].append(instance)
+
+    objects = []
+    object_references = set()
+    objects_to_serialize = set()
+
+    for model, model_instances in instances_by_model.items():
+        serializer = serializer_registry.get_model_serializer(model)
+        serializer.prefetch_related(model_instances)
+
+        for instance in model_instances:
+            object_data = serializer.serialize(instance)
+            object_data['content_hash'] = get_content_hash(object_data)
+            objects.append(object_data)
+            object_references.update(serializer.get_object_references(instance))
+            objects_to_serialize.update(serializer.get_objects_to_serialize(instance))
+
+    return objects, object_references, objects_to_serialize
+
+
 class SerializerRegistry:
     BASE_SERIALIZERS_BY_MODEL_CLASS = {
         models.Model: ModelSerializer,
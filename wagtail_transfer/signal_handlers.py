@@ -0,0 +1,50 @@
+from functools import lru_cache
+
+from django.db import models
+from django.db.models.signals import post_save, pre_save
+
+from .files import has_own_file_metadata, hash_file_chunks, record_file_metadata
+
+
+@lru_cache(maxsize=None)
+def get_tracked_file_fields(model):
+    """
+    Return the file fields of the given model whose size and hash should be recorded in
+    FileMetadata when they are saved
+    """
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and not has_own_file_metadata(model, field)
+    ]
+
+
+def get_new_file_metadata(sender, instance, raw=False, **kwargs):
+    # Find the size and hash of any newly uploaded files, while their contents are still at hand
+    if raw:
+        return
+
+    new_file_metadata = {}
+    for field in get_tracked_file_fields(sender):
+        file = field.value_from_object(instance)
+        if file and not file._committed:
+            new_file_metadata[field] = (file.size, hash_file_chunks(file.file))
+
+    if new_file_metadata:
+        instance._wagtailtransfer_new_file_metadata = new_file_metadata
+
+
+def record_new_file_metadata(sender, instance, raw=False, **kwargs):
+    # The files have now been saved to storage, so we know the names they are stored under
+    new_file_metadata = getattr(instance, '_wagtailtransfer_new_file_metadata', None)
+    if not new_file_metadata:
+        return
+
+    for field, (size, hash) in new_file_metadata.items():
+        record_file_metadata(field.value_from_object(instance).name, size, hash)
+
+    instance._wagtailtransfer_new_file_metadata = {}
+
+
+def register_signal_handlers():
+    pre_save.connect(get_new_file_metadata)
+    post_save.connect(record_new_file_metadata)
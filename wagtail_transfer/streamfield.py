@@ -28,8 +28,10 @@ def get_object_references(stream_block, stream):
     to the StreamChild object format to prevent ChooserBlocks trying to load nonexistent models with old ids upon to_python
     being called"""
     references = set()
-    get_references = partial(get_references_using_handler, references=references)
     stream_block_handler = get_block_handler(stream_block)
+    if not stream_block_handler.has_references:
+        return references
+    get_references = partial(get_references_using_handler, references=references)
     try:
         stream_block_handler.map_over_json(stream, get_references)
     except ValidationError:
@@ -37,23 +39,35 @@ def get_object_references(stream_block, stream):
     return references
 
 
-def update_object_ids(stream_block, stream, destination_ids_by_source):
+def update_object_ids(stream_block, stream, destination_ids_by_source, in_place=False):
     """Loops over list-of-dicts formatted StreamField (stream) to update object references. This format is used as opposed
     to the StreamChild object format to prevent ChooserBlocks trying to load nonexistent models with old ids upon to_python
-    being called"""
-    update_ids = partial(update_ids_using_handler, destination_ids_by_source=destination_ids_by_source)
+    being called. If in_place is True, the lists and dicts of stream are updated rather than copied; the updated stream
+    is returned either way"""
     stream_block_handler = get_block_handler(stream_block)
+    if not stream_block_handler.has_references:
+        return stream
+    update_ids = partial(update_ids_using_handler, destination_ids_by_source=destination_ids_by_source)
     try:
-        updated_stream = stream_block_handler.map_over_json(stream, update_ids)
+        updated_stream = stream_block_handler.map_over_json(stream, update_ids, in_place=in_place)
     except ValidationError:
         updated_stream = []
     return updated_stream
 
 
 class BaseBlockHandler:
-    """Base class responsible for finding object references and updating ids for StreamField blocks"""
+    """
+    Base class responsible for finding object references and updating ids for StreamField blocks.
+
+    Handlers are created once per block (see get_block_handler), and form a tree mirroring the
+    block definition, so that a traversal of a StreamField value need not look up the handler
+    for each element. has_references records whether the block's values can contain object
+    references at all: values of blocks without references are left as they are, and never
+    traversed.
+    """
 
     empty_value = None
+    has_references = False
 
     def __init__(self, block):
         self.block = block
@@ -70,10 +84,12 @@ class BaseBlockHandler:
         """
         return value
 
-    def map_over_json(self, stream, func):
+    def map_over_json(self, stream, func, in_place=False):
         """
         Apply a function, func, to each of the base blocks' values (ie not Struct, List, Stream) of a StreamField in
-        list of dicts (imported json) format and return a copy of the rewritten streamfield.
+        list of dicts (imported json) format and return a copy of the rewritten streamfield - or, if in_place is True,
+        the streamfield itself, rewritten in place. Values of child blocks that cannot contain references are copied
+        unchanged, without applying func.
         """
         value = func(self.block, stream)
         if self.block.required and value is None:
@@ -82,16 +98,23 @@ class BaseBlockHandler:
 
 
 class ListBlockHandler(BaseBlockHandler):
-    def map_over_json(self, stream, func):
+    def __init__(self, block):
+        super().__init__(block)
+        self.child_handler = get_block_handler(block.child_block)
+        self.has_references = self.child_handler.has_references
+
+    def map_over_json(self, stream, func, in_place=False):
         updated_stream = []
-        new_block = self.block.child_block
-        new_block_handler = get_block_handler(new_block)
+        new_block_handler = self.child_handler
         for element in stream:
             try:
-                new_value = new_block_handler.map_over_json(element, func)
+                new_value = new_block_handler.map_over_json(element, func, in_place=in_place)
                 updated_stream.append(new_value)
             except ValidationError:
                 pass
+        if in_place:
+            stream[:] = updated_stream
+            return stream
         return updated_stream
 
     @property
@@ -99,21 +122,41 @@ class ListBlockHandler(BaseBlockHandler):
         return []
 
 
-class StreamBlockHandler(BaseBlockHandler):
-    def map_over_json(self, stream, func):
+class StructuralBlockHandler(BaseBlockHandler):
+    """Base class for handlers of blocks with named child blocks (StreamBlock and StructBlock)"""
+
+    def __init__(self, block):
+        super().__init__(block)
+        self.child_handlers = {
+            name: get_block_handler(child_block) for name, child_block in block.child_blocks.items()
+        }
+        self.has_references = any(handler.has_references for handler in self.child_handlers.values())
+
+
+class StreamBlockHandler(StructuralBlockHandler):
+    def map_over_json(self, stream, func, in_place=False):
         updated_stream = []
         for element in stream:
-            new_block = self.block.child_blocks.get(element['type'])
-            new_block_handler = get_block_handler(new_block)
+            new_block_handler = self.child_handlers.get(element['type'])
+            if new_block_handler is None or not new_block_handler.has_references:
+                updated_stream.append(element)
+                continue
             new_stream = element['value']
             try:
-                new_value = new_block_handler.map_over_json(new_stream, func)
-                updated_stream.append({'type': element['type'], 'value': new_value, 'id': element['id']})
+                new_value = new_block_handler.map_over_json(new_stream, func, in_place=in_place)
+                if in_place:
+                    element['value'] = new_value
+                    updated_stream.append(element)
+                else:
+                    updated_stream.append({'type': element['type'], 'value': new_value, 'id': element['id']})
             except ValidationError:
                 # Omit the block if a required field was left blank due to the import
                 pass
         if self.block.required and not updated_stream:
             raise ValidationError('This block requires a value')
+        if in_place:
+            stream[:] = updated_stream
+            return stream
         return updated_stream
 
     @property
@@ -121,17 +164,21 @@ class StreamBlockHandler(BaseBlockHandler):
         return []
 
 
-class StructBlockHandler(BaseBlockHandler):
+class StructBlockHandler(StructuralBlockHandler):
     remove_if_empty = True
 
-    def map_over_json(self, stream, func):
-        updated_stream = {}
+    def map_over_json(self, stream, func, in_place=False):
+        # values are only replaced, never added or removed, so the dict can be updated while iterating over it
+        updated_stream = stream if in_place else {}
         for key in stream:
-            new_block = self.block.child_blocks.get(key)
-            new_block_handler = get_block_handler(new_block)
+            new_block_handler = self.child_handlers.get(key)
             new_stream = stream[key]
+            if new_block_handler is None or not new_block_handler.has_references:
+                updated_stream[key] = new_stream
+                continue
+            new_block = new_block_handler.block
             try:
-                new_value = new_block_handler.map_over_json(new_stream, func)
+                new_value = new_block_handler.map_over_json(new_stream, func, in_place=in_place)
             except ValidationError:
                 if new_block.required:
                     raise ValidationError('This block requires a value for {}'.format(new_block))
@@ -143,6 +190,8 @@ class StructBlockHandler(BaseBlockHandler):
 
 
 class RichTextBlockHandler(BaseBlockHandler):
+    has_references = True
+
     def get_object_references(self, value):
         return get_reference_handler().get_objects(value)
 
@@ -152,17 +201,35 @@ class RichTextBlockHandler(BaseBlockHandler):
 
 
 class ChooserBlockHandler(BaseBlockHandler):
+    has_references = True
+
+    def __init__(self, block):
+        super().__init__(block)
+        self.model = get_base_model(block.target_model)
+
     def get_object_references(self, value):
         if value:
-            return {(get_base_model(self.block.target_model), value)}
+            return {(self.model, value)}
         return set()
 
     def update_ids(self, value, destination_ids_by_source):
-        value = destination_ids_by_source.get((get_base_model(self.block.target_model), value))
+        value = destination_ids_by_source.get((self.model, value))
         return value
 
 
+# mapping of id(block) to the handler for that block. Blocks are not hashable, but each handler
+# keeps a reference to its block, so ids cannot be reused by other blocks while they are cached
+BLOCK_HANDLERS = {}
+
+
 def get_block_handler(block):
+    handler = BLOCK_HANDLERS.get(id(block))
+    if handler is None:
+        handler = BLOCK_HANDLERS[id(block)] = create_block_handler(block)
+    return handler
+
+
+def create_block_handler(block):
     # find the handler class for the most specific class in the block's inheritance tree
     for block_class in type(block).__mro__:
         if block_class in HANDLERS_BY_BLOCK_CLASS:
@@ -1,68 +1,171 @@
 import json
+import zlib
 from collections import defaultdict
 
 import requests
 from django.conf import settings
 from django.contrib.auth.decorators import permission_required
-from django.http import Http404, HttpResponse, JsonResponse
+from django.core.exceptions import RequestDataTooBig
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_POST
 from rest_framework import status
 from rest_framework.fields import ReadOnlyField
 from wagtail.core.models import Page
 
 from .auth import check_digest, digest_for_source
+from .client import get_client_for_source
+from .instrumentation import Report
+from .jobs import NDJSON_CONTENT_TYPE, fail_interrupted_jobs, get_import_job_executor
 from .locators import get_locator_for_model
-from .models import get_model_for_path
-from .operations import ImportPlanner
-from .serializers import serializer_registry
+from .models import ImportJob, get_model_for_path
+from .serializers import serialize_many, serializer_registry
 from .vendor.wagtail_admin_api.serializers import AdminPageSerializer
 from .vendor.wagtail_admin_api.views import PagesAdminAPIViewSet
 
 from django.contrib import messages
 from django.contrib.contenttypes.models import ContentType
 
+COMPACT_JSON_DUMPS_PARAMS = {'separators': (',', ':')}
 
-def pages_for_export(request, root_page_id):
-    check_digest(str(root_page_id), request.GET.get('digest', ''))
+# number of instances serialized at a time during an export, so that a model with many instances
+# can be streamed without holding all of their serialized data in memory
+SERIALIZE_CHUNK_SIZE = 100
 
-    root_page = get_object_or_404(Page, id=root_page_id)
 
-    pages = [root_page.specific] if request.GET.get('recursive', 'true') == 'false' else root_page.get_descendants(inclusive=True).specific()
+def get_mappings(object_references, report):
+    """
+    Given a set of (model_class, id) object references, return the list of
+    [model_label, id, uid] mappings to be included in an export, assigning UIDs in bulk
+    for any objects that do not have one yet. The work is recorded in the instrumentation
+    Report report.
+    """
+    ids_by_model = defaultdict(set)
+    for model, pk in object_references:
+        ids_by_model[model].add(pk)
 
-    ids_for_import = [
-        ['wagtailcore.page', page.pk] for page in pages
-    ]
+    mappings = []
+    for model, ids in ids_by_model.items():
+        with report.phase('mappings', model):
+            uids_by_id = get_locator_for_model(model).get_uids_for_local_ids(ids)
+        mappings.extend(
+            [model._meta.label_lower, pk, uid]
+            for pk, uid in uids_by_id.items()
+        )
+    return mappings
 
-    objects = []
-    object_references = set()
 
-    models_to_serialize = set(pages)
+def serialize_objects(models_to_serialize, object_references, report):
+    """
+    Generator yielding the serialized form of each instance in the set models_to_serialize, along
+    with any further objects that the serializers identify as needing to be serialized alongside
+    them (such as child objects). Object references encountered along the way are added to the
+    set object_references, and the work is recorded in the instrumentation Report report.
+
+    Instances are serialized one model at a time, in chunks of SERIALIZE_CHUNK_SIZE, so that
+    their related objects can be fetched in bulk; each chunk's objects are yielded as soon as it
+    has been serialized.
+    """
     serialized_models = set()
 
     while models_to_serialize:
-        model = models_to_serialize.pop()
-        serializer = serializer_registry.get_model_serializer(type(model))
-        objects.append(serializer.serialize(model))
-        object_references.update(serializer.get_object_references(model))
-        models_to_serialize.update(serializer.get_objects_to_serialize(model).difference(serialized_models))
+        model = type(next(iter(models_to_serialize)))
+        batch = {instance for instance in models_to_serialize if type(instance) is model}
+        models_to_serialize.difference_update(batch)
+        serialized_models.update(batch)
 
-    mappings = []
-    for model, pk in object_references:
-        uid = get_locator_for_model(model).get_uid_for_local_id(pk)
-        mappings.append(
-            [model._meta.label_lower, pk, uid]
+        batch = list(batch)
+        for start in range(0, len(batch), SERIALIZE_CHUNK_SIZE):
+            with report.phase('serialize', model):
+                objects, references, further_objects = serialize_many(batch[start:start + SERIALIZE_CHUNK_SIZE])
+            yield from objects
+            object_references.update(references)
+            models_to_serialize.update(further_objects.difference(serialized_models))
+
+
+def stream_ndjson(ids_for_import, objects, object_references, report, json_dumps_params=None):
+    """
+    Generator yielding an export as newline-delimited JSON. Each line is a JSON object with a
+    single key: 'ids_for_import' (sent first), 'object' (one line per serialized object), or
+    'mappings' (sent last, once all object references are known). The instrumentation Report
+    report is finished once the last line has been generated.
+    """
+    json_dumps_params = json_dumps_params or {}
+
+    yield json.dumps({'ids_for_import': ids_for_import}, cls=DjangoJSONEncoder, **json_dumps_params) + '\n'
+
+    for obj in objects:
+        yield json.dumps({'object': obj}, cls=DjangoJSONEncoder, **json_dumps_params) + '\n'
+
+    yield json.dumps(
+        {'mappings': get_mappings(object_references, report)}, cls=DjangoJSONEncoder, **json_dumps_params
+    ) + '\n'
+
+    report.finish()
+
+
+def export_response(request, ids_for_import, models_to_serialize):
+    """
+    Build the API response for an export of the given objects - as a single JSON document by
+    default, or streamed as newline-delimited JSON if the request specifies format=ndjson. If the
+    request specifies compact=true, the JSON is written without indentation or whitespace.
+
+    The time taken and queries made by each phase of the export are recorded in an
+    instrumentation Report, which is also returned in the Server-Timing header of (non-streamed)
+    responses.
+    """
+    report = Report('export')
+    object_references = set()
+    objects = serialize_objects(models_to_serialize, object_references, report)
+
+    compact = request.GET.get('compact') == 'true'
+
+    if request.GET.get('format') == 'ndjson':
+        # newline-delimited JSON is never indented, but may still drop the default separator spacing
+        return StreamingHttpResponse(
+            stream_ndjson(
+                ids_for_import, objects, object_references, report,
+                json_dumps_params=COMPACT_JSON_DUMPS_PARAMS if compact else None
+            ),
+            content_type=NDJSON_CONTENT_TYPE
         )
 
-    return JsonResponse({
-        'ids_for_import': ids_for_import,
-        'mappings': mappings,
-        'objects': objects,
-    }, json_dumps_params={'indent': 2})
+    # objects must be serialized before get_mappings is called, to populate object_references
+    objects = list(objects)
+    mappings = get_mappings(object_references, report)
+
+    with report.phase('encode'):
+        response = JsonResponse({
+            'ids_for_import': ids_for_import,
+            'mappings': mappings,
+            'objects': objects,
+        }, json_dumps_params=COMPACT_JSON_DUMPS_PARAMS if compact else {'indent': 2})
 
+    report.finish()
+    response['Server-Timing'] = report.get_server_timing()
+    return response
 
+
+@gzip_page
+def pages_for_export(request, root_page_id):
+    check_digest(str(root_page_id), request.GET.get('digest', ''))
+
+    root_page = get_object_or_404(Page, id=root_page_id)
+
+    pages = [root_page.specific] if request.GET.get('recursive', 'true') == 'false' else root_page.get_descendants(inclusive=True).specific()
+
+    ids_for_import = [
+        ['wagtailcore.page', page.pk] for page in pages
+    ]
+
+    return export_response(request, ids_for_import, set(pages))
+
+
+@gzip_page
 def models_for_export(request, model_path, object_id=None):
     """
     Return data for a specific model based on the incoming model_path.
@@ -85,35 +188,33 @@ def models_for_export(request, model_path, object_id=None):
         [model_path, obj.pk] for obj in model_objects
     ]
 
-    objects = []
-    object_references = set()
-
-    models_to_serialize = set(model_objects)
-    serialized_models = set()
+    return export_response(request, ids_for_import, set(model_objects))
 
-    while models_to_serialize:
-        model = models_to_serialize.pop()
-        serializer = serializer_registry.get_model_serializer(type(model))
-        objects.append(serializer.serialize(model))
-        object_references.update(serializer.get_object_references(model))
-        models_to_serialize.update(serializer.get_objects_to_serialize(model).difference(serialized_models))
 
-    mappings = []
-    for model, pk in object_references:
-        uid = get_locator_for_model(model).get_uid_for_local_id(pk)
-        mappings.append(
-            [model._meta.label_lower, pk, uid]
-        )
+def decompress_request_body(request):
+    """
+    Return the body of the request, decompressed if it was sent with 'Content-Encoding: gzip'.
+    The decompressed body is subject to the same DATA_UPLOAD_MAX_MEMORY_SIZE limit as an
+    uncompressed one.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    try:
+        body = decompressor.decompress(request.body, max_size or 0)
+    except zlib.error:
+        raise ValueError("Request body is not valid gzip data")
 
-    return JsonResponse({
-        'ids_for_import': ids_for_import,
-        'mappings': mappings,
-        'objects': objects,
-    }, json_dumps_params={'indent': 2})
+    if max_size is not None and decompressor.unconsumed_tail:
+        raise RequestDataTooBig('Decompressed request body exceeded settings.DATA_UPLOAD_MAX_MEMORY_SIZE.')
+    if not decompressor.eof or decompressor.unused_data:
+        # truncated, or followed by data that is not part of the gzip stream
+        raise ValueError("Request body is not valid gzip data")
+    return body
 
 
 @csrf_exempt
 @require_POST
+@gzip_page
 def objects_for_export(request):
     """
     Accepts a POST request with a JSON payload structured as:
@@ -122,41 +223,31 @@ def objects_for_export(request):
             'model_label': [list of IDs],
         }
     and returns an API response with objects / mappings populated (but ids_for_import empty).
+    The payload may be gzip-compressed, in which case the digest is of the uncompressed payload.
     """
+    content_encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if content_encoding == 'gzip':
+        try:
+            body = decompress_request_body(request)
+        except ValueError as e:
+            return HttpResponse(str(e), status=status.HTTP_400_BAD_REQUEST)
+    elif content_encoding == 'identity':
+        body = request.body
+    else:
+        return HttpResponse(status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 
-    check_digest(request.body, request.GET.get('digest', ''))
+    check_digest(body, request.GET.get('digest', ''))
 
-    request_data = json.loads(request.body.decode('utf-8'))
+    request_data = json.loads(body.decode('utf-8'))
 
-    objects = []
-    object_references = set()
-    serialized_models = set()
     models_to_serialize = set()
 
     for model_path, ids in request_data.items():
         model = get_model_for_path(model_path)
         serializer = serializer_registry.get_model_serializer(model)
-
         models_to_serialize.update(serializer.get_objects_by_ids(ids))
-        while models_to_serialize:
-            instance = models_to_serialize.pop()
-            serializer = serializer_registry.get_model_serializer(type(instance))
-            objects.append(serializer.serialize(instance))
-            object_references.update(serializer.get_object_references(instance))
-            models_to_serialize.update(serializer.get_objects_to_serialize(instance).difference(serialized_models))
 
-    mappings = []
-    for model, pk in object_references:
-        uid = get_locator_for_model(model).get_uid_for_local_id(pk)
-        mappings.append(
-            [model._meta.label_lower, pk, uid]
-        )
-
-    return JsonResponse({
-        'ids_for_import': [],
-        'mappings': mappings,
-        'objects': objects,
-    }, json_dumps_params={'indent': 2})
+    return export_response(request, [], models_to_serialize)
 
 
 class UIDField(ReadOnlyField):
@@ -201,9 +292,14 @@ def chooser_api_proxy(request, source_name, path):
     message = request.GET.urlencode()
     digest = digest_for_source(source_name, message)
 
-    response = requests.get(f"{base_url}{path}?{message}&digest={digest}", headers={
-        'Accept': request.META['HTTP_ACCEPT'],
-    }, timeout=api_proxy_timeout_seconds)
+    # the chooser is interactive, so a failed request is reported straight away rather than being
+    # retried, which could keep the user waiting well past the timeout
+    try:
+        response = get_client_for_source(source_name, retries=0).get(f"{base_url}{path}?{message}&digest={digest}", headers={
+            'Accept': request.META['HTTP_ACCEPT'],
+        }, timeout=api_proxy_timeout_seconds)
+    except requests.RequestException as e:
+        return HttpResponse(f"Could not connect to source: {e}", status=status.HTTP_502_BAD_GATEWAY)
 
     return HttpResponse(response.content, status=response.status_code)
 
@@ -224,67 +320,63 @@ def choose_page(request):
     })
 
 
-def import_missing_object_data(source, importer: ImportPlanner):
-    base_url = settings.WAGTAILTRANSFER_SOURCES[source]['BASE_URL']
-    while importer.missing_object_data:
-        # convert missing_object_data from a set of (model_class, id) tuples
-        # into a dict of {model_class_label: [list_of_ids]}
-        missing_object_data_by_type = defaultdict(list)
-        for model_class, source_id in importer.missing_object_data:
-            missing_object_data_by_type[model_class].append(source_id)
-
-        request_data = json.dumps({
-            model_class._meta.label_lower: ids
-            for model_class, ids in missing_object_data_by_type.items()
-        })
-        digest = digest_for_source(source, request_data)
-
-        # request the missing object data and add to the import plan
-        response = requests.post(
-            f"{base_url}api/objects/", params={'digest': digest}, data=request_data
-        )
-        importer.add_json(response.content)
-    importer.run()
-    return importer
-
+def redirect_to_import_result(request, job):
+    """
+    Redirect to the content imported by a completed import job
+    """
+    if job.import_type == ImportJob.TYPE_MODEL:
+        messages.add_message(request, messages.SUCCESS, 'Snippet(s) successfully imported')
+        app_label, model_name = job.model.split('.')
+        return redirect('wagtailsnippets:list', app_label, model_name)
+    elif job.dest_page_id:
+        return redirect('wagtailadmin_explore', job.dest_page_id)
+    else:
+        return redirect('wagtailadmin_explore_root')
 
-def import_page(request):
-    source = request.POST['source']
-    base_url = settings.WAGTAILTRANSFER_SOURCES[source]['BASE_URL']
-    digest = digest_for_source(source, str(request.POST['source_page_id']))
 
-    response = requests.get(f"{base_url}api/pages/{request.POST['source_page_id']}/", params={'digest': digest})
+def start_import_job(request, job):
+    """
+    Submit the given newly created ImportJob to be run, and redirect to the page showing its
+    progress - or straight to its result, if the executor ran it immediately
+    """
+    get_import_job_executor().submit(job)
 
-    dest_page_id = request.POST['dest_page_id'] or None
-    importer = ImportPlanner.for_page(source=request.POST['source_page_id'], destination=dest_page_id)
-    importer.add_json(response.content)
-    importer = import_missing_object_data(source, importer)
+    job.refresh_from_db()
+    if job.status == ImportJob.STATUS_DONE and not job.dry_run:
+        return redirect_to_import_result(request, job)
+    return redirect('wagtail_transfer_admin:import_job', job.pk)
 
-    if dest_page_id:
-        return redirect('wagtailadmin_explore', dest_page_id)
-    else:
-        return redirect('wagtailadmin_explore_root')
 
+def is_dry_run(request):
+    """
+    Whether the posted import form asks for a dry run. Only an explicitly true value counts, so
+    that values such as 'false' or '0' run the import for real
+    """
+    return request.POST.get('dry_run', '').lower() in ('1', 'true', 'on')
 
-def import_model(request):
-    source = request.POST['source']
-    model = request.POST['source_model']
-    base_url = settings.WAGTAILTRANSFER_SOURCES[source]['BASE_URL']
-    digest = digest_for_source(source, model)
 
-    url = f"{base_url}api/models/{model}/"
-    if request.POST.get("source_model_object_id"):
-        source_model_object_id = request.POST.get("source_model_object_id")
-        url = f"{url}{source_model_object_id}/"
+def import_page(request):
+    job = ImportJob.objects.create(
+        source=request.POST['source'],
+        import_type=ImportJob.TYPE_PAGE,
+        source_page_id=request.POST['source_page_id'],
+        dest_page_id=request.POST['dest_page_id'] or None,
+        dry_run=is_dry_run(request),
+        created_by=request.user,
+    )
+    return start_import_job(request, job)
 
-    response = requests.get(url, params={'digest': digest})
-    importer = ImportPlanner.for_model(model=model)
-    importer.add_json(response.content)
-    importer = import_missing_object_data(source, importer)
 
-    messages.add_message(request, messages.SUCCESS, 'Snippet(s) successfully imported')
-    app_label, model_name = model.split('.')
-    return redirect('wagtailsnippets:list', app_label, model_name)
+def import_model(request):
+    job = ImportJob.objects.create(
+        source=request.POST['source'],
+        import_type=ImportJob.TYPE_MODEL,
+        model=request.POST['source_model'],
+        source_object_id=request.POST.get('source_model_object_id', ''),
+        dry_run=is_dry_run(request),
+        created_by=request.user,
+    )
+    return start_import_job(request, job)
 
 
 @permission_required(
@@ -299,6 +391,54 @@ def do_import(request):
         return import_model(request)
 
 
+@permission_required(
+    "wagtail_transfer.wagtailtransfer_can_import", login_url="wagtailadmin_login"
+)
+def import_job(request, job_id):
+    """
+    Show the progress of an import job, or redirect to the imported content once it is done.
+    Dry runs are not redirected, and show their estimate once done.
+    """
+    fail_interrupted_jobs(ImportJob.objects.filter(id=job_id))
+    job = get_object_or_404(ImportJob, id=job_id)
+
+    if job.status == ImportJob.STATUS_DONE and not job.dry_run:
+        return redirect_to_import_result(request, job)
+
+    return render(request, 'wagtail_transfer/import_job.html', {
+        'job': job,
+        'estimate': job.get_estimate(),
+    })
+
+
+@permission_required(
+    "wagtail_transfer.wagtailtransfer_can_import", login_url="wagtailadmin_login"
+)
+@require_POST
+def resume_import_job(request, job_id):
+    """
+    Run a failed or interrupted import job again, resuming from its last committed batch if it was
+    committed in batches
+    """
+    fail_interrupted_jobs(ImportJob.objects.filter(id=job_id))
+    job = get_object_or_404(ImportJob, id=job_id)
+    if not job.requeue():
+        return redirect('wagtail_transfer_admin:import_job', job.pk)
+    return start_import_job(request, job)
+
+
+@permission_required(
+    "wagtail_transfer.wagtailtransfer_can_import", login_url="wagtailadmin_login"
+)
+def import_job_status(request, job_id):
+    """
+    Return the status and progress counters of an import job, for polling by the import job page
+    """
+    fail_interrupted_jobs(ImportJob.objects.filter(id=job_id))
+    job = get_object_or_404(ImportJob, id=job_id)
+    return JsonResponse(job.get_progress())
+
+
 def check_page_existence_for_uid(request):
     """
     Check whether a page with the specified UID exists - used for checking whether a page has already been imported